@@ -4,6 +4,8 @@ import os
 from flask import Blueprint, request, redirect, url_for, Response, session
 
 from core.models import SessionLocal, User, LicenseKey
+from pro.scheduler import EXPIRY
+from pro.entitlements import ENTITLEMENTS
 
 # ===== Blueprint cho trang /admin =====
 admin_bp = Blueprint("admin", __name__)
@@ -295,6 +297,8 @@ def extend_user():
             u.pro_expires_at = u.pro_expires_at + timedelta(days=days)
         u.is_pro = True
         db.commit()
+        EXPIRY.schedule("user", u.id, u.pro_expires_at)
+        ENTITLEMENTS.invalidate(u.id)
         return redirect(url_for("admin.users"))
     finally:
         db.close()
@@ -312,6 +316,8 @@ def set_free():
             u.is_pro = False
             u.pro_expires_at = None
             db.commit()
+            EXPIRY.cancel("user", u.id)
+            ENTITLEMENTS.invalidate(u.id)
         return redirect(url_for("admin.users"))
     finally:
         db.close()
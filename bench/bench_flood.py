@@ -0,0 +1,55 @@
+# bench/bench_flood.py
+"""
+Bộ nhớ của bộ đếm flood với 1.000.000 user giả lập (mỗi user 1 tin).
+
+So sánh dict[(chat_id, user_id)] -> list[float] cũ với FloodLimiter.
+Chạy: python bench/bench_flood.py [số_user]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.flood import FloodLimiter  # noqa: E402
+
+CHAT_ID = -1001234567890
+
+
+def old_tracker(n: int):
+    flood: dict[tuple[int, int], list[float]] = {}
+    now_ts = time.time()
+    for uid in range(n):
+        key = (CHAT_ID, 5_000_000_000 + uid)
+        bucket = [t for t in flood.get(key, []) if now_ts - t < 10]
+        bucket.append(now_ts)
+        flood[key] = bucket
+    return flood
+
+
+def new_tracker(n: int, max_keys: int):
+    lim = FloodLimiter(max_keys=max_keys)
+    for uid in range(n):
+        lim.hit(CHAT_ID, 5_000_000_000 + uid, 3)
+    return lim
+
+
+def measure(label: str, fn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    obj = fn(*args)
+    dt = time.perf_counter() - t0
+    cur, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<34} {cur / 2**20:8.1f} MiB (peak {peak / 2**20:8.1f} MiB)  {dt:6.2f}s")
+    return obj
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"{n:,} user, mỗi user 1 tin")
+    measure("dict[(chat,user)] -> list (cũ)", old_tracker, n)
+    lim = measure("FloodLimiter (không trần)", new_tracker, n, n + 1)
+    lim = measure("FloodLimiter (max_keys=200k)", new_tracker, n, 200_000)
+    print("stats:", lim.stats())
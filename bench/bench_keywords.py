@@ -0,0 +1,54 @@
+# bench/bench_keywords.py
+"""
+So sánh KeywordMatcher (Aho-Corasick) với vòng lặp cũ của guard
+(`pattern.lower() in low` cho từng Filter) ở 10 / 100 / 1.000 / 10.000 từ khoá.
+
+Chạy: python bench/bench_keywords.py
+"""
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.keywords import KeywordMatcher  # noqa: E402
+
+random.seed(42)
+
+MESSAGES = [
+    "Chào cả nhà, hôm nay nhóm mình có buổi họp lúc 8h tối nhé!",
+    "Anyone knows how to fix the login error on the mobile app? It keeps crashing.",
+    "Mình vừa cập nhật bản mới, thấy nhanh hơn hẳn. Cảm ơn admin nhiều 🙏",
+    "Check the pinned message before asking, the FAQ covers most of the setup steps.",
+    "Ai có tài liệu ôn thi cuối kỳ môn cấu trúc dữ liệu không, cho mình xin với",
+] * 20
+
+
+def _word(n: int) -> str:
+    return "".join(random.choice(string.ascii_lowercase) for _ in range(n))
+
+
+def old_loop(filters, low):
+    for fid, pattern in filters:
+        if pattern and pattern.lower() in low:
+            return fid
+    return None
+
+
+def bench(n: int, rounds: int = 5):
+    filters = [(i, _word(random.randint(5, 12))) for i in range(n)]
+    matcher = KeywordMatcher(filters)
+    lows = [m.lower() for m in MESSAGES]
+
+    t_old = min(timeit.repeat(lambda: [old_loop(filters, low) for low in lows], number=1, repeat=rounds))
+    t_new = min(timeit.repeat(lambda: [matcher.search(low) for low in lows], number=1, repeat=rounds))
+    per_old = t_old / len(lows) * 1e6
+    per_new = t_new / len(lows) * 1e6
+    print(f"{n:>6} patterns | loop {per_old:9.2f} µs/msg | aho-corasick {per_new:9.2f} µs/msg | x{per_old / per_new:6.1f}")
+
+
+if __name__ == "__main__":
+    for n in (10, 100, 1_000, 10_000):
+        bench(n)
@@ -0,0 +1,85 @@
+# bench/bench_tokenizer.py
+"""
+So sánh scan_text (1 lượt quét) với chuỗi regex cũ của guard:
+LINK_RE.search → extract_hosts (URL_RE + DOMAIN_RE) → URL_RE.sub + MENTION_RE.
+
+Chạy: python bench/bench_tokenizer.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.domains import to_host  # noqa: E402
+from core.tokenizer import scan_text  # noqa: E402
+
+# ---- pipeline cũ (chép nguyên từ main.py trước khi đổi) ----
+LINK_RE = re.compile(
+    r"(https?://[^\s<>()]+|www\.[^\s<>()]+|t\.me/[^\s<>()]+|@\w+|[a-zA-Z0-9-]+\.(com|net|org|vn|xyz|info|io|co|biz|me|app|site|top|store|ru|cn|uk|us)(/[^\s<>()]+)?)",
+    re.IGNORECASE
+)
+URL_RE = re.compile(r"(https?://[^\s<>()]+|www\.[^\s<>()]+|t\.me/[^\s<>()]+)", re.IGNORECASE)
+DOMAIN_RE = re.compile(r"\b([a-z0-9][a-z0-9\-\.]+\.[a-z]{2,})\b", re.IGNORECASE)
+MENTION_RE = re.compile(r"(?<!\w)@\w+", re.IGNORECASE)
+
+
+def extract_hosts(text):
+    text = (text or "").strip()
+    hosts = [to_host(u) for u in URL_RE.findall(text)] + [to_host(d) for d in DOMAIN_RE.findall(text)]
+    out, seen = [], set()
+    for h in hosts:
+        if h and h not in seen:
+            out.append(h); seen.add(h)
+    return out
+
+
+def old_pipeline(text):
+    has_link = bool(LINK_RE.search(text))
+    hosts = extract_hosts(text) if has_link else []
+    mention = bool(MENTION_RE.search(URL_RE.sub("", text)))
+    return has_link, hosts, mention
+
+
+def new_pipeline(text):
+    s = scan_text(text)
+    return s.has_link, s.hosts, bool(s.mentions)
+
+
+CORPUS = [
+    "Chào cả nhà, tối nay 8h họp online nhé mọi người",
+    "Mọi người ơi cho mình hỏi app bị lỗi đăng nhập thì xử lý sao ạ?",
+    "ok bạn",
+    "Cảm ơn admin nhiều, bot chạy ngon lành rồi 👍",
+    "Ai cần tài liệu thì inbox mình, hoặc xem ở https://drive.google.com/drive/folders/abc123 nhé",
+    "Đăng ký nhận quà miễn phí tại shopee-sale.xyz/claim?ref=88 nhanh tay!!!",
+    "Join kênh t.me/kiemtienonline_vip để nhận tín hiệu mỗi ngày @admin_vip",
+    "Has anyone tried the new release? The changelog is at github.com/org/repo/releases",
+    "Good morning everyone! Please read the rules before posting.",
+    "I think the bug is in the payment module, can @dev_lead take a look?",
+    "Giá hôm nay 1.250.000đ, còn 3 suất, liên hệ sđt 0909.123.456",
+    "Version 2.4.1 is out, update via the settings menu.",
+    "Mình gửi file báo cáo ở đây: www.example.vn/bao-cao-thang-10.pdf",
+    "lol 😂😂😂",
+    "Nhắn cho mình qua email hotro@congty.com.vn nha",
+    "Hôm qua mình đi cafe với team, vui lắm. Cuối tuần này ai rảnh đi đá bóng không? "
+    "Sân ở quận 7, 5h chiều, mỗi người góp 50k. Ai tham gia thì reply nhé, mình chốt danh sách tối nay.",
+]
+
+
+def run(rounds: int = 7, loops: int = 200):
+    for text in CORPUS:
+        (ol, oh, om), (nl, nh, nm) = old_pipeline(text), new_pipeline(text)
+        # DOMAIN_RE cũ còn nhặt cả mảnh path trong URL ("bao-cao.pdf") → chỉ yêu cầu tập con
+        assert ol == nl and om == nm and set(nh) <= set(oh), text
+    t_old = min(timeit.repeat(lambda: [old_pipeline(t) for t in CORPUS], number=loops, repeat=rounds))
+    t_new = min(timeit.repeat(lambda: [new_pipeline(t) for t in CORPUS], number=loops, repeat=rounds))
+    n = loops * len(CORPUS)
+    print(f"{len(CORPUS)} tin mẫu, {n} lượt/round")
+    print(f"  regex cũ : {t_old / n * 1e6:7.2f} µs/tin")
+    print(f"  scan_text: {t_new / n * 1e6:7.2f} µs/tin  (x{t_old / t_new:.2f})")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,133 @@
+# bench/explain_indexes.py
+"""
+Kiểm tra bằng EXPLAIN rằng các query nóng đều đi theo index (schema v2).
+
+Gọi đúng các hàm mà handler dùng (joins._blacklisted, VIOLATIONS.warning_count,
+captcha._remove, main._warn_top, violations_summary…), bắt câu SQL thực sự
+được gửi xuống DB rồi chạy lại với tiền tố EXPLAIN:
+  - SQLite  : EXPLAIN QUERY PLAN — không được có "SCAN <bảng>" (quét toàn bảng),
+              ORDER BY theo cột không được cần "TEMP B-TREE FOR ORDER BY"
+              (ORDER BY count(...) sau GROUP BY thì index không giúp được);
+  - Postgres: EXPLAIN với enable_seqscan = off — không được có "Seq Scan"/"Sort".
+Thoát với mã 1 nếu có query không đạt. tests/test_schema.py chạy cùng các
+kiểm tra này trong pytest.
+
+Chạy:
+    python bench/explain_indexes.py                      # SQLite tạm
+    DATABASE_URL=postgresql://… python bench/explain_indexes.py
+"""
+import os
+import re
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='explain-'), 'explain.db')}"
+os.environ.setdefault("OWNER_ID", "0")
+
+import main  # noqa: E402  (main tự nạp lại core.models → phải import trước các module core)
+from sqlalchemy import event  # noqa: E402
+
+from core.captcha import _remove  # noqa: E402
+from core.joins import _blacklisted  # noqa: E402
+from core.models import (  # noqa: E402
+    SessionLocal, Whitelist, ViolationLog, engine, init_db, month_range, violations_summary,
+)
+from core.violations import VIOLATIONS  # noqa: E402
+
+CHAT, USER = -1001234567890, 5_000_000_000
+_ORDER_BY_COLUMN = re.compile(r"ORDER BY (?!count\()", re.I)
+
+
+def _capture(fn, *args) -> list[tuple[str, object]]:
+    """Chạy fn và trả về các (SQL, tham số) đã gửi xuống DB."""
+    seen = []
+
+    def _hook(conn, cursor, statement, parameters, context, executemany):
+        seen.append((statement, parameters))
+    event.listen(engine, "before_cursor_execute", _hook)
+    try:
+        fn(*args)
+    finally:
+        event.remove(engine, "before_cursor_execute", _hook)
+    return seen
+
+
+def _whitelist_row(db):
+    # wl_add / wl_del
+    return db.query(Whitelist).filter_by(chat_id=CHAT, domain="example.com").one_or_none()
+
+
+def _log_export(db):
+    # log_export (pro/handlers.py)
+    s, e = month_range(2026, 1)
+    return (db.query(ViolationLog)
+            .filter(ViolationLog.chat_id == CHAT, ViolationLog.created_at >= s, ViolationLog.created_at < e)
+            .order_by(ViolationLog.created_at.asc()).all())
+
+
+def _checks(db) -> list[tuple[str, object, tuple]]:
+    """(tên, hàm, tham số) — mỗi câu SELECT/DELETE mà hàm phát ra đều phải đi theo index."""
+    return [
+        ("on_join blacklist", _blacklisted, (db, CHAT, [USER, USER + 1])),
+        ("warn_info", VIOLATIONS.warning_count, (CHAT, USER + 2)),
+        ("wl_add / wl_del", _whitelist_row, (db,)),
+        ("captcha resolve", _remove, (db, [(CHAT, USER)])),
+        ("warn_top", main._warn_top, (db, CHAT)),
+        ("violations_summary", violations_summary, (db, CHAT, 2026, 1)),
+        ("log_export", _log_export, (db,)),
+    ]
+
+
+def _plan(sql: str, params) -> list[str]:
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params).all()
+            return [r[-1] for r in rows]
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        rows = conn.exec_driver_sql("EXPLAIN " + sql, params).all()
+        conn.rollback()
+        return [r[0] for r in rows]
+
+
+def _problems(sql: str, plan: list[str]) -> list[str]:
+    bad = []
+    ordered = bool(_ORDER_BY_COLUMN.search(sql))
+    for line in plan:
+        if engine.dialect.name == "sqlite":
+            if line.startswith("SCAN ") and "INDEX" not in line:
+                bad.append(line)
+            if ordered and "TEMP B-TREE FOR ORDER BY" in line:
+                bad.append(line)
+        else:
+            if "Seq Scan" in line or (ordered and line.lstrip().startswith("Sort")):
+                bad.append(line.strip())
+    return bad
+
+
+def main_() -> int:
+    init_db()
+    db = SessionLocal()
+    failed = 0
+    try:
+        for name, fn, args in _checks(db):
+            for sql, params in _capture(fn, *args):
+                if not sql.lstrip().upper().startswith(("SELECT", "DELETE", "UPDATE")):
+                    continue
+                plan = _plan(sql, params)
+                bad = _problems(sql, plan)
+                failed += bool(bad)
+                print(f"{'FAIL' if bad else 'ok  '} {name}: {' | '.join(plan)}")
+                for line in bad:
+                    print(f"       ↳ {line}")
+    finally:
+        db.close()
+    print(f"\n{engine.dialect.name}: {'tất cả query đều dùng index' if not failed else f'{failed} query không dùng index'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
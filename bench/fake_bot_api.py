@@ -0,0 +1,111 @@
+# bench/fake_bot_api.py
+"""
+Bot API giả lập chạy local cho bench/loadtest.py.
+
+HTTP/1.1 keep-alive tối giản trên asyncio (không thêm dependency). Nhận
+POST /bot<token>/<method> (form-urlencoded như HTTPXRequest của PTB gửi),
+đếm số lần gọi theo method và trả về kết quả hợp lệ tối thiểu.
+
+- `latency`: trễ giả lập (giây) cho mỗi request.
+- `rate_429`: tỉ lệ request bị trả 429 Too Many Requests (retry_after = 1).
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from urllib.parse import parse_qsl
+
+BOT_ID = 999_000_000
+BOT_USER = {"id": BOT_ID, "is_bot": True, "first_name": "LoadBot", "username": "loadtest_bot"}
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, rate_429: float = 0.0, admins=(1,), seed: int = 1):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.admins = tuple(admins)
+        self.calls: Counter = Counter()
+        self.throttled: Counter = Counter()
+        self._rng = random.Random(seed)
+        self._mid = itertools.count(10_000_000)
+        self._server = None
+
+    # ----- server -----
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = await asyncio.start_server(self._conn, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}/bot"
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _conn(self, reader, writer) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                _verb, path, _ver = line.decode("latin-1").split(" ", 2)
+                length = 0
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = h.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value.strip())
+                body = await reader.readexactly(length) if length else b""
+                status, payload = await self._handle(path, body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    # ----- Bot API -----
+    async def _handle(self, path: str, body: bytes):
+        method = path.rsplit("/", 1)[-1]
+        params = dict(parse_qsl(body.decode("utf-8"))) if body else {}
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.rate_429 and self._rng.random() < self.rate_429:
+            self.throttled[method] += 1
+            return 429, {"ok": False, "error_code": 429,
+                         "description": "Too Many Requests: retry after 1",
+                         "parameters": {"retry_after": 1}}
+        return 200, {"ok": True, "result": self._result(method, params)}
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return dict(BOT_USER, can_join_groups=True, can_read_all_group_messages=True,
+                        supports_inline_queries=False)
+        if method == "sendMessage":
+            chat_id = int(params.get("chat_id", 0))
+            return {
+                "message_id": next(self._mid), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "supergroup", "title": "load"},
+                "from": BOT_USER, "text": params.get("text", ""),
+            }
+        if method == "getChatAdministrators":
+            return [{"status": "administrator", "user": {"id": uid, "is_bot": False, "first_name": "admin"},
+                     "can_be_edited": False, "is_anonymous": False, "can_manage_chat": True,
+                     "can_delete_messages": True, "can_manage_video_chats": True,
+                     "can_restrict_members": True, "can_promote_members": True,
+                     "can_change_info": True, "can_invite_users": True,
+                     "can_post_stories": True, "can_edit_stories": True, "can_delete_stories": True}
+                    for uid in self.admins]
+        if method == "getChatMember":
+            uid = int(params.get("user_id", 0))
+            return {"status": "member", "user": {"id": uid, "is_bot": False, "first_name": "u"}}
+        return True
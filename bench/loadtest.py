@@ -0,0 +1,237 @@
+# bench/loadtest.py
+"""
+Load test toàn bộ Application (guard, on_join, _promo_tick_job) với
+Bot API giả lập (bench/fake_bot_api.py) — không cần token thật, không gọi Telegram.
+
+Sinh traffic nhóm tổng hợp (text, link, mention, forward, media, join), đẩy
+thẳng vào update_queue của Application thật rồi đo thời gian từ lúc đưa vào
+hàng đợi tới khi mọi handler xử lý xong update đó.
+
+Chạy:
+    python bench/loadtest.py --updates 20000 --chats 200 --latency-ms 30 --rate-429 0.01
+    python bench/loadtest.py --rate 500          # giữ nhịp 500 update/s thay vì bắn dồn
+
+In ra throughput, p50/p95/p99 theo loại update, số lần gọi từng method Bot API,
+số tin gửi được và thời gian của 1 lượt _promo_tick_job.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+_TMP = tempfile.mkdtemp(prefix="loadtest-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP, 'load.db')}"
+os.environ.setdefault("OWNER_ID", "0")
+
+import main  # noqa: E402  (main tự nạp lại core.models → phải import trước các module core)
+from telegram import Update  # noqa: E402
+from telegram.ext import TypeHandler  # noqa: E402
+
+from core.models import SessionLocal, Setting, PromoSetting, init_db, now_utc  # noqa: E402
+from core.dispatch import UPDATE_PROCESSOR  # noqa: E402
+from core.violations import VIOLATIONS  # noqa: E402
+from core.joins import JOIN_STAGES  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from pro.scheduler import _promo_tick_job, PROMO_STATS  # noqa: E402
+
+TOKEN = "123456:LOADTEST"
+ADMIN_ID = 1
+DEFAULT_MIX = "text=50,link=15,mention=10,forward=10,media=10,join=5"
+
+
+# ===== sinh update =====
+class TrafficGen:
+    def __init__(self, chats: int, users: int, mix: dict[str, int], seed: int = 7):
+        self.rng = random.Random(seed)
+        self.chats = [-1_001_000_000_000 - i for i in range(chats)]
+        self.users = users
+        self.kinds, self.weights = zip(*mix.items())
+        self._uid = 0
+        self._mid = 0
+
+    def _user(self, uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": f"user{uid}"}
+
+    def next(self) -> tuple[str, dict]:
+        rng = self.rng
+        kind = rng.choices(self.kinds, self.weights)[0]
+        self._uid += 1
+        self._mid += 1
+        chat_id = rng.choice(self.chats)
+        uid = 10_000 + rng.randrange(self.users)
+        msg = {
+            "message_id": self._mid, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": f"g{chat_id}"},
+            "from": self._user(uid),
+        }
+        if kind == "text":
+            msg["text"] = rng.choice([
+                "chào mọi người, hôm nay thế nào?", "ok thanks", "mai họp lúc mấy giờ vậy",
+                "bot này chặn link tốt ghê", "có ai dùng bản mới chưa",
+            ])
+        elif kind == "link":
+            url = f"https://promo{rng.randrange(500)}.xyz/win?id={self._mid}"
+            text = f"vào đây nhận quà {url} nhanh"
+            msg["text"] = text
+            msg["entities"] = [{"type": "url", "offset": text.index(url), "length": len(url)}]
+        elif kind == "mention":
+            at = f"@channel{rng.randrange(500)}"
+            text = f"join {at} để nhận tín hiệu"
+            msg["text"] = text
+            msg["entities"] = [{"type": "mention", "offset": text.index(at), "length": len(at)}]
+        elif kind == "forward":
+            msg["text"] = "tin chuyển tiếp từ kênh khác"
+            msg["forward_origin"] = {"type": "user", "date": int(time.time()),
+                                     "sender_user": self._user(uid + 1)}
+        elif kind == "media":
+            msg["photo"] = [{"file_id": f"p{self._mid}", "file_unique_id": f"u{self._mid}",
+                             "width": 90, "height": 90}]
+            msg["caption"] = "ảnh nè"
+        else:  # join
+            msg["new_chat_members"] = [self._user(uid)]
+        return kind, {"update_id": self._uid, "message": msg}
+
+
+def parse_mix(s: str) -> dict[str, int]:
+    out = {}
+    for part in s.split(","):
+        k, _, v = part.partition("=")
+        out[k.strip()] = int(v)
+    return out
+
+
+def pct(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[k]
+
+
+# ===== chạy =====
+def seed_db(chats: list[int], promo_chats: int, antispam_every: int) -> None:
+    db = SessionLocal()
+    try:
+        for i, cid in enumerate(chats):
+            spam = bool(antispam_every and i % antispam_every == 0)
+            db.add(Setting(chat_id=cid, antilink=True, antimention=True, antiforward=True,
+                           flood_limit=5, flood_mode="mute", dupspam=spam,
+                           welcome_text="Chào {name} 👋", welcome_ttl=0))
+            if i < promo_chats:
+                db.add(PromoSetting(chat_id=cid, is_enabled=True, content="🔥 Quảng cáo thử",
+                                    interval_minutes=10, last_sent_at=None, next_send_at=now_utc()))
+            if spam:
+                main.ANTISPAM_CHATS.add(cid)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run(args) -> None:
+    api = FakeBotAPI(latency=args.latency_ms / 1000, rate_429=args.rate_429, admins=(ADMIN_ID,))
+    base_url = await api.start()
+    init_db()
+    gen = TrafficGen(args.chats, args.users, parse_mix(args.mix))
+    seed_db(gen.chats, args.promo_chats, args.antispam_every)
+
+    app = main.build_app(token=TOKEN, base_url=base_url)
+    sent_at: dict[int, tuple[str, float]] = {}
+    lat: dict[str, list[float]] = {}
+    done = asyncio.Event()
+    finished = 0
+
+    async def _done(update: Update, context) -> None:
+        nonlocal finished
+        kind, t0 = sent_at.pop(update.update_id, (None, 0.0))
+        if kind is None:
+            return
+        lat.setdefault(kind, []).append(time.perf_counter() - t0)
+        finished += 1
+        if finished >= args.updates:
+            done.set()
+
+    # group cao nhất → chạy sau khi mọi handler khác đã xử lý update
+    app.add_handler(TypeHandler(Update, _done), group=99)
+
+    await app.initialize()
+    app.bot_data["contact"] = "loadtest"
+    await app.start()
+
+    t_start = time.perf_counter()
+    gap = 1 / args.rate if args.rate else 0
+    for i in range(args.updates):
+        kind, data = gen.next()
+        upd = Update.de_json(data, app.bot)
+        sent_at[upd.update_id] = (kind, time.perf_counter())
+        await app.update_queue.put(upd)
+        if gap:
+            await asyncio.sleep(max(0.0, t_start + (i + 1) * gap - time.perf_counter()))
+        elif i % 500 == 0:
+            await asyncio.sleep(0)
+    try:
+        await asyncio.wait_for(done.wait(), timeout=args.timeout)
+    except asyncio.TimeoutError:
+        print(f"!! timeout: {len(sent_at)} update chưa xử lý xong")
+    elapsed = time.perf_counter() - t_start
+    peak = UPDATE_PROCESSOR.stats()
+
+    # 1 lượt quảng cáo: mọi nhóm promo đều đến hạn
+    calls_before = api.calls["sendMessage"]
+    await _promo_tick_job(types.SimpleNamespace(bot=app.bot, application=app))
+    promo_calls = api.calls["sendMessage"] - calls_before
+
+    await app.stop()
+    expiry = app.bot_data.get("expiry")
+    if expiry:
+        expiry.stop()
+    await app.shutdown()
+    await main.on_shutdown(app)
+    await api.stop()
+
+    # ----- báo cáo -----
+    total = sum(len(v) for v in lat.values())
+    print(f"\nupdates={args.updates} chats={args.chats} users={args.users} "
+          f"latency={args.latency_ms}ms rate_429={args.rate_429} "
+          f"max_concurrent={UPDATE_PROCESSOR.max_concurrent_updates}")
+    print(f"processed {total} in {elapsed:.2f}s → {total / elapsed:,.0f} update/s")
+    print(f"{'kind':<9}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = sorted(lat.items()) + [("ALL", [x for v in lat.values() for x in v])]
+    for kind, v in rows:
+        print(f"{kind:<9}{len(v):>7}{pct(v, 50) * 1000:>10.1f}{pct(v, 95) * 1000:>10.1f}{pct(v, 99) * 1000:>10.1f}")
+    print(f"dispatcher: peak_depth={peak['peak_depth']} queued={peak['queued']} errors={peak['errors']}")
+    print(f"violations: {VIOLATIONS.stats}")
+    stages = ", ".join(f"{k} {v['avg_ms']:.1f}/{v['max_ms']:.1f}" for k, v in JOIN_STAGES.stats().items())
+    print(f"join stages avg/max ms: {stages} | {JOIN_STAGES.counts}")
+    tick = PROMO_STATS["last_tick"] or {"sent": 0, "failed": 0, "retried": 0, "duration": 0.0}
+    print(f"promo_tick: {tick['sent']} sent, {tick['failed']} failed, {tick['retried']} retried "
+          f"({promo_calls} sendMessage) / {args.promo_chats} chats in {tick['duration'] * 1000:.0f} ms")
+    print("Bot API calls:", dict(api.calls.most_common()))
+    if api.throttled:
+        print("429 injected:", dict(api.throttled.most_common()))
+
+
+def cli() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--updates", type=int, default=5000)
+    p.add_argument("--chats", type=int, default=100)
+    p.add_argument("--users", type=int, default=5000)
+    p.add_argument("--mix", default=DEFAULT_MIX, help=f"trọng số loại update (mặc định {DEFAULT_MIX})")
+    p.add_argument("--rate", type=float, default=0, help="update/s; 0 = bắn dồn hết")
+    p.add_argument("--latency-ms", type=float, default=0, help="trễ mỗi request Bot API")
+    p.add_argument("--rate-429", type=float, default=0, help="tỉ lệ request bị trả 429")
+    p.add_argument("--promo-chats", type=int, default=50)
+    p.add_argument("--antispam-every", type=int, default=4, help="bật antispam + dupspam cho 1/N nhóm (0 = không)")
+    p.add_argument("--timeout", type=float, default=300)
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(cli()))
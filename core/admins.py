@@ -0,0 +1,122 @@
+# core/admins.py
+"""
+Cache quyền admin theo (chat, user) để không phải gọi get_chat_member mỗi tin.
+
+- Lần đầu gặp 1 nhóm: lấy cả danh sách bằng get_chat_administrators (1 request),
+  user không nằm trong danh sách coi như member thường.
+- Nếu không lấy được danh sách (bot chưa có quyền…): rơi về get_chat_member
+  và cache riêng từng (chat, user).
+- ChatMemberHandler (xem `on_chat_member_update`) cập nhật ngay khi có
+  promote / demote, TTL chỉ là lưới an toàn.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+ADMIN_CACHE_TTL = float(os.getenv("ADMIN_CACHE_TTL", "600"))  # giây
+ADMIN_CACHE_CHATS = int(os.getenv("ADMIN_CACHE_CHATS", "5000"))
+
+ADMIN_STATUSES = ("administrator", "creator")
+
+
+class AdminCache:
+    def __init__(self, ttl: float = ADMIN_CACHE_TTL, max_chats: int = ADMIN_CACHE_CHATS):
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[int, tuple[float, set[int]]]" = OrderedDict()
+        self._members: dict[tuple[int, int], tuple[float, bool]] = {}
+        self._inflight: dict[int, asyncio.Future] = {}
+        self._no_list: dict[int, float] = {}   # chat không đọc được danh sách admin → tạm bỏ qua warm
+        self.stats = {"hits": 0, "warms": 0, "member_calls": 0}
+
+    # ----- đọc -----
+    async def is_admin(self, bot, chat_id: int, user_id: int) -> bool:
+        """Lỗi mạng ở cả 2 đường thì ném exception như get_chat_member cũ."""
+        now = time.monotonic()
+        entry = self._chats.get(chat_id)
+        if entry and entry[0] > now:
+            self.stats["hits"] += 1
+            self._chats.move_to_end(chat_id)    # LRU: nhóm hay dùng không bị đẩy ra trước
+            return user_id in entry[1]
+
+        one = self._members.get((chat_id, user_id))
+        if one and one[0] > now:
+            self.stats["hits"] += 1
+            return one[1]
+
+        if self._no_list.get(chat_id, 0) <= now and await self.warm(bot, chat_id):
+            entry = self._chats.get(chat_id)
+            if entry:
+                return user_id in entry[1]
+
+        self.stats["member_calls"] += 1
+        m = await bot.get_chat_member(chat_id, user_id)
+        ok = m.status in ADMIN_STATUSES
+        now = time.monotonic()
+        if len(self._members) > self.max_chats * 10:
+            self._members = {k: v for k, v in self._members.items() if v[0] > now}
+        self._members[(chat_id, user_id)] = (now + self.ttl, ok)
+        return ok
+
+    async def warm(self, bot, chat_id: int) -> bool:
+        """Nạp toàn bộ admin của nhóm; các coroutine gọi cùng lúc dùng chung 1 request."""
+        fut = self._inflight.get(chat_id)
+        if fut is None:
+            fut = asyncio.ensure_future(self._fetch(bot, chat_id))
+            self._inflight[chat_id] = fut
+            fut.add_done_callback(lambda _f: self._inflight.pop(chat_id, None))
+        return await asyncio.shield(fut)
+
+    async def _fetch(self, bot, chat_id: int) -> bool:
+        try:
+            admins = await bot.get_chat_administrators(chat_id)
+        except Exception:
+            self._no_list[chat_id] = time.monotonic() + self.ttl
+            return False
+        self._no_list.pop(chat_id, None)
+        self.stats["warms"] += 1
+        ids = {m.user.id for m in admins if m.status in ADMIN_STATUSES}
+        self._chats[chat_id] = (time.monotonic() + self.ttl, ids)
+        self._chats.move_to_end(chat_id)
+        while len(self._chats) > self.max_chats:
+            old, _ = self._chats.popitem(last=False)
+            self._drop_members(old)
+        return True
+
+    # ----- ghi / huỷ -----
+    def set_status(self, chat_id: int, user_id: int, status: str) -> None:
+        ok = status in ADMIN_STATUSES
+        entry = self._chats.get(chat_id)
+        if entry:
+            (entry[1].add if ok else entry[1].discard)(user_id)
+        self._members[(chat_id, user_id)] = (time.monotonic() + self.ttl, ok)
+
+    def invalidate(self, chat_id: int) -> None:
+        self._chats.pop(chat_id, None)
+        self._no_list.pop(chat_id, None)
+        self._drop_members(chat_id)
+
+    def _drop_members(self, chat_id: int) -> None:
+        for key in [k for k in self._members if k[0] == chat_id]:
+            del self._members[key]
+
+
+ADMINS = AdminCache()
+
+
+async def is_admin(bot, chat_id: int, user_id: int) -> bool:
+    return await ADMINS.is_admin(bot, chat_id, user_id)
+
+
+async def on_chat_member_update(update, context) -> None:
+    """Handler cho ChatMemberHandler: cập nhật cache khi có promote/demote/rời nhóm."""
+    cmu = update.chat_member or update.my_chat_member
+    if not cmu:
+        return
+    chat_id = cmu.chat.id
+    if update.my_chat_member:
+        # quyền của chính bot đổi → danh sách admin có thể đọc được/không nữa
+        ADMINS.invalidate(chat_id)
+        return
+    ADMINS.set_status(chat_id, cmu.new_chat_member.user.id, cmu.new_chat_member.status)
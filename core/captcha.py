@@ -0,0 +1,280 @@
+# core/captcha.py
+"""
+Captcha khi vào nhóm (bật bằng /captcha_on).
+
+- Người mới bị restrict ngay, được ghi vào bảng `captcha` (sống qua restart)
+  và vào index RAM `(chat_id, user_id) -> (hạn, lô)` + heap hạn chót.
+- Giống JoinBatcher, người vào trong CAPTCHA_WINDOW giây dùng chung 1 tin
+  thử thách (1 phép cộng, 4 nút) → đợt raid hàng nghìn người không thành
+  hàng nghìn tin nhắn.
+- Bấm đúng → trả lại quyền mặc định của nhóm + chào; bấm sai được thử lại,
+  sai quá CAPTCHA_MAX_TRIES lần → kick. `captcha_tick_job` (mỗi CAPTCHA_TICK
+  giây) là worker duy nhất lấy các hạn đã qua khỏi heap và kick — không có
+  coroutine nào ngủ chờ từng người.
+- Lượt tick đầu tiên sau khi khởi động nạp lại các thử thách còn dở từ bảng.
+"""
+import asyncio
+import heapq
+import os
+import random
+from datetime import timedelta
+
+from sqlalchemy import delete, update
+from telegram import ChatPermissions, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import MessageLimit, ParseMode
+
+from core.db import run_db
+from core.deletions import DELETIONS
+from core.models import Captcha, now_utc
+from core.welcome import JOINS
+
+CAPTCHA_TIMEOUT = float(os.getenv("CAPTCHA_TIMEOUT", "120"))   # giây để bấm đúng
+CAPTCHA_WINDOW = float(os.getenv("CAPTCHA_WINDOW", "3"))       # giây gom người mới vào 1 tin thử thách
+CAPTCHA_TICK = float(os.getenv("CAPTCHA_TICK", "5"))
+CAPTCHA_MAX_TRIES = int(os.getenv("CAPTCHA_MAX_TRIES", "3"))    # số lần bấm sai tối đa trước khi bị kick
+_KICK_CONCURRENCY = 8
+
+
+class _Batch:
+    """1 tin thử thách dùng chung cho những người vào cùng cửa sổ."""
+
+    __slots__ = ("chat_id", "a", "b", "users", "message_ids", "left")
+
+    def __init__(self, chat_id: int, a: int, b: int):
+        self.chat_id = chat_id
+        self.a, self.b = a, b
+        self.users: list[tuple[int, str]] = []   # (user_id, mention) chờ gửi thử thách
+        self.message_ids: list[int] = []
+        self.left = 0                              # số người của lô chưa xong
+
+    @property
+    def answer(self) -> str:
+        return str(self.a + self.b)
+
+    def keyboard(self) -> InlineKeyboardMarkup:
+        ans = self.a + self.b
+        opts = {ans}
+        while len(opts) < 4:
+            opts.add(max(0, ans + random.randint(-5, 5)))
+        opts = sorted(opts)
+        return InlineKeyboardMarkup([[InlineKeyboardButton(str(o), callback_data=f"cap:{o}") for o in opts]])
+
+
+# ----- DB (chạy trên thread pool) -----
+def _insert(db, chat_id: int, user_ids: list[int], answer: str, now) -> None:
+    db.execute(delete(Captcha).where(Captcha.chat_id == chat_id, Captcha.user_id.in_(user_ids)),
+               execution_options={"synchronize_session": False})
+    db.add_all(Captcha(chat_id=chat_id, user_id=uid, answer=answer, created_at=now) for uid in user_ids)
+    db.commit()
+
+
+def _set_message(db, chat_id: int, user_ids: list[int], message_id: int) -> None:
+    db.execute(update(Captcha).where(Captcha.chat_id == chat_id, Captcha.user_id.in_(user_ids))
+               .values(message_id=message_id), execution_options={"synchronize_session": False})
+    db.commit()
+
+
+def _remove(db, keys: list[tuple[int, int]]) -> None:
+    by_chat: dict[int, list[int]] = {}
+    for chat_id, uid in keys:
+        by_chat.setdefault(chat_id, []).append(uid)
+    for chat_id, uids in by_chat.items():
+        db.execute(delete(Captcha).where(Captcha.chat_id == chat_id, Captcha.user_id.in_(uids)),
+                   execution_options={"synchronize_session": False})
+    db.commit()
+
+
+def _load_rows(db) -> list[tuple]:
+    return [tuple(r) for r in db.query(
+        Captcha.chat_id, Captcha.user_id, Captcha.answer, Captcha.created_at, Captcha.message_id
+    ).all()]
+
+
+class CaptchaEngine:
+    def __init__(self, timeout: float = CAPTCHA_TIMEOUT, window: float = CAPTCHA_WINDOW):
+        self.timeout = timeout
+        self.window = window
+        self._pending: dict[tuple[int, int], tuple] = {}   # (chat, user) -> (hạn, lô)
+        self._heap: list[tuple] = []                       # (hạn, chat, user), xoá lười
+        self._open: dict[int, _Batch] = {}                 # lô đang gom của từng nhóm
+        self._misses: dict[tuple[int, int], int] = {}      # (chat, user) -> số lần bấm sai
+        self._loaded = False
+        self.stats = {"challenged": 0, "passed": 0, "failed": 0, "timeouts": 0}
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _track(self, chat_id: int, uid: int, deadline, batch: _Batch) -> None:
+        old = self._pending.get((chat_id, uid))
+        if old:
+            old[1].left -= 1
+        self._misses.pop((chat_id, uid), None)          # vào lại → thử thách mới, đếm lại
+        self._pending[(chat_id, uid)] = (deadline, batch)
+        batch.left += 1
+        heapq.heappush(self._heap, (deadline, chat_id, uid))
+
+    async def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        batches: dict[tuple, _Batch] = {}
+        for chat_id, uid, answer, created_at, message_id in await run_db(_load_rows):
+            if (chat_id, uid) in self._pending:
+                continue
+            b = batches.get((chat_id, message_id))
+            if b is None:
+                b = batches[(chat_id, message_id)] = _Batch(chat_id, int(answer or 0), 0)
+                if message_id:
+                    b.message_ids.append(message_id)
+            self._track(chat_id, uid, (created_at or now_utc()) + timedelta(seconds=self.timeout), b)
+
+    # ----- vào nhóm -----
+    async def add(self, app, chat_id: int, members) -> None:
+        await self._ensure_loaded()
+        batch = self._open.get(chat_id)
+        new = batch is None
+        if new:
+            batch = self._open[chat_id] = _Batch(chat_id, random.randint(1, 9), random.randint(1, 9))
+        now = now_utc()
+        deadline = now + timedelta(seconds=self.timeout)
+        for m in members:
+            self._track(chat_id, m.id, deadline, batch)
+            batch.users.append((m.id, m.mention_html()))
+        self.stats["challenged"] += len(members)
+        await run_db(_insert, chat_id, [m.id for m in members], batch.answer, now)
+        for m in members:
+            try:
+                await app.bot.restrict_chat_member(chat_id, m.id, ChatPermissions(can_send_messages=False))
+            except Exception as e:
+                print("Captcha restrict failed:", e)
+        if new:
+            app.create_task(self._send_later(app.bot, batch))
+
+    async def _send_later(self, bot, batch: _Batch) -> None:
+        if self.window > 0:
+            await asyncio.sleep(self.window)
+        if self._open.get(batch.chat_id) is batch:
+            del self._open[batch.chat_id]
+        header = (f"\n🛡 Bấm đáp án đúng trong {int(self.timeout)} giây để được nhắn tin: "
+                  f"<b>{batch.a} + {batch.b} = ?</b>")
+        chunks, cur, size = [], [], len(header)
+        for uid, mention in batch.users:
+            if cur and size + len(mention) + 2 > MessageLimit.MAX_TEXT_LENGTH:
+                chunks.append(cur)
+                cur, size = [], len(header)
+            cur.append((uid, mention))
+            size += len(mention) + 2
+        if cur:
+            chunks.append(cur)
+        for chunk in chunks:
+            # người đã bị kick/đã xong trước khi tin được gửi thì bỏ qua
+            chunk = [(uid, m) for uid, m in chunk if self._pending.get((batch.chat_id, uid), (0, None))[1] is batch]
+            if not chunk:
+                continue
+            try:
+                sent = await bot.send_message(
+                    batch.chat_id, ", ".join(m for _, m in chunk) + header,
+                    parse_mode=ParseMode.HTML, reply_markup=batch.keyboard(),
+                )
+            except Exception as e:
+                print("Captcha send failed:", e)
+                continue
+            batch.message_ids.append(sent.message_id)
+            await run_db(_set_message, batch.chat_id, [uid for uid, _ in chunk], sent.message_id)
+        batch.users = []
+        if batch.left <= 0:
+            await self._cleanup(batch)
+
+    async def _cleanup(self, batch: _Batch) -> None:
+        if batch.message_ids:
+            await DELETIONS.schedule(batch.chat_id, batch.message_ids, 0)
+            batch.message_ids = []
+
+    async def _resolve(self, keys: list[tuple[int, int]]) -> None:
+        done = []
+        for key in keys:
+            entry = self._pending.pop(key, None)
+            self._misses.pop(key, None)
+            if entry is None:
+                continue
+            batch = entry[1]
+            batch.left -= 1
+            if batch.left <= 0 and not batch.users:
+                done.append(batch)
+        await run_db(_remove, keys)
+        for batch in done:
+            await self._cleanup(batch)
+
+    @staticmethod
+    async def _kick(bot, chat_id: int, uid: int) -> None:
+        try:
+            await bot.ban_chat_member(chat_id, uid)
+            await bot.unban_chat_member(chat_id, uid, only_if_banned=True)
+        except Exception as e:
+            print("Captcha kick failed:", e)
+
+    # ----- bấm nút -----
+    async def on_button(self, update, context) -> None:
+        q = update.callback_query
+        if q.message is None:
+            # tin quá cũ / không truy cập được → không biết của nhóm nào
+            return await q.answer("Thử thách đã hết hạn.")
+        await self._ensure_loaded()
+        chat_id, uid = q.message.chat.id, q.from_user.id
+        key = (chat_id, uid)
+        entry = self._pending.get(key)
+        if entry is None:
+            return await q.answer("Thử thách này không dành cho bạn.")
+        batch = entry[1]
+        if q.data.split(":", 1)[1] != batch.answer:
+            misses = self._misses.get(key, 0) + 1
+            if misses < CAPTCHA_MAX_TRIES:
+                self._misses[key] = misses
+                return await q.answer(f"❌ Sai rồi, còn {CAPTCHA_MAX_TRIES - misses} lần thử.")
+            self.stats["failed"] += 1
+            await q.answer("❌ Sai quá nhiều lần.")
+            await self._resolve([key])
+            return await self._kick(context.bot, chat_id, uid)
+        self.stats["passed"] += 1
+        await q.answer("✅ Xác minh thành công!")
+        await self._resolve([key])
+        try:
+            # trả về quyền mặc định của nhóm (không mở quyền mà nhóm đang hạn chế: media, poll, pin…)
+            chat = await context.bot.get_chat(chat_id)
+            perms = chat.permissions or ChatPermissions(can_send_messages=True)
+            await context.bot.restrict_chat_member(chat_id, uid, perms)
+        except Exception as e:
+            print("Captcha unrestrict failed:", e)
+        JOINS.add(context.application, chat_id, [q.from_user.mention_html()])
+
+    # ----- hết hạn -----
+    def _pop_due(self, now) -> list[tuple[int, int]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, chat_id, uid = heapq.heappop(self._heap)
+            entry = self._pending.get((chat_id, uid))
+            if entry is not None and entry[0] == deadline:
+                due.append((chat_id, uid))
+        return due
+
+    async def tick(self, bot) -> int:
+        await self._ensure_loaded()
+        due = self._pop_due(now_utc())
+        if not due:
+            return 0
+        self.stats["timeouts"] += len(due)
+        await self._resolve(due)
+        sem = asyncio.Semaphore(_KICK_CONCURRENCY)
+
+        async def _one(chat_id, uid):
+            async with sem:
+                await self._kick(bot, chat_id, uid)
+        await asyncio.gather(*(_one(c, u) for c, u in due))
+        return len(due)
+
+
+CAPTCHA = CaptchaEngine()
+
+
+async def captcha_tick_job(context) -> None:
+    await CAPTCHA.tick(context.bot)
@@ -0,0 +1,49 @@
+# core/config_repo.py
+"""
+Đọc/ghi dòng cấu hình theo nhóm (Setting, AutoBanConfig, SupportSetting).
+
+Trước đây mỗi lệnh bật/tắt tự làm `query().one_or_none()` → `add()` nếu
+chưa có → `commit()` (+ `refresh()`): 2–3 lượt DB, và 2 handler chạy song
+song có thể cùng INSERT → lỗi unique. Ở đây mọi lần ghi là 1 câu UPSERT
+(`upsert_config`, RETURNING cả dòng), rồi dòng trả về được ghi thẳng vào
+snapshot ChatRuleSet đang cache (`write_through`) thay vì bỏ cache.
+
+PromoSetting dùng chung `upsert_config` trong pro/handlers.py (lịch gửi do
+PROMOS giữ, không nằm trong bộ luật).
+"""
+from core.models import (
+    SessionLocal, Setting, AutoBanConfig, SupportSetting,
+    get_config, upsert_config, list_supporters,
+)
+from core.rules import write_through
+
+
+def get_setting(db: SessionLocal, chat_id: int) -> Setting:
+    return get_config(db, Setting, chat_id)
+
+
+def set_setting(db: SessionLocal, chat_id: int, **fields) -> Setting:
+    s = upsert_config(db, Setting, chat_id, **fields)
+    db.commit()
+    write_through(chat_id, setting=s)
+    return s
+
+
+def get_autoban(db: SessionLocal, chat_id: int) -> AutoBanConfig:
+    return get_config(db, AutoBanConfig, chat_id)
+
+
+def set_autoban(db: SessionLocal, chat_id: int, **fields) -> AutoBanConfig:
+    cfg = upsert_config(db, AutoBanConfig, chat_id, **fields)
+    db.commit()
+    write_through(chat_id, autoban=cfg)
+    return cfg
+
+
+def set_support(db: SessionLocal, chat_id: int, enabled: bool) -> SupportSetting:
+    row = upsert_config(db, SupportSetting, chat_id, is_enabled=enabled)
+    # snapshot chỉ nạp danh sách supporter khi support bật
+    supporters = frozenset(list_supporters(db, chat_id)) if enabled else frozenset()
+    db.commit()
+    write_through(chat_id, support=(bool(enabled), supporters))
+    return row
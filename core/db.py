@@ -0,0 +1,43 @@
+# core/db.py
+"""
+Chạy code SQLAlchemy (đồng bộ) trên thread pool riêng để không chặn event loop.
+
+    def _tx(db):
+        ...
+        return result
+    result = await run_db(_tx)
+
+Số thread = DB_POOL_SIZE (khớp pool_size của create_engine trong core.models),
+nên mỗi thread luôn có sẵn 1 kết nối, không thread nào phải chờ pool.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from core.models import SessionLocal, DB_POOL_SIZE
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
+
+def _with_session(fn, args, kwargs):
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+async def run_db(fn, *args, **kwargs):
+    """Gọi fn(db, *args, **kwargs) với 1 session mới trên thread pool DB."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_EXECUTOR, partial(_with_session, fn, args, kwargs))
+
+
+async def run_sync(fn, *args, **kwargs):
+    """Gọi hàm tự quản lý session (get_ruleset, count_users…) trên thread pool DB."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_EXECUTOR, partial(fn, *args, **kwargs))
+
+
+def shutdown_db_pool() -> None:
+    _EXECUTOR.shutdown(wait=True)
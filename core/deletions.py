@@ -0,0 +1,129 @@
+# core/deletions.py
+"""
+Hàng đợi xoá tin bền vững (lời chào có TTL…).
+
+Trước đây mỗi lời chào = 1 task `asyncio.sleep(ttl)` (mặc định 900s): nhóm
+đông giữ hàng nghìn coroutine ngủ, và redeploy là mất hết lịch xoá. Ở đây:
+
+- `schedule()` ghi (chat_id, message_id, delete_at) vào bảng
+  `scheduled_deletions` (index theo `delete_at`) và nhớ hạn sớm nhất trong RAM.
+- `deletion_tick_job` (JobQueue, mỗi DELETE_TICK giây) là worker duy nhất:
+  chưa tới hạn sớm nhất thì không đụng DB; tới hạn thì lấy các dòng đến hạn
+  theo lô, gom theo nhóm và xoá bằng `delete_messages` (tối đa 100 tin/lần).
+- Dòng chỉ bị xoá khỏi bảng sau khi đã gọi API → restart giữa chừng thì lượt
+  đầu tiên sau khi khởi động sẽ xoá tiếp (xoá lại tin đã mất là vô hại).
+"""
+import os
+from datetime import timedelta
+
+from sqlalchemy import delete, func, select
+from telegram.constants import BulkRequestLimit
+from telegram.error import RetryAfter
+
+from core.db import run_db
+from core.models import ScheduledDeletion, now_utc
+from core.ratelimit import retry_after_seconds
+
+DELETE_TICK = float(os.getenv("DELETE_TICK", "5"))          # giây giữa 2 lượt kiểm tra
+DELETE_BATCH = int(os.getenv("DELETE_BATCH", "1000"))       # số dòng mỗi lô đọc từ DB
+
+
+def _insert(db, chat_id: int, message_ids: list[int], delete_at) -> None:
+    db.add_all(ScheduledDeletion(chat_id=chat_id, message_id=mid, delete_at=delete_at)
+               for mid in message_ids)
+    db.commit()
+
+
+def _due(db, now, limit: int) -> list[tuple[int, int, int]]:
+    stmt = (select(ScheduledDeletion.id, ScheduledDeletion.chat_id, ScheduledDeletion.message_id)
+            .where(ScheduledDeletion.delete_at <= now)
+            .order_by(ScheduledDeletion.delete_at).limit(limit))
+    return [tuple(r) for r in db.execute(stmt)]
+
+
+def _drop(db, ids: list[int]):
+    """Xoá các dòng đã xử lý; trả về hạn sớm nhất còn lại (None = hết)."""
+    if ids:
+        db.execute(delete(ScheduledDeletion).where(ScheduledDeletion.id.in_(ids)),
+                   execution_options={"synchronize_session": False})
+        db.commit()
+    return db.execute(select(func.min(ScheduledDeletion.delete_at))).scalar()
+
+
+class DeletionQueue:
+    def __init__(self, batch: int = DELETE_BATCH):
+        self.batch = batch
+        self._loaded = False      # chưa đọc hạn sớm nhất từ DB (vừa khởi động)
+        self._next = None         # hạn sớm nhất còn chờ; None = không có
+        self.stats = {"scheduled": 0, "deleted": 0, "calls": 0, "failed": 0, "backoffs": 0}
+
+    def _note(self, at) -> None:
+        if at is not None and (self._next is None or at < self._next):
+            self._next = at
+
+    async def schedule(self, chat_id: int, message_ids: list[int], ttl: float) -> None:
+        """Xoá `message_ids` của `chat_id` sau `ttl` giây (sống qua restart)."""
+        if not message_ids:
+            return
+        at = now_utc() + timedelta(seconds=ttl)
+        await run_db(_insert, chat_id, list(message_ids), at)
+        self.stats["scheduled"] += len(message_ids)
+        self._note(at)
+
+    def pending_due(self, now) -> bool:
+        return not self._loaded or (self._next is not None and self._next <= now)
+
+    async def _delete_chat(self, bot, chat_id: int, message_ids: list[int]) -> None:
+        step = BulkRequestLimit.MAX_LIMIT
+        for i in range(0, len(message_ids), step):
+            part = message_ids[i:i + step]
+            self.stats["calls"] += 1
+            try:
+                await bot.delete_messages(chat_id, part)
+                self.stats["deleted"] += len(part)
+            except RetryAfter:
+                raise
+            except Exception:
+                # tin đã bị xoá tay / bot mất quyền / quá 48h → bỏ qua
+                self.stats["failed"] += len(part)
+
+    async def tick(self, bot) -> int:
+        now = now_utc()
+        if not self.pending_due(now):
+            return 0
+        self._loaded = True
+        self._next = None          # schedule() trong lúc chạy vẫn ghi nhận được hạn mới
+        try:
+            return await self._run(bot, now)
+        except Exception:
+            self._loaded = False   # lỗi DB → lượt sau đọc lại hạn sớm nhất từ bảng
+            raise
+
+    async def _run(self, bot, now) -> int:
+        done = 0
+        while True:
+            rows = await run_db(_due, now, self.batch)
+            by_chat: dict[int, list[int]] = {}
+            for _id, chat_id, mid in rows:
+                by_chat.setdefault(chat_id, []).append(mid)
+            ids = [r[0] for r in rows]
+            try:
+                for chat_id, mids in by_chat.items():
+                    await self._delete_chat(bot, chat_id, mids)
+            except RetryAfter as e:
+                # giữ nguyên các dòng của lô này, thử lại sau retry_after
+                self.stats["backoffs"] += 1
+                self._note(now_utc() + timedelta(seconds=retry_after_seconds(e)))
+                return done
+            nxt = await run_db(_drop, ids)
+            done += len(ids)
+            if len(rows) < self.batch:
+                self._note(nxt)
+                return done
+
+
+DELETIONS = DeletionQueue()
+
+
+async def deletion_tick_job(context) -> None:
+    await DELETIONS.tick(context.bot)
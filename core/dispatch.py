@@ -0,0 +1,115 @@
+# core/dispatch.py
+"""
+Xử lý update song song giữa các nhóm, tuần tự trong cùng 1 nhóm.
+
+Mặc định PTB xử lý từng update một: 1 lệnh chậm (get_chat_member, DB…) ở
+nhóm A làm mọi nhóm khác phải chờ. `ChatOrderedProcessor` cho tối đa
+MAX_CONCURRENT_UPDATES nhóm chạy cùng lúc, còn update của cùng 1 nhóm được
+xếp hàng và chạy đúng thứ tự nhận (đếm flood / cảnh cáo không bị xen kẽ).
+
+- Update đầu tiên của 1 nhóm trở thành "worker" của nhóm đó và chạy lần
+  lượt hàng đợi của nhóm; các update tới sau chỉ xếp hàng rồi trả ngay slot
+  semaphore, nên 1 nhóm đông không chiếm hết slot của nhóm khác.
+- `stats()` trả về độ sâu hàng đợi (tổng update đang chờ) để theo dõi backlog.
+"""
+import os
+from collections import deque
+
+from telegram.ext import BaseUpdateProcessor
+
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+
+
+def _chat_key(update):
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return ("u", user.id)   # inline query, callback ngoài nhóm… → giữ thứ tự theo user
+    return None
+
+
+class ChatOrderedProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        self._queues: dict[object, deque] = {}   # key -> coroutine chờ; có key = đang có worker
+        self._depth = 0      # update đang xếp hàng sau worker của nhóm
+        self._pending = 0    # update đã nhận mà process_update chưa trả về
+        self._running = 0    # update đang giữ slot semaphore và thực sự chạy
+        self._stats = {"processed": 0, "queued": 0, "peak_depth": 0, "errors": 0}
+
+    async def process_update(self, update, coroutine) -> None:
+        # bọc ngoài semaphore để đếm cả update đang chờ slot
+        self._pending += 1
+        self._note_depth()
+        try:
+            await super().process_update(update, coroutine)
+        finally:
+            self._pending -= 1
+
+    async def do_process_update(self, update, coroutine) -> None:
+        key = _chat_key(update)
+        if key is None:
+            self._running += 1
+            try:
+                await self._run(coroutine)
+            finally:
+                self._running -= 1
+            return
+
+        q = self._queues.get(key)
+        if q is not None:
+            # nhóm đang có worker → xếp hàng, worker sẽ chạy theo đúng thứ tự
+            q.append(coroutine)
+            self._depth += 1
+            self._stats["queued"] += 1
+            self._note_depth()
+            return
+
+        q = self._queues[key] = deque()
+        self._running += 1
+        try:
+            await self._run(coroutine)
+            while q:
+                nxt = q.popleft()
+                self._depth -= 1
+                await self._run(nxt)
+        finally:
+            self._running -= 1
+            del self._queues[key]
+            # worker bị huỷ (tắt bot) → đóng các coroutine còn lại cho sạch
+            while q:
+                q.popleft().close()
+                self._depth -= 1
+
+    async def _run(self, coroutine) -> None:
+        try:
+            await coroutine
+        except Exception as e:
+            # Application.process_update đã tự gọi error handler; đây chỉ là lưới an toàn
+            self._stats["errors"] += 1
+            print("[dispatch] update error:", repr(e))
+        self._stats["processed"] += 1
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def depth(self) -> int:
+        """Số update đang chờ: chờ slot semaphore + xếp hàng sau worker của nhóm."""
+        return self._pending - self._running + self._depth
+
+    def _note_depth(self) -> None:
+        d = self.depth()
+        if d > self._stats["peak_depth"]:
+            self._stats["peak_depth"] = d
+
+    def stats(self) -> dict:
+        return dict(self._stats, depth=self.depth(), running=self._running,
+                    active_chats=len(self._queues), max_concurrent=self.max_concurrent_updates)
+
+
+UPDATE_PROCESSOR = ChatOrderedProcessor()
@@ -0,0 +1,87 @@
+# core/domains.py
+"""
+Chuẩn hoá host + trie hậu tố cho whitelist domain.
+
+Whitelist được lưu theo nhãn đảo ngược (`sub.example.com` → com → example → sub)
+nên câu hỏi "host này hoặc domain cha của nó có trong whitelist không" chỉ
+tốn O(số nhãn) thay vì so từng domain một.
+"""
+import re
+from typing import Iterable
+
+TRAILING_PUNCT_RE = re.compile(r"[),.;!?]+$")
+SCHEME_RE = re.compile(r"^https?://")
+
+_END = ""  # key đánh dấu node kết thúc 1 domain (nhãn thật không bao giờ rỗng)
+
+
+def to_host(domain_or_url: str) -> str:
+    s = (domain_or_url or "").strip().lower()
+    if not s:
+        return ""
+    s = TRAILING_PUNCT_RE.sub("", s)
+    s = SCHEME_RE.sub("", s)
+    s = s.split("/")[0].split("?")[0].split("#")[0].strip()
+    if s.startswith("www."):
+        s = s[4:]
+    return s
+
+
+class DomainTrie:
+    """Trie theo nhãn domain đảo ngược."""
+
+    __slots__ = ("_root", "_entries")
+
+    def __init__(self, domains: Iterable[str] = ()):
+        self._root: dict = {}
+        self._entries: list[str] = []
+        for d in domains:
+            self.add(d)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __bool__(self) -> bool:
+        return bool(self._entries)
+
+    def add(self, domain: str) -> bool:
+        host = to_host(domain)
+        if not host:
+            return False
+        node = self._root
+        for label in reversed(host.split(".")):
+            if label:
+                node = node.setdefault(label, {})
+        if _END in node:
+            return False
+        node[_END] = host
+        self._entries.append(host)
+        return True
+
+    def allows(self, host: str) -> bool:
+        """True nếu `host` hoặc 1 domain cha của nó nằm trong whitelist."""
+        if not self._entries:
+            return False
+        node = self._root
+        for label in reversed(to_host(host).split(".")):
+            if not label:
+                continue
+            node = node.get(label)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
+
+    def __contains__(self, domain: str) -> bool:
+        """Khớp đúng domain đã lưu (không tính domain cha)."""
+        node = self._root
+        for label in reversed(to_host(domain).split(".")):
+            if label:
+                node = node.get(label)
+                if node is None:
+                    return False
+        return _END in node
+
+    def domains(self) -> list[str]:
+        return list(self._entries)
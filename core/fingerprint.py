@@ -0,0 +1,194 @@
+# core/fingerprint.py
+"""
+Chỉ mục dấu vân tay nội dung dùng chung cho mọi nhóm (spam rải nhiều nhóm).
+
+`guard` của từng nhóm chỉ thấy 1 tin, `Filter` chỉ khớp chuỗi con chính xác.
+Ở đây mỗi tin (đủ dài) được chuẩn hoá (NFKC, chữ thường, số → 0, bỏ dấu câu)
+rồi lấy:
+  - hash chính xác của bản chuẩn hoá → tra dict O(1) cho bản sao y hệt;
+  - chữ ký MinHash 16 ngăn trên shingle 4 ký tự, chia 8 dải (LSH) → 8 lần
+    tra dict; mỗi ô dải giữ tối đa 8 cụm nên số phép so độ giống mỗi tin bị
+    chặn trên, không phụ thuộc số cụm.
+Các tin khớp gom vào 1 cụm; cụm xuất hiện ở ≥ FP_CHATS nhóm trong FP_WINDOW
+giây thì bị đánh dấu: trả về mọi tin đã thấy để xoá ở tất cả các nhóm, tin
+khớp về sau bị xoá ngay. Cụm không còn tin mới quá FP_WINDOW giây bị bỏ (TTL),
+và có trần FP_MAX_CLUSTERS.
+"""
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+FP_WINDOW = float(os.getenv("FP_WINDOW", "600"))            # giây
+FP_CHATS = int(os.getenv("FP_CHATS", "4"))                   # số nhóm khác nhau → coi là spam
+FP_MIN_CHARS = int(os.getenv("FP_MIN_CHARS", "40"))          # tin ngắn hơn (sau chuẩn hoá) bỏ qua
+FP_MIN_SIMILARITY = float(os.getenv("FP_MIN_SIMILARITY", "0.7"))   # độ giống (Jaccard ước lượng) để coi là "gần giống"
+FP_MAX_CLUSTERS = int(os.getenv("FP_MAX_CLUSTERS", "50000"))
+FP_MAX_CHARS = 1024       # chỉ lấy shingle trên ngần này ký tự đầu
+# chữ ký 16 ngăn = 8 dải × 2 ngăn: xác suất thành ứng viên = 1 - (1 - J²)^8
+# (J = 0.9 → ~100%, J = 0.5 → 90%, J = 0.1 → 8%; ứng viên luôn được kiểm lại)
+_BINS, _BANDS, _ROWS = 16, 8, 2
+_BIN_MASK = _BINS - 1
+_PER_BAND = 8             # số cụm giữ trong 1 ô dải (ô mới nhất ở cuối)
+_PER_CHAT = 20            # số tin giữ lại mỗi nhóm trong 1 cụm (để xoá khi bị đánh dấu)
+
+_DIGITS = re.compile(r"\d+")
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    t = unicodedata.normalize("NFKC", text or "").casefold()
+    t = _DIGITS.sub("0", t)
+    return " ".join(w for w in _NON_WORD.split(t) if w)
+
+
+_M64 = (1 << 64) - 1
+
+
+def _h64(s: str) -> int:
+    # hash() của str là SipHash, ngẫu nhiên theo tiến trình — đủ vì chỉ mục chỉ nằm trong RAM
+    return hash(s) & _M64
+
+
+def minhash(norm: str) -> tuple:
+    """
+    MinHash 1 hoán vị (one-permutation hashing) trên shingle 4 ký tự: hash
+    mỗi shingle 1 lần, chia vào _BINS ngăn theo bit thấp, giữ min mỗi ngăn.
+    Tỉ lệ ngăn trùng nhau ≈ độ giống Jaccard của 2 tập shingle.
+    """
+    s = norm[:FP_MAX_CHARS]
+    mins = [_M64] * _BINS
+    for i in range(max(1, len(s) - 3)):
+        h = _h64(s[i:i + 4])
+        b = h & _BIN_MASK
+        if h < mins[b]:
+            mins[b] = h
+    return tuple(None if v == _M64 else v for v in mins)
+
+
+def similarity(a: tuple, b: tuple) -> float:
+    both = same = 0
+    for x, y in zip(a, b):
+        if x is not None and y is not None:
+            both += 1
+            same += x == y
+    return same / both if both else 0.0
+
+
+def _band_keys(sig: tuple) -> list:
+    # LSH: _BANDS dải × _ROWS ngăn; dải có ngăn rỗng thì bỏ
+    keys = []
+    for b in range(_BANDS):
+        part = sig[b * _ROWS:(b + 1) * _ROWS]
+        if None not in part:
+            keys.append((b, *part))
+    return keys
+
+
+class _Cluster:
+    __slots__ = ("sig", "exact", "chats", "last", "flagged")
+
+    def __init__(self, sig: tuple):
+        self.sig = sig
+        self.exact: list[int] = []                 # các hash chính xác trỏ tới cụm
+        self.chats: dict[int, list] = {}           # chat_id -> [lần cuối, [(message_id, user_id)]]
+        self.last = 0.0
+        self.flagged = False
+
+
+class FingerprintIndex:
+    def __init__(self, window: float = FP_WINDOW, min_chats: int = FP_CHATS,
+                 max_clusters: int = FP_MAX_CLUSTERS, clock=time.monotonic):
+        self.window = window
+        self.min_chats = min_chats
+        self.max_clusters = max_clusters
+        self._clock = clock
+        self._exact: dict[int, _Cluster] = {}
+        self._bands: dict[tuple, list[_Cluster]] = {}
+        self._clusters: "OrderedDict[_Cluster, None]" = OrderedDict()   # cũ nhất ở đầu
+        self.stats = {"checked": 0, "near_hits": 0, "flagged": 0, "deleted": 0, "expired": 0}
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+    def _drop(self, c: _Cluster) -> None:
+        for k in c.exact:
+            if self._exact.get(k) is c:
+                del self._exact[k]
+        for k in _band_keys(c.sig):
+            lst = self._bands.get(k)
+            if lst and c in lst:
+                lst.remove(c)
+                if not lst:
+                    del self._bands[k]
+
+    def _expire(self, now: float) -> None:
+        while self._clusters:
+            c = next(iter(self._clusters))
+            if now - c.last <= self.window and len(self._clusters) <= self.max_clusters:
+                break
+            del self._clusters[c]
+            self._drop(c)
+            self.stats["expired"] += 1
+
+    def _find(self, norm: str, ex: int) -> _Cluster:
+        c = self._exact.get(ex)
+        if c is not None:
+            return c
+        sig = minhash(norm)
+        keys = _band_keys(sig)
+        for k in keys:
+            for cand in self._bands.get(k, ()):
+                if similarity(cand.sig, sig) >= FP_MIN_SIMILARITY:
+                    self.stats["near_hits"] += 1
+                    c = cand
+                    break
+            if c is not None:
+                break
+        if c is None:
+            c = _Cluster(sig)
+            for k in keys:
+                lst = self._bands.setdefault(k, [])
+                lst.append(c)
+                if len(lst) > _PER_BAND:
+                    del lst[0]
+        if len(c.exact) < 32:
+            c.exact.append(ex)
+            self._exact[ex] = c
+        return c
+
+    def check(self, chat_id: int, message_id: int, user_id: int, text: str):
+        """
+        Ghi nhận 1 tin. Trả về None nếu chưa phải spam đa nhóm, ngược lại là
+        danh sách (chat_id, message_id, user_id) cần xoá (luôn gồm tin hiện tại).
+        """
+        norm = normalize(text)
+        if len(norm) < FP_MIN_CHARS:
+            return None
+        now = self._clock()
+        self.stats["checked"] += 1
+        self._expire(now)
+        c = self._find(norm, _h64(norm))
+        c.last = now
+        self._clusters[c] = None
+        self._clusters.move_to_end(c)
+
+        if c.flagged:
+            self.stats["deleted"] += 1
+            return [(chat_id, message_id, user_id)]
+        slot = c.chats.setdefault(chat_id, [now, []])
+        slot[0] = now
+        if len(slot[1]) < _PER_CHAT:
+            slot[1].append((message_id, user_id))
+        if sum(1 for t, _ in c.chats.values() if now - t <= self.window) < self.min_chats:
+            return None
+        c.flagged = True
+        out = [(cid, mid, uid) for cid, (_, msgs) in c.chats.items() for mid, uid in msgs]
+        c.chats = {}
+        self.stats["flagged"] += 1
+        self.stats["deleted"] += len(out)
+        return out
+
+
+SPAMPRINT = FingerprintIndex()
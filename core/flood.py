@@ -0,0 +1,83 @@
+# core/flood.py
+"""
+Chống flood theo (chat, user) với bộ nhớ cố định.
+
+Mỗi key chỉ giữ 1 số float (GCRA — "theoretical arrival time" của token
+bucket), thay cho list timestamp cũ. Cho phép `limit` tin dồn dập trong
+`window` giây; tin thứ limit+1 trong cửa sổ đó bị coi là flood.
+
+- Đồng hồ monotonic (không nhảy khi đổi giờ hệ thống).
+- Key không hoạt động được quét định kỳ (`sweep`), và có trần cứng `max_keys`
+  (bỏ key cũ nhất khi vượt).
+"""
+import os
+import time
+from itertools import islice
+
+FLOOD_WINDOW = float(os.getenv("FLOOD_WINDOW", "10"))          # giây
+FLOOD_MAX_KEYS = int(os.getenv("FLOOD_MAX_KEYS", "200000"))
+
+
+def _pack(chat_id: int, user_id: int) -> int:
+    # 1 int thay vì tuple(chat_id, user_id): nhẹ hơn ~3 lần trong dict
+    return (chat_id << 64) ^ (user_id & 0xFFFFFFFFFFFFFFFF)
+
+
+class FloodLimiter:
+    def __init__(self, window: float = FLOOD_WINDOW, max_keys: int = FLOOD_MAX_KEYS,
+                 clock=time.monotonic):
+        self.window = window
+        self.max_keys = max_keys
+        self._clock = clock
+        # key -> TAT; thứ tự chèn = thứ tự dùng gần nhất (key cũ nhất ở đầu)
+        self._tat: dict[int, float] = {}
+        self._stats = {"checks": 0, "flagged": 0, "evicted_idle": 0, "evicted_cap": 0, "peak_keys": 0}
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+    def hit(self, chat_id: int, user_id: int, limit: int) -> bool:
+        """Ghi nhận 1 tin; True nếu user đang flood."""
+        limit = max(1, int(limit))
+        now = self._clock()
+        interval = self.window / limit
+        tolerance = self.window - interval      # = (limit - 1) * interval
+        key = _pack(chat_id, user_id)
+        self._stats["checks"] += 1
+
+        tat = self._tat.pop(key, now)
+        if tat < now:
+            tat = now
+        flooded = tat - now > tolerance + 1e-9   # epsilon: tránh lệch làm tròn float
+        if flooded:
+            self._stats["flagged"] += 1
+        else:
+            tat += interval
+        self._tat[key] = tat  # chèn lại cuối → LRU
+
+        if len(self._tat) > self._stats["peak_keys"]:
+            self._stats["peak_keys"] = len(self._tat)
+        if len(self._tat) > self.max_keys:
+            # bỏ theo lô 10%: xoá lẻ từng key ở đầu dict sẽ thành O(n^2) vì phải bước qua ô đã xoá
+            self._evict(len(self._tat) - self.max_keys + self.max_keys // 10)
+        return flooded
+
+    def _evict(self, n: int) -> None:
+        for key in list(islice(self._tat, n)):
+            del self._tat[key]
+        self._stats["evicted_cap"] += n
+
+    def sweep(self, max_scan: int = 50_000) -> int:
+        """Bỏ các key đã "đầy bucket" (TAT đã qua) — giữ lại cũng không đổi kết quả."""
+        now = self._clock()
+        dead = [k for k, tat in islice(self._tat.items(), max_scan) if tat <= now]
+        for k in dead:
+            del self._tat[k]
+        self._stats["evicted_idle"] += len(dead)
+        return len(dead)
+
+    def reset(self, chat_id: int, user_id: int) -> None:
+        self._tat.pop(_pack(chat_id, user_id), None)
+
+    def stats(self) -> dict:
+        return dict(self._stats, keys=len(self._tat), max_keys=self.max_keys)
@@ -0,0 +1,134 @@
+# core/joins.py
+"""
+Pipeline xử lý thành viên mới (NEW_CHAT_MEMBERS) trong 1 lượt.
+
+Trước đây `welcome_member` và `on_new_member` cùng đăng ký 1 filter trong
+cùng group → PTB chỉ chạy handler đầu tiên (nobots không bao giờ chạy), mỗi
+handler lại tự mở session đọc Setting. Giờ chỉ còn `on_join`:
+
+  settings  → ChatRuleSet đã cache (1 lần cho cả update)
+  nobots    → ban bot được thêm vào khi nobots bật
+  blacklist → 1 query `user_id IN (...)`, ban lại người trong danh sách đen
+  raid      → đếm người vào (core/raid.py); nhóm đang khoá → restrict tới hết khoá
+  captcha   → nhóm bật captcha: restrict + thử thách (core/captcha.py), chào sau khi qua
+  welcome   → đẩy những người còn lại vào JoinBatcher (core/welcome.py)
+
+Thời gian từng bước được ghi vào JOIN_STAGES (xem /status).
+"""
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from telegram import ChatPermissions
+from telegram.constants import ParseMode
+
+from core.captcha import CAPTCHA
+from core.db import run_db
+from core.models import Blacklist
+from core.raid import RAID, start_lockdown
+from core.rules import aget_ruleset
+from core.welcome import JOINS
+
+
+class StageStats:
+    """Đếm số lần / tổng / max thời gian (giây) theo từng bước."""
+
+    def __init__(self):
+        self._stages: dict[str, list] = {}     # stage -> [n, total, max]
+        self.counts = {"events": 0, "members": 0, "bots_banned": 0, "blacklisted": 0, "locked": 0}
+
+    @contextmanager
+    def time(self, stage: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            s = self._stages.setdefault(stage, [0, 0.0, 0.0])
+            s[0] += 1
+            s[1] += dt
+            if dt > s[2]:
+                s[2] = dt
+
+    def stats(self) -> dict:
+        return {
+            stage: {"n": n, "avg_ms": total / n * 1000 if n else 0.0, "max_ms": mx * 1000}
+            for stage, (n, total, mx) in self._stages.items()
+        }
+
+
+JOIN_STAGES = StageStats()
+
+
+def _blacklisted(db, chat_id: int, user_ids: list[int]) -> set[int]:
+    rows = db.query(Blacklist.user_id).filter(
+        Blacklist.chat_id == chat_id, Blacklist.user_id.in_(user_ids)
+    ).all()
+    return {r[0] for r in rows}
+
+
+async def on_join(update, context) -> None:
+    msg = update.effective_message
+    chat = update.effective_chat
+    if not msg or not chat or not getattr(msg, "new_chat_members", None):
+        return
+    members = list(msg.new_chat_members)
+    JOIN_STAGES.counts["events"] += 1
+    JOIN_STAGES.counts["members"] += len(members)
+
+    with JOIN_STAGES.time("total"):
+        with JOIN_STAGES.time("settings"):
+            rs = await aget_ruleset(chat.id)
+
+        if rs.nobots and any(m.is_bot for m in members):
+            with JOIN_STAGES.time("nobots"):
+                for m in members:
+                    if not m.is_bot:
+                        continue
+                    try:
+                        await context.bot.ban_chat_member(chat.id, m.id)
+                        JOIN_STAGES.counts["bots_banned"] += 1
+                        await msg.reply_text(
+                            f"🤖 Đã xoá bot <b>{m.first_name}</b> (nobots đang bật).",
+                            parse_mode=ParseMode.HTML
+                        )
+                    except Exception as e:
+                        print("Kick bot failed:", e)
+            members = [m for m in members if not m.is_bot]
+
+        if members:
+            with JOIN_STAGES.time("blacklist"):
+                banned = await run_db(_blacklisted, chat.id, [m.id for m in members])
+                for uid in banned:
+                    try:
+                        await context.bot.ban_chat_member(chat.id, uid)
+                        JOIN_STAGES.counts["blacklisted"] += 1
+                    except Exception as e:
+                        print("Ban blacklisted failed:", e)
+            members = [m for m in members if m.id not in banned]
+
+        if members:
+            with JOIN_STAGES.time("raid"):
+                reason = RAID.on_join(chat.id, [m.id for m in members])
+                if reason:
+                    await start_lockdown(context, chat.id, reason)
+                if RAID.locked(chat.id):
+                    until = datetime.now(timezone.utc) + timedelta(seconds=RAID.remaining(chat.id))
+                    for m in members:
+                        try:
+                            await context.bot.restrict_chat_member(
+                                chat.id, m.id, ChatPermissions(can_send_messages=False), until_date=until
+                            )
+                            JOIN_STAGES.counts["locked"] += 1
+                        except Exception as e:
+                            print("Raid restrict failed:", e)
+                    members = []
+
+        if members and rs.captcha:
+            with JOIN_STAGES.time("captcha"):
+                await CAPTCHA.add(context.application, chat.id, members)
+            members = []
+
+        if members and rs.welcome_text:
+            with JOIN_STAGES.time("welcome"):
+                JOINS.add(context.application, chat.id, [m.mention_html() for m in members])
@@ -0,0 +1,86 @@
+# core/keywords.py
+"""
+Aho-Corasick cho danh sách từ khoá filter của 1 nhóm.
+
+Dựng 1 lần từ bảng `filters` (qua ChatRuleSet), sau đó mỗi tin nhắn chỉ quét
+1 lượt, không phụ thuộc số lượng từ khoá. Với vài từ khoá thì vòng lặp
+`pattern in text` (chạy bằng C) vẫn nhanh hơn automaton viết bằng Python,
+nên dưới SMALL_SET ta giữ cách cũ.
+"""
+from collections import deque
+from typing import Iterable, Optional
+
+SMALL_SET = 64  # điểm hoà đo bằng bench/bench_keywords.py
+
+
+class KeywordMatcher:
+    """Tìm từ khoá (không phân biệt hoa thường) trong 1 lượt quét."""
+
+    __slots__ = ("_patterns", "_goto", "_fail", "_out")
+
+    def __init__(self, patterns: Iterable[tuple[int, str]]):
+        # giữ thứ tự id, bỏ pattern rỗng
+        self._patterns = [(pid, p.lower()) for pid, p in patterns if p]
+        self._goto: list[dict[str, int]] = []
+        self._fail: list[int] = []
+        self._out: list[Optional[tuple[int, str]]] = []
+        if len(self._patterns) > SMALL_SET:
+            self._build()
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def _build(self) -> None:
+        goto, out = [{}], [None]
+        for pid, pat in self._patterns:
+            node = 0
+            for ch in pat:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    out.append(None)
+                node = nxt
+            if out[node] is None:
+                out[node] = (pid, pat)
+
+        fail = [0] * len(goto)
+        q = deque(goto[0].values())   # con của root: fail = 0
+        while q:
+            node = q.popleft()
+            for ch, nxt in goto[node].items():
+                q.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                # kế thừa output của suffix để không phải đi ngược chuỗi fail khi quét
+                if out[nxt] is None:
+                    out[nxt] = out[fail[nxt]]
+
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def search(self, text: str) -> Optional[tuple[int, str]]:
+        """Trả về (filter_id, pattern) của từ khoá khớp sớm nhất, hoặc None."""
+        if not self._patterns or not text:
+            return None
+        low = text.lower()
+        if not self._goto:
+            for pid, pat in self._patterns:
+                if pat in low:
+                    return pid, pat
+            return None
+
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for ch in low:
+            nxt = goto[node].get(ch)
+            while nxt is None and node:
+                node = fail[node]
+                nxt = goto[node].get(ch)
+            node = nxt or 0
+            hit = out[node]
+            if hit is not None:
+                return hit
+        return None
@@ -52,12 +52,14 @@ LANG = {
             "• /antiforward_on | /antiforward_off – Bật/tắt chặn tin chuyển tiếp\n"
             "• /setflood &lt;n&gt; – Giới hạn spam tin nhắn (mặc định 3)\n"
             "• /nobots_on | /nobots_off – Bật/tắt chặn bot mới vào nhóm\n"
+            "• /captcha_on | /captcha_off – Bật/tắt captcha cho thành viên mới\n"
             "• /wl_add &lt;domain&gt; – Thêm domain vào whitelist (FREE)\n"
             "• /setwelcome &lt;câu chào&gt; – Cài lời chào cho nhóm khi có thành viên mới\n"
             "   ⤷ Ví dụ: <code>/setwelcome Chào mừng {name} đến với nhóm ❤️</code>\n\n"
             "• /welcome_ttl &lt;giây&gt; – Đặt thời gian tự xoá tin chào (0 = không xoá)\n"
             "• /clear_cache – Xóa bộ nhớ tạm (cache) toàn hệ thống bot\n"
             "• /antispam_on | /antispam_off – Bật/tắt chống spam ảnh & tin nhắn lặp\n"
+            "• /dupspam_on | /dupspam_off – Bật/tắt chặn tin giống nhau rải nhiều nhóm (mặc định tắt)\n"
             "💎 <b>GÓI PRO</b>\n"
             "• /pro – Hướng dẫn dùng thử & kích hoạt PRO\n"
             "• /trial – Dùng thử miễn phí 7 ngày\n"
@@ -151,12 +153,14 @@ LANG = {
             "• /antiforward_on | /antiforward_off – Toggle forwarded message blocking\n"
             "• /setflood &lt;n&gt; – Anti-flood limit (default 3)\n"
             "• /nobots_on | /nobots_off – Toggle blocking newly-added bots\n"
+            "• /captcha_on | /captcha_off – Toggle join captcha for new members\n"
             "• /wl_add &lt;domain&gt; – Add a domain to whitelist (FREE)\n"
             "• /setwelcome &lt;message&gt; – Set a custom welcome message for new members\n"
             "   ⤷ Example: <code>/setwelcome Welcome {name} to our group 🎉</code>\n\n"
             "• /welcome_ttl <seconds> – Set auto-delete time for welcome messages (0 = never)\n"
             "• /clear_cache – Clear cached memory for all users\n"
             "• /antispam_on | /antispam_off – Enable/disable anti-spam (images & repeated texts)\n"
+            "• /dupspam_on | /dupspam_off – Toggle blocking of the same text posted across many groups (off by default)\n"
             "💎 <b>PRO</b>\n"
             "• /pro – PRO guide & activation\n"
             "• /trial – 7-day free trial\n"
@@ -4,8 +4,10 @@ from typing import Optional
 import os
 from sqlalchemy import (
     create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey,
-    BigInteger, func, inspect, text, Text, UniqueConstraint
+    BigInteger, func, inspect, text, Text, UniqueConstraint, Index
 )
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 # ===== DB CONFIG =====
@@ -16,11 +18,18 @@ DB_URL = os.getenv(
 if DB_URL.startswith("postgres://"):
     DB_URL = DB_URL.replace("postgres://", "postgresql://", 1)
 
+# Số thread chạy DB (core/db.py) = số kết nối giữ sẵn trong pool
+DB_POOL_SIZE = max(1, int(os.getenv("DB_POOL_SIZE", "5")))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+
 connect_args = {}
+pool_args = {}
 if DB_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
+else:
+    pool_args = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
 
-engine = create_engine(DB_URL, future=True, connect_args=connect_args, pool_pre_ping=True)
+engine = create_engine(DB_URL, future=True, connect_args=connect_args, pool_pre_ping=True, **pool_args)
 SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
 Base = declarative_base()
 
@@ -38,6 +47,8 @@ class User(Base):
     username = Column(String, nullable=True)
     is_pro = Column(Boolean, default=False)
     pro_expires_at = Column(DateTime, nullable=True)
+    # quét hết hạn PRO theo lô (pro/scheduler._expire_pro)
+    __table_args__ = (Index("ix_users_is_pro_expires", "is_pro", "pro_expires_at"),)
 
 class LicenseKey(Base):
     __tablename__ = "license_keys"
@@ -56,6 +67,7 @@ class Trial(Base):
     started_at = Column(DateTime, default=now_utc)
     expires_at = Column(DateTime)
     active = Column(Boolean, default=True)
+    __table_args__ = (Index("ix_trials_active_expires", "active", "expires_at"),)
 
 class Filter(Base):
     __tablename__ = "filters"
@@ -75,21 +87,34 @@ class Setting(Base):
     nobots = Column(Boolean, default=True)
     welcome_ttl = Column(Integer, default=900)  # giây; 0 = không auto-xoá
     antispam = Column(Boolean, default=True)
+    dupspam = Column(Boolean, default=False)   # chặn spam rải nhiều nhóm — nhóm tự bật (/dupspam_on)
     welcome_text = Column(Text, nullable=True, default=None)
+    captcha = Column(Boolean, default=False)   # bắt thành viên mới bấm captcha (core/captcha.py)
     
 class Whitelist(Base):
     __tablename__ = "whitelist"
+    __table_args__ = (Index("uq_whitelist_chat_domain", "chat_id", "domain", unique=True),)
     id = Column(Integer, primary_key=True)
     chat_id = Column(BigInteger, index=True)
     domain = Column(String, index=True)
 
 class Captcha(Base):
     __tablename__ = "captcha"
+    __table_args__ = (Index("uq_captcha_chat_user", "chat_id", "user_id", unique=True),)
     id = Column(Integer, primary_key=True)
     chat_id = Column(BigInteger, index=True)
     user_id = Column(BigInteger, index=True)
     answer = Column(String)
     created_at = Column(DateTime, default=now_utc)
+    message_id = Column(BigInteger, nullable=True)   # tin thử thách (xoá khi xong)
+
+# ==== Tin chờ xoá (lời chào có TTL…) — core/deletions.py ====
+class ScheduledDeletion(Base):
+    __tablename__ = "scheduled_deletions"
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    message_id = Column(BigInteger, nullable=False)
+    delete_at = Column(DateTime, nullable=False, index=True)
 
 # ==== Auto Promo ====
 class PromoSetting(Base):
@@ -100,18 +125,26 @@ class PromoSetting(Base):
     content = Column(Text, default="")
     interval_minutes = Column(Integer, default=60)
     last_sent_at = Column(DateTime, nullable=True, default=None)
+    # lần gửi kế tiếp; NULL = không lên lịch (tắt / chưa có nội dung)
+    next_send_at = Column(DateTime, nullable=True, default=None, index=True)
 
 # ===== Warning & Blacklist =====
 class Warning(Base):
     __tablename__ = "warnings"
+    # 1 dòng / (nhóm, user): đích ON CONFLICT của core.violations.upsert_warnings
+    __table_args__ = (Index("uq_warnings_chat_user", "chat_id", "user_id", unique=True),)
     id = Column(Integer, primary_key=True)
     chat_id = Column(BigInteger, index=True)
     user_id = Column(BigInteger, index=True)
     count = Column(Integer, default=0)
     last_warned = Column(DateTime, default=func.now())
 
+# /warn_top: WHERE chat_id = ? ORDER BY count DESC LIMIT 10 → đọc thẳng theo index, không sort
+Index("ix_warnings_chat_count", Warning.chat_id, Warning.count.desc())
+
 class Blacklist(Base):
     __tablename__ = "blacklists"
+    __table_args__ = (Index("uq_blacklists_chat_user", "chat_id", "user_id", unique=True),)
     id = Column(Integer, primary_key=True)
     chat_id = Column(BigInteger, index=True)
     user_id = Column(BigInteger, index=True)
@@ -131,9 +164,11 @@ class ViolationLog(Base):
     id = Column(Integer, primary_key=True)
     chat_id = Column(BigInteger, index=True, nullable=False)
     user_id = Column(BigInteger, index=True, nullable=False)
-    rule     = Column(String(32), index=True)        # 'link'|'mention'|'forward'|'filter'
+    rule     = Column(String(32), index=True)        # 'link'|'mention'|'forward'|'filter'|'dupspam' (dupspam không tính cảnh cáo)
     snippet  = Column(Text, default="")
     created_at = Column(DateTime, default=now_utc)    
+    # violations_summary / log_export: chat_id = ? AND created_at trong tháng (rule đọc luôn từ index)
+    __table_args__ = (Index("ix_violation_logs_chat_created_rule", "chat_id", "created_at", "rule"),)
 
 # --- Support mode (per-group) ---
 class SupportSetting(Base):
@@ -150,6 +185,12 @@ class Supporter(Base):
     note = Column(String(120), default="")
     __table_args__ = (UniqueConstraint('chat_id', 'user_id', name='uix_supporter_chat_user'),)
 
+# ==== Phiên bản schema (nâng cấp có đánh số, xem _UPGRADES) ====
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
 # ===== Welcome message (RAM) =====
 # LƯU Ý: phải đặt ở top-level (không bên trong hàm) để luôn tồn tại.
 welcome_messages: dict[int, str] = {}
@@ -204,8 +245,122 @@ def init_db():
                 conn.execute(text("ALTER TABLE settings ADD COLUMN welcome_text TEXT NULL"))
     except Exception as e:
         print("[migrate] settings.welcome_text note:", e)
-    
-    
+
+    # ✅ ensure settings.captcha + captcha.message_id
+    try:
+        cols_settings = {c["name"] for c in insp.get_columns("settings")}
+        if "captcha" not in cols_settings:
+            with engine.begin() as conn:
+                conn.execute(text("ALTER TABLE settings ADD COLUMN captcha BOOLEAN DEFAULT FALSE"))
+        cols_captcha = {c["name"] for c in insp.get_columns("captcha")}
+        if "message_id" not in cols_captcha:
+            with engine.begin() as conn:
+                conn.execute(text("ALTER TABLE captcha ADD COLUMN message_id BIGINT NULL"))
+    except Exception as e:
+        print("[migrate] captcha note:", e)
+
+    # ✅ ensure promo_settings.next_send_at (+ điền sẵn cho nhóm đang bật)
+    try:
+        cols_promo = {c["name"] for c in insp.get_columns("promo_settings")}
+        if "next_send_at" not in cols_promo:
+            with engine.begin() as conn:
+                conn.execute(text("ALTER TABLE promo_settings ADD COLUMN next_send_at TIMESTAMP NULL"))
+            db = SessionLocal()
+            try:
+                now = now_utc()
+                for ps in db.query(PromoSetting).filter(PromoSetting.is_enabled == True).all():
+                    if ps.content and (ps.interval_minutes or 0) >= 10:
+                        last = ps.last_sent_at.replace(tzinfo=None) if ps.last_sent_at else None
+                        ps.next_send_at = last + timedelta(minutes=ps.interval_minutes) if last else now
+                db.commit()
+            finally:
+                db.close()
+    except Exception as e:
+        print("[migrate] promo_settings.next_send_at note:", e)
+
+    _run_upgrades()
+
+    # ensure indexes: create_all không thêm index mới vào bảng đã tồn tại.
+    # Chỉ index thường — unique index cần gộp dòng trùng trước nên nằm trong _UPGRADES.
+    for table in Base.metadata.sorted_tables:
+        for idx in table.indexes:
+            if idx.unique:
+                continue
+            try:
+                idx.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                print(f"[migrate] index {idx.name} note:", e)
+
+
+
+# ===== NÂNG CẤP SCHEMA CÓ ĐÁNH SỐ =====
+# Mỗi bước chạy đúng 1 lần / DB (số bản lưu ở bảng schema_version), trong 1
+# transaction. Thêm bước mới: viết _upgrade_N(conn) rồi nối vào _UPGRADES.
+def _dedupe(conn, table: str, *cols: str) -> int:
+    """Giữ dòng id nhỏ nhất của mỗi nhóm trùng `cols` (trước khi tạo unique index)."""
+    key = ", ".join(cols)
+    res = conn.execute(text(
+        f"DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {key})"
+    ))
+    return res.rowcount or 0
+
+def _upgrade_1(conn) -> None:
+    """Index ghép theo đúng dạng query nóng (thay vì chỉ có index từng cột)."""
+    for table, cols in (("blacklists", ("chat_id", "user_id")),
+                        ("whitelist", ("chat_id", "domain")),
+                        ("captcha", ("chat_id", "user_id"))):
+        n = _dedupe(conn, table, *cols)
+        if n:
+            print(f"[migrate] {table}: removed {n} duplicate rows")
+    for name in ("uq_blacklists_chat_user", "uq_whitelist_chat_domain", "uq_captcha_chat_user",
+                 "ix_warnings_chat_count", "ix_violation_logs_chat_created_rule"):
+        idx = next(i for t in Base.metadata.sorted_tables for i in t.indexes if i.name == name)
+        idx.create(bind=conn, checkfirst=True)
+
+def _upgrade_2(conn) -> None:
+    """Gộp dòng warnings trùng (chat_id, user_id) — cộng count, giữ last_warned mới nhất — rồi tạo unique index."""
+    conn.execute(text(
+        "UPDATE warnings SET "
+        "count = (SELECT SUM(w2.count) FROM warnings w2 "
+        "         WHERE w2.chat_id = warnings.chat_id AND w2.user_id = warnings.user_id), "
+        "last_warned = (SELECT MAX(w2.last_warned) FROM warnings w2 "
+        "               WHERE w2.chat_id = warnings.chat_id AND w2.user_id = warnings.user_id) "
+        "WHERE id IN (SELECT MIN(id) FROM warnings GROUP BY chat_id, user_id HAVING COUNT(*) > 1)"
+    ))
+    n = _dedupe(conn, "warnings", "chat_id", "user_id")
+    if n:
+        print(f"[migrate] warnings: merged {n} duplicate rows")
+    idx = next(i for i in Warning.__table__.indexes if i.name == "uq_warnings_chat_user")
+    idx.create(bind=conn, checkfirst=True)
+
+def _upgrade_3(conn) -> None:
+    """settings.dupspam (mặc định tắt: nhóm tự bật chặn spam rải nhiều nhóm)."""
+    if "dupspam" not in {c["name"] for c in inspect(conn).get_columns("settings")}:
+        conn.execute(text("ALTER TABLE settings ADD COLUMN dupspam BOOLEAN DEFAULT FALSE"))
+
+_UPGRADES = [
+    (1, "composite indexes", _upgrade_1),
+    (2, "unique warnings per chat/user", _upgrade_2),
+    (3, "settings.dupspam", _upgrade_3),
+]
+SCHEMA_VERSION = _UPGRADES[-1][0]
+
+def _run_upgrades() -> None:
+    with engine.begin() as conn:
+        current = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    for version, name, fn in _UPGRADES:
+        if version <= current:
+            continue
+        try:
+            with engine.begin() as conn:
+                fn(conn)
+                conn.execute(text("DELETE FROM schema_version"))
+                conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": version})
+            print(f"[migrate] schema v{version}: {name}")
+        except Exception as e:
+            # bản lỗi đã rollback: không khởi động trên schema nửa vời, lần sau chạy lại từ đây
+            print(f"[migrate] schema v{version} ({name}) failed:", e)
+            raise RuntimeError(f"schema upgrade v{version} ({name}) failed") from e
 
 # ===== HELPERS =====
 def count_users(db_sess: Optional[SessionLocal] = None) -> int:
@@ -223,15 +378,48 @@ def get_support_enabled(db: SessionLocal, chat_id: int) -> bool:
 def list_supporters(db: SessionLocal, chat_id: int) -> list[int]:
     return [r.user_id for r in db.query(Supporter).filter_by(chat_id=chat_id).all()]
 
+# --- Cấu hình theo nhóm (1 dòng / chat_id: Setting, AutoBanConfig, PromoSetting, SupportSetting) ---
+def dialect_insert():
+    """insert() hỗ trợ ON CONFLICT của dialect hiện tại; None nếu DB không hỗ trợ."""
+    return {"sqlite": sqlite_insert, "postgresql": pg_insert}.get(engine.dialect.name)
+
+def upsert_config(db: SessionLocal, model, chat_id: int, defaults: Optional[dict] = None, **fields):
+    """
+    Tạo-hoặc-sửa dòng cấu hình của nhóm bằng 1 câu lệnh:
+    INSERT … ON CONFLICT (chat_id) DO UPDATE SET <fields> RETURNING *.
+    `defaults` chỉ dùng khi dòng mới được tạo. Không commit (để gộp chung
+    transaction với việc khác).
+    """
+    ins = dialect_insert()
+    if ins is None:
+        row = db.query(model).filter_by(chat_id=chat_id).one_or_none()
+        if row is None:
+            row = model(chat_id=chat_id, **(defaults or {}))
+            db.add(row)
+        for k, v in fields.items():
+            setattr(row, k, v)
+        db.flush()
+        return row
+    stmt = ins(model).values(chat_id=chat_id, **{**(defaults or {}), **fields})
+    # không có field nào → "sửa" chat_id thành chính nó để RETURNING vẫn trả dòng cũ
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["chat_id"], set_=fields or {"chat_id": stmt.excluded.chat_id}
+    ).returning(model)
+    return db.scalars(stmt, execution_options={"populate_existing": True}).one()
+
+def get_config(db: SessionLocal, model, chat_id: int):
+    """Đọc dòng cấu hình; chưa có thì tạo (mặc định theo cột) và commit."""
+    row = db.query(model).filter_by(chat_id=chat_id).one_or_none()
+    if row is None:
+        row = upsert_config(db, model, chat_id)
+        db.commit()
+    return row
+
 # --- Welcome TTL ---
 def get_welcome_ttl(chat_id: int) -> int:
     db = SessionLocal()
     try:
-        s = db.query(Setting).filter_by(chat_id=chat_id).one_or_none()
-        if not s:
-            s = Setting(chat_id=chat_id, welcome_ttl=900)
-            db.add(s); db.commit(); db.refresh(s)
-        return int(getattr(s, "welcome_ttl", 900) or 0)
+        return int(get_config(db, Setting, chat_id).welcome_ttl or 0)
     finally:
         db.close()
 
@@ -239,22 +427,14 @@ def set_welcome_ttl(chat_id: int, seconds: int) -> int:
     secs = max(0, int(seconds))
     db = SessionLocal()
     try:
-        s = db.query(Setting).filter_by(chat_id=chat_id).one_or_none()
-        if not s:
-            s = Setting(chat_id=chat_id)
-            db.add(s); db.commit(); db.refresh(s)
-        s.welcome_ttl = secs
+        upsert_config(db, Setting, chat_id, welcome_ttl=secs)
         db.commit()
         return secs
     finally:
         db.close()
 # ===== AutoBan helpers =====
 def get_or_create_autoban(db: SessionLocal, chat_id: int) -> AutoBanConfig:
-    row = db.query(AutoBanConfig).filter_by(chat_id=chat_id).one_or_none()
-    if not row:
-        row = AutoBanConfig(chat_id=chat_id)
-        db.add(row); db.commit(); db.refresh(row)
-    return row
+    return get_config(db, AutoBanConfig, chat_id)
 
 def log_violation(db: SessionLocal, chat_id: int, user_id: int, rule: str, snippet: str = ""):
     snippet = (snippet or "").strip()
@@ -291,11 +471,7 @@ def violations_summary(db: SessionLocal, chat_id: int, year: int, month: int):
 def set_welcome_message(chat_id: int, text: str) -> None:
     db = SessionLocal()
     try:
-        s = db.query(Setting).filter_by(chat_id=chat_id).one_or_none()
-        if not s:
-            s = Setting(chat_id=chat_id)
-            db.add(s)
-        s.welcome_text = (text or "").strip() or None
+        upsert_config(db, Setting, chat_id, welcome_text=(text or "").strip() or None)
         db.commit()
     finally:
         db.close()
@@ -0,0 +1,191 @@
+# core/raid.py
+"""
+Phát hiện raid theo tốc độ toàn nhóm (FLOOD chỉ nhìn từng user).
+
+Mỗi nhóm giữ 3 bộ đếm cửa sổ trượt bộ nhớ cố định (vòng RAID_BUCKETS ô):
+  - joins     : số người vào nhóm
+  - newbies   : số tin của người mới vào (< RAID_NEWBIE_AGE giây)
+  - dup_links : số tin chứa đúng link (URL) vừa xuất hiện trong nhóm
+Vượt ngưỡng → nhóm vào chế độ khoá (lockdown) RAID_LOCKDOWN giây: người mới
+bị restrict tới hết khoá, antilink bị ép bật. Hết hạn tự mở (không cần lệnh).
+
+Mọi phép cập nhật là O(1) nên gọi được trên mọi tin nhắn; chạy trên 1 event
+loop nên không cần lock.
+"""
+import os
+import time
+from collections import OrderedDict
+from itertools import islice
+
+from core.flood import _pack
+
+RAID_WINDOW = float(os.getenv("RAID_WINDOW", "10"))            # giây
+RAID_BUCKETS = int(os.getenv("RAID_BUCKETS", "10"))
+RAID_JOINS = int(os.getenv("RAID_JOINS", "15"))                 # người vào / cửa sổ
+RAID_NEW_MSGS = int(os.getenv("RAID_NEW_MSGS", "30"))           # tin của người mới / cửa sổ
+RAID_DUP_LINKS = int(os.getenv("RAID_DUP_LINKS", "5"))          # tin có link trùng / cửa sổ
+RAID_NEWBIE_AGE = float(os.getenv("RAID_NEWBIE_AGE", "300"))    # giây kể từ lúc vào nhóm
+RAID_LOCKDOWN = float(os.getenv("RAID_LOCKDOWN", "600"))        # giây khoá nhóm
+RAID_MAX_CHATS = int(os.getenv("RAID_MAX_CHATS", "10000"))
+RAID_MAX_NEWBIES = int(os.getenv("RAID_MAX_NEWBIES", "100000"))
+_LINKS_PER_CHAT = 64
+
+
+class SlidingCounter:
+    """Đếm sự kiện trong `window` giây gần nhất bằng vòng `buckets` ô."""
+
+    __slots__ = ("_slots", "_width", "_head", "_total")
+
+    def __init__(self, window: float, buckets: int):
+        self._slots = [0] * buckets
+        self._width = window / buckets
+        self._head = 0          # chỉ số ô tuyệt đối mới nhất
+        self._total = 0
+
+    def add(self, now: float, n: int = 1) -> int:
+        b = int(now / self._width)
+        size = len(self._slots)
+        if b != self._head:
+            steps = b - self._head
+            if steps >= size:
+                self._slots = [0] * size
+                self._total = 0
+            else:
+                for i in range(self._head + 1, b + 1):
+                    j = i % size
+                    self._total -= self._slots[j]
+                    self._slots[j] = 0
+            self._head = b
+        self._slots[b % size] += n
+        self._total += n
+        return self._total
+
+
+class _ChatState:
+    __slots__ = ("joins", "newbies", "dup_links", "links", "locked_until")
+
+    def __init__(self, window: float, buckets: int):
+        self.joins = SlidingCounter(window, buckets)
+        self.newbies = SlidingCounter(window, buckets)
+        self.dup_links = SlidingCounter(window, buckets)
+        self.links: "OrderedDict[str, float]" = OrderedDict()   # url -> lần thấy gần nhất
+        self.locked_until = 0.0
+
+
+class RaidDetector:
+    def __init__(self, window: float = RAID_WINDOW, buckets: int = RAID_BUCKETS,
+                 lockdown: float = RAID_LOCKDOWN, clock=time.monotonic):
+        self.window = window
+        self.buckets = buckets
+        self.lockdown = lockdown
+        self._clock = clock
+        self._chats: "OrderedDict[int, _ChatState]" = OrderedDict()
+        self._joined: dict[int, float] = {}     # _pack(chat, user) -> lúc vào nhóm
+        self.stats = {"lockdowns": 0, "extended": 0}
+
+    def _state(self, chat_id: int) -> _ChatState:
+        st = self._chats.get(chat_id)
+        if st is None:
+            st = self._chats[chat_id] = _ChatState(self.window, self.buckets)
+            if len(self._chats) > RAID_MAX_CHATS:
+                # bỏ nhóm ít hoạt động nhất, trừ nhóm đang khoá
+                for cid in list(islice(self._chats, len(self._chats) - RAID_MAX_CHATS)):
+                    if self._chats[cid].locked_until <= self._clock():
+                        del self._chats[cid]
+        else:
+            self._chats.move_to_end(chat_id)
+        return st
+
+    def _trip(self, st: _ChatState, now: float, reason: str):
+        """Khoá/gia hạn khoá; trả về `reason` nếu nhóm vừa chuyển sang khoá."""
+        started = st.locked_until <= now
+        st.locked_until = now + self.lockdown
+        self.stats["lockdowns" if started else "extended"] += 1
+        return reason if started else None
+
+    # ----- đọc -----
+    def locked(self, chat_id: int) -> bool:
+        st = self._chats.get(chat_id)
+        return bool(st) and st.locked_until > self._clock()
+
+    def remaining(self, chat_id: int) -> float:
+        st = self._chats.get(chat_id)
+        return max(0.0, st.locked_until - self._clock()) if st else 0.0
+
+    # ----- cập nhật -----
+    def on_join(self, chat_id: int, user_ids: list[int]):
+        """Ghi nhận người vào; trả về lý do nếu nhóm vừa bị khoá (None nếu không)."""
+        now = self._clock()
+        for uid in user_ids:
+            self._joined[_pack(chat_id, uid)] = now
+        if len(self._joined) > RAID_MAX_NEWBIES:
+            for k in list(islice(self._joined, len(self._joined) - RAID_MAX_NEWBIES + RAID_MAX_NEWBIES // 10)):
+                del self._joined[k]
+        st = self._state(chat_id)
+        if st.joins.add(now, len(user_ids)) >= RAID_JOINS:
+            return self._trip(st, now, "joins")
+        return None
+
+    def on_message(self, chat_id: int, user_id: int, links=()):
+        """Ghi nhận 1 tin (kèm các URL trong tin); trả về lý do nếu nhóm vừa bị khoá."""
+        now = self._clock()
+        tripped = None
+        joined = self._joined.get(_pack(chat_id, user_id))
+        st = None
+        if joined is not None:
+            if now - joined < RAID_NEWBIE_AGE:
+                st = self._state(chat_id)
+                if st.newbies.add(now) >= RAID_NEW_MSGS:
+                    tripped = self._trip(st, now, "newbies")
+            else:
+                del self._joined[_pack(chat_id, user_id)]
+        if links:
+            st = st or self._state(chat_id)
+            dup = False
+            for url in links:
+                url = url.lower()
+                seen = st.links.pop(url, None)
+                if seen is not None and now - seen < self.window:
+                    dup = True
+                st.links[url] = now
+            while len(st.links) > _LINKS_PER_CHAT:
+                st.links.popitem(last=False)
+            if dup and st.dup_links.add(now) >= RAID_DUP_LINKS:
+                tripped = self._trip(st, now, "dup_links") or tripped
+        return tripped
+
+
+RAID = RaidDetector()
+
+_REASONS = {
+    "joins": "nhiều người vào cùng lúc",
+    "newbies": "người mới nhắn tin dồn dập",
+    "dup_links": "link trùng lặp hàng loạt",
+}
+
+
+async def start_lockdown(context, chat_id: int, reason: str) -> None:
+    """Báo nhóm đang khoá + hẹn job mở khoá (RAID tự hết hạn, job chỉ để báo)."""
+    mins = max(1, round(RAID.lockdown / 60))
+    try:
+        await context.bot.send_message(
+            chat_id,
+            f"🚨 Phát hiện dấu hiệu raid ({_REASONS.get(reason, reason)}). "
+            f"Khoá nhóm {mins} phút: thành viên mới bị hạn chế, mọi link bị chặn."
+        )
+    except Exception as e:
+        print("Raid notice failed:", e)
+    context.job_queue.run_once(_lockdown_end_job, when=RAID.remaining(chat_id), chat_id=chat_id,
+                               name=f"raid_end:{chat_id}")
+
+
+async def _lockdown_end_job(context) -> None:
+    chat_id = context.job.chat_id
+    left = RAID.remaining(chat_id)
+    if left > 0:   # raid còn tiếp → khoá đã được gia hạn
+        context.job_queue.run_once(_lockdown_end_job, when=left, chat_id=chat_id, name=f"raid_end:{chat_id}")
+        return
+    try:
+        await context.bot.send_message(chat_id, "✅ Đã hết khoá chống raid, nhóm hoạt động bình thường.")
+    except Exception:
+        pass
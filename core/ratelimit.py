@@ -0,0 +1,63 @@
+# core/ratelimit.py
+"""
+Giới hạn tốc độ gửi tin chủ động của bot (quảng cáo, lời chào…).
+
+Telegram cho bot ~30 tin/giây trên toàn bộ và ~20 tin/phút trong 1 nhóm;
+vượt là bị 429 (RetryAfter). Giống core/flood.py, mỗi khoá chỉ giữ 1 số
+float "theoretical arrival time": `wait(chat_id)` đặt chỗ cho slot sớm nhất
+thoả cả giới hạn chung lẫn giới hạn của nhóm rồi ngủ tới đúng slot đó.
+Chạy trên 1 event loop nên không cần lock.
+"""
+import asyncio
+import os
+import time
+
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))        # tin/giây cho cả bot
+TG_CHAT_INTERVAL = float(os.getenv("TG_CHAT_INTERVAL", "3"))     # giây giữa 2 tin trong 1 nhóm
+
+
+def retry_after_seconds(err) -> float:
+    ra = getattr(err, "retry_after", 1)
+    return ra.total_seconds() if hasattr(ra, "total_seconds") else float(ra)
+
+
+class SendLimiter:
+    def __init__(self, global_rate: float = TG_GLOBAL_RATE, chat_interval: float = TG_CHAT_INTERVAL,
+                 clock=time.monotonic):
+        self.interval = 1.0 / global_rate
+        self.chat_interval = chat_interval
+        self._clock = clock
+        self._tat = 0.0                       # slot chung kế tiếp
+        self._chats: dict[int, float] = {}    # chat_id -> slot kế tiếp của nhóm
+        self.stats = {"waits": 0, "waited": 0.0, "backoffs": 0}
+
+    def reserve(self, chat_id: int) -> float:
+        """Đặt chỗ slot gửi kế tiếp cho chat; trả về số giây phải chờ."""
+        now = self._clock()
+        # slot chung tính riêng: nhóm đang phải chờ (giãn cách / 429) không đẩy lùi nhóm khác
+        slot = max(now, self._tat)
+        self._tat = slot + self.interval
+        at = max(slot, self._chats.get(chat_id, 0.0))
+        self._chats[chat_id] = at + self.chat_interval
+        if len(self._chats) > 10_000:
+            self._chats = {k: v for k, v in self._chats.items() if v > now}
+        return at - now
+
+    async def wait(self, chat_id: int) -> None:
+        delay = self.reserve(chat_id)
+        if delay > 0:
+            self.stats["waits"] += 1
+            self.stats["waited"] += delay
+            await asyncio.sleep(delay)
+
+    def backoff(self, seconds: float, chat_id: int | None = None) -> None:
+        """Sau 429: dời mọi lượt gửi (hoặc chỉ của 1 nhóm) ra sau `seconds`."""
+        until = self._clock() + seconds
+        self.stats["backoffs"] += 1
+        if chat_id is None:
+            self._tat = max(self._tat, until)
+        else:
+            self._chats[chat_id] = max(self._chats.get(chat_id, 0.0), until)
+
+
+SEND_LIMITER = SendLimiter()
@@ -0,0 +1,188 @@
+# core/rules.py
+"""
+Bộ luật đã "biên dịch" cho từng nhóm (ChatRuleSet).
+
+`guard` chạy trên MỌI tin nhắn thường, nên thay vì mỗi tin lại query
+Setting / Filter / Whitelist / SupportSetting / Supporter, ta dựng 1 snapshot
+cho mỗi chat rồi giữ trong LRU có TTL. Mọi lệnh admin sửa các bảng này phải
+gọi `invalidate_rules(chat_id)` — riêng các dòng cấu hình ghi qua
+core/config_repo.py thì được ghi thẳng vào snapshot (`write_through`).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from core.db import run_sync
+from core.domains import DomainTrie
+from core.keywords import KeywordMatcher
+from core.models import (
+    SessionLocal, Setting, Filter, Whitelist, SupportSetting, Supporter,
+    AutoBanConfig, get_config,
+)
+
+RULES_CACHE_SIZE = int(os.getenv("RULES_CACHE_SIZE", "5000"))
+RULES_CACHE_TTL = float(os.getenv("RULES_CACHE_TTL", "300"))  # giây
+
+
+class ChatRuleSet:
+    """Snapshot chỉ-đọc các luật của 1 nhóm (không giữ ORM object)."""
+
+    __slots__ = (
+        "chat_id", "antilink", "antimention", "antiforward",
+        "flood_limit", "flood_mode", "nobots", "antispam", "dupspam", "captcha",
+        "filters", "whitelist", "support_enabled", "supporters",
+        "autoban_enabled", "warn_threshold", "ban_threshold", "mute_minutes",
+        "welcome_text", "welcome_ttl", "_keywords",
+    )
+
+    def __init__(self, chat_id: int, setting: Setting,
+                 filters: list[tuple[int, str]], whitelist: DomainTrie,
+                 support_enabled: bool, supporters: frozenset[int],
+                 autoban: AutoBanConfig | None = None):
+        self.chat_id = chat_id
+        self._apply_setting(setting)
+        self.filters = filters                  # [(filter_id, pattern_lower)]
+        self.whitelist = whitelist              # trie nhãn đảo ngược
+        self.support_enabled = support_enabled
+        self.supporters = supporters
+        self._apply_autoban(autoban)
+        self._keywords = None
+
+    def _apply_setting(self, setting: Setting) -> None:
+        self.antilink = bool(setting.antilink)
+        self.antimention = bool(setting.antimention)
+        self.antiforward = bool(setting.antiforward)
+        self.flood_limit = int(setting.flood_limit or 3)
+        self.flood_mode = setting.flood_mode or "mute"
+        self.nobots = bool(setting.nobots)
+        self.antispam = bool(setting.antispam)
+        self.dupspam = bool(setting.dupspam)
+        self.captcha = bool(setting.captcha)
+        self.welcome_text = setting.welcome_text or None   # mẫu lời chào ({name})
+        self.welcome_ttl = int(setting.welcome_ttl or 0)   # giây; 0 = không auto-xoá
+
+    def _apply_autoban(self, autoban: AutoBanConfig | None) -> None:
+        self.autoban_enabled = bool(autoban and autoban.enabled)
+        self.warn_threshold = int(autoban.warn_threshold or 3) if autoban else 3
+        self.ban_threshold = int(autoban.ban_threshold or 5) if autoban else 5
+        self.mute_minutes = int(autoban.mute_minutes or 0) if autoban else 1440
+
+    def replace(self, setting: Setting | None = None, autoban: AutoBanConfig | None = None,
+                support: tuple[bool, frozenset[int]] | None = None) -> "ChatRuleSet":
+        """Bản sao với phần cấu hình mới (snapshot cũ không bị sửa → reader đang giữ vẫn an toàn)."""
+        rs = object.__new__(ChatRuleSet)
+        for name in self.__slots__:
+            setattr(rs, name, getattr(self, name))
+        if setting is not None:
+            rs._apply_setting(setting)
+        if autoban is not None:
+            rs._apply_autoban(autoban)
+        if support is not None:
+            rs.support_enabled, rs.supporters = support
+        return rs
+
+    @property
+    def keywords(self) -> KeywordMatcher:
+        # dựng lười: nhóm không có tin nhắn thì không tốn công build automaton
+        if self._keywords is None:
+            self._keywords = KeywordMatcher(self.filters)
+        return self._keywords
+
+    def is_supporter(self, user_id: int) -> bool:
+        return self.support_enabled and user_id in self.supporters
+
+
+def build_ruleset(db: SessionLocal, chat_id: int) -> ChatRuleSet:
+    s = get_config(db, Setting, chat_id)
+    filters = [
+        (f.id, f.pattern.lower())
+        for f in db.query(Filter).filter_by(chat_id=chat_id).all()
+        if f.pattern
+    ]
+    whitelist = DomainTrie(
+        w.domain for w in db.query(Whitelist).filter_by(chat_id=chat_id).all()
+    )
+    sup = db.query(SupportSetting).filter_by(chat_id=chat_id).one_or_none()
+    support_enabled = bool(sup and sup.is_enabled)
+    supporters = frozenset(
+        r.user_id for r in db.query(Supporter).filter_by(chat_id=chat_id).all()
+    ) if support_enabled else frozenset()
+    autoban = db.query(AutoBanConfig).filter_by(chat_id=chat_id).one_or_none()
+    return ChatRuleSet(chat_id, s, filters, whitelist, support_enabled, supporters, autoban)
+
+
+# ===== LRU + TTL cache =====
+_RULES: "OrderedDict[int, tuple[float, ChatRuleSet]]" = OrderedDict()
+_LOCK = threading.Lock()
+_GEN = 0    # tăng mỗi lần invalidate/write_through → bỏ snapshot đang dựng dở từ dữ liệu cũ
+
+
+def _cached(chat_id: int) -> Optional[ChatRuleSet]:
+    with _LOCK:
+        hit = _RULES.get(chat_id)
+        if hit and hit[0] > time.monotonic():
+            _RULES.move_to_end(chat_id)
+            return hit[1]
+    return None
+
+
+def get_ruleset(chat_id: int, db: Optional[SessionLocal] = None) -> ChatRuleSet:
+    rs = _cached(chat_id)
+    if rs is not None:
+        return rs
+
+    now = time.monotonic()
+    gen = _GEN
+    sess = db or SessionLocal()
+    try:
+        rs = build_ruleset(sess, chat_id)
+    finally:
+        if db is None:
+            sess.close()
+
+    with _LOCK:
+        if gen != _GEN:
+            return rs
+        _RULES[chat_id] = (now + RULES_CACHE_TTL, rs)
+        _RULES.move_to_end(chat_id)
+        while len(_RULES) > RULES_CACHE_SIZE:
+            _RULES.popitem(last=False)
+    return rs
+
+
+async def aget_ruleset(chat_id: int) -> ChatRuleSet:
+    """Bản async cho handler: cache hit trả ngay, miss thì dựng trên thread pool DB."""
+    rs = _cached(chat_id)
+    if rs is not None:
+        return rs
+    return await run_sync(get_ruleset, chat_id)
+
+
+def write_through(chat_id: int, **parts) -> None:
+    """
+    Cập nhật snapshot đang cache sau khi đã commit dòng cấu hình
+    (`setting=` / `autoban=` / `support=(enabled, supporters)`), khỏi phải
+    dựng lại cả bộ luật. Chưa có trong cache thì thôi — lần đọc sau tự dựng.
+    """
+    global _GEN
+    with _LOCK:
+        _GEN += 1
+        hit = _RULES.get(chat_id)
+        if hit is not None:
+            _RULES[chat_id] = (hit[0], hit[1].replace(**parts))
+
+
+def invalidate_rules(chat_id: int) -> None:
+    global _GEN
+    with _LOCK:
+        _GEN += 1
+        _RULES.pop(chat_id, None)
+
+
+def clear_rules() -> None:
+    global _GEN
+    with _LOCK:
+        _GEN += 1
+        _RULES.clear()
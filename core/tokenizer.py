@@ -0,0 +1,140 @@
+# core/tokenizer.py
+"""
+Quét tin nhắn 1 lượt để lấy URL, host, mention và cờ "có link".
+
+Trước đây guard chạy LINK_RE, URL_RE, DOMAIN_RE, URL_RE.sub rồi MENTION_RE
+(4–5 lượt regex + 1 bản copy chuỗi). Ở đây gộp tất cả vào 1 regex tổng hợp,
+`finditer` đi qua văn bản đúng 1 lần; anti-link, whitelist và anti-mention
+dùng chung kết quả.
+
+Tin từ Telegram thường đã có sẵn MessageEntity (url, text_link, mention…),
+khi đó `scan_message` dùng luôn entity và không cần quét regex.
+"""
+import os
+import re
+from typing import Optional
+
+from core.domains import to_host
+
+# TLD mà LINK_RE cũ coi là "domain trần" (không cần http/www)
+LINK_TLDS = (
+    "com|net|org|vn|xyz|info|io|co|biz|me|app|site|top|store|ru|cn|uk|us"
+)
+BARE_LINK_RE = re.compile(rf"[a-z0-9-]+\.(?:{LINK_TLDS})", re.IGNORECASE)
+
+TOKEN_RE = re.compile(
+    r"(?P<url>https?://[^\s<>()]+|www\.[^\s<>()]+|t\.me/[^\s<>()]+)"
+    # chỉ "ăn" ký tự @ để phần sau vẫn được xét như domain (@abc.com)
+    r"|@(?=(?P<at>\w+))"
+    # bắt đầu ở đầu 1 cụm chữ-số ASCII (kể cả khi dính chữ có dấu: "đábc.com")
+    r"|(?<![a-z0-9])(?P<domain>[a-z0-9][a-z0-9\-\.]+\.[a-z]{2,})\b",
+    re.IGNORECASE,
+)
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class MessageScan:
+    __slots__ = ("urls", "hosts", "mentions", "has_link")
+
+    def __init__(self, urls=None, hosts=None, mentions=None, has_link=False):
+        self.urls: list[str] = urls or []
+        self.hosts: list[str] = hosts or []       # đã to_host(), không trùng, giữ thứ tự
+        self.mentions: list[str] = mentions or []  # dạng "@username"
+        self.has_link: bool = has_link
+
+    def __repr__(self) -> str:
+        return (f"MessageScan(urls={self.urls!r}, hosts={self.hosts!r}, "
+                f"mentions={self.mentions!r}, has_link={self.has_link})")
+
+
+EMPTY_SCAN = MessageScan()  # dùng chung, không được sửa
+
+
+def _add_host(hosts: list[str], raw: str) -> None:
+    h = to_host(raw)
+    if h and h not in hosts:
+        hosts.append(h)
+
+
+def scan_text(text: str) -> MessageScan:
+    # tin thường không có ".", "@", "/" thì chắc chắn không có link/mention
+    if not text or ("." not in text and "@" not in text and "/" not in text):
+        return EMPTY_SCAN
+    urls, hosts, mentions = [], [], []
+    has_link = False
+    for m in TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        if kind == "url":
+            tok = m.group("url")
+            urls.append(tok)
+            _add_host(hosts, tok)
+            has_link = True
+        elif kind == "at":
+            # "a@b" (email) vẫn là link-like nhưng không phải mention
+            start = m.start()
+            if start == 0 or not _is_word_char(text[start - 1]):
+                mentions.append("@" + m.group("at"))
+            has_link = True
+        else:
+            tok = m.group("domain")
+            _add_host(hosts, tok)
+            if not has_link and BARE_LINK_RE.search(tok):
+                has_link = True
+    if not (urls or hosts or has_link):
+        return EMPTY_SCAN
+    return MessageScan(urls, hosts, mentions, has_link)
+
+
+# ===== Entity fast path =====
+# "entities": đọc MessageEntity Telegram gửi kèm, chỉ quét regex khi tin không có entity
+# "regex":    luôn quét bằng TOKEN_RE như trước
+LINK_DETECT_MODE = os.getenv("LINK_DETECT_MODE", "entities").strip().lower()
+
+_LINK_ENTITY_TYPES = ("url", "text_link", "mention", "text_mention", "email")
+
+
+def scan_entities(msg) -> Optional[MessageScan]:
+    """Dựng MessageScan từ msg.entities / msg.caption_entities; None nếu không có entity liên quan."""
+    if msg.text:
+        ents = getattr(msg, "entities", None)
+        parse = msg.parse_entities
+    else:
+        ents = getattr(msg, "caption_entities", None)
+        parse = msg.parse_caption_entities
+    if not ents or not any(e.type in _LINK_ENTITY_TYPES for e in ents):
+        return None
+
+    urls, hosts, mentions = [], [], []
+    has_link = False
+    for ent, value in parse(list(_LINK_ENTITY_TYPES)).items():
+        kind = ent.type
+        if kind == "url":
+            urls.append(value)
+            _add_host(hosts, value)
+            has_link = True
+        elif kind == "text_link":
+            # link ẩn sau chữ thường — regex trên text không thể thấy
+            urls.append(ent.url or "")
+            _add_host(hosts, ent.url or "")
+            has_link = True
+        elif kind == "email":
+            _add_host(hosts, value.rpartition("@")[2])
+            has_link = True
+        elif kind == "mention":
+            mentions.append(value)
+            has_link = True
+        else:  # text_mention: user không có username
+            mentions.append(value)
+    return MessageScan(urls, hosts, mentions, has_link)
+
+
+def scan_message(msg) -> MessageScan:
+    text = msg.text or msg.caption or ""
+    if LINK_DETECT_MODE == "entities":
+        scan = scan_entities(msg)
+        if scan is not None:
+            return scan
+    return scan_text(text)
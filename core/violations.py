@@ -0,0 +1,235 @@
+# core/violations.py
+"""
+Ghi vi phạm kiểu write-behind.
+
+Trước đây mỗi vi phạm = log_violation (commit) + đọc/sửa Warning (commit) +
+autoban (query) … tất cả chạy ngay trong handler async. Khi bị raid, event loop
+phải chờ fsync liên tục. Ở đây:
+
+- `record()` chỉ xếp ViolationLog vào hàng đợi RAM và tăng bộ đếm cảnh cáo
+  trong RAM, trả về số cảnh cáo mới ngay lập tức.
+- `flush()` gom tất cả thành 1 transaction (insert hàng loạt + cộng dồn
+  Warning), được gọi định kỳ bởi JobQueue, khi hàng đợi đầy, và khi tắt bot.
+- Cộng dồn Warning là 1 UPSERT nguyên tử (`upsert_warnings`) nên nhiều tiến
+  trình / flush chồng nhau không làm mất cảnh cáo hay tạo dòng trùng.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import insert, update
+
+from core.db import run_sync
+from core.models import SessionLocal, Warning, ViolationLog, now_utc, dialect_insert
+
+VIOLATION_FLUSH_INTERVAL = float(os.getenv("VIOLATION_FLUSH_INTERVAL", "2"))   # giây
+VIOLATION_MAX_PENDING = int(os.getenv("VIOLATION_MAX_PENDING", "500"))
+WARN_COUNT_CACHE = int(os.getenv("WARN_COUNT_CACHE", "100000"))
+VIOLATION_MAX_RETRIES = int(os.getenv("VIOLATION_MAX_RETRIES", "5"))     # flush lỗi liên tiếp → bỏ lô
+VIOLATION_MAX_BUFFER = int(os.getenv("VIOLATION_MAX_BUFFER", "20000"))   # trần số log chờ ghi khi DB lỗi
+
+
+def _snippet(text: str) -> str:
+    s = (text or "").strip()
+    return s[:509] + "..." if len(s) > 512 else s
+
+
+def upsert_warnings(db, rows: list[dict]) -> dict[tuple[int, int], int]:
+    """
+    Cộng dồn cảnh cáo bằng 1 câu lệnh nguyên tử:
+    INSERT … ON CONFLICT (chat_id, user_id) DO UPDATE SET count = count + excluded.count
+    RETURNING count — dựa trên unique index uq_warnings_chat_user. Trả về tổng mới.
+    """
+    ins = dialect_insert()
+    if ins is not None:
+        ins = ins(Warning.__table__)
+        stmt = ins.on_conflict_do_update(
+            index_elements=["chat_id", "user_id"],
+            set_={"count": Warning.__table__.c["count"] + ins.excluded["count"],
+                  "last_warned": ins.excluded["last_warned"]},
+        ).returning(Warning.chat_id, Warning.user_id, Warning.count)
+        return {(c, u): n for c, u, n in db.execute(stmt, rows)}
+    # DB khác: UPDATE trước, dòng chưa có thì INSERT
+    for r in rows:
+        res = db.execute(
+            update(Warning.__table__)
+            .where(Warning.chat_id == r["chat_id"], Warning.user_id == r["user_id"])
+            .values(count=Warning.count + r["count"], last_warned=r["last_warned"])
+        )
+        if not res.rowcount:
+            db.execute(insert(Warning), r)
+    return {}
+
+
+class ViolationWriter:
+    def __init__(self, max_pending: int = VIOLATION_MAX_PENDING, cache_size: int = WARN_COUNT_CACHE):
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._logs: list[dict] = []
+        self._deltas: dict[tuple[int, int], int] = {}          # cảnh cáo chưa ghi DB
+        self._counts: "OrderedDict[tuple[int, int], int]" = OrderedDict()  # tổng = DB + pending
+        # flush có thể chạy song song trên thread pool DB → chỉ 1 flush ghi DB mỗi lúc
+        self._flush_lock = threading.Lock()
+        self._failures = 0                                    # số flush lỗi liên tiếp
+        self.stats = {"flushes": 0, "rows": 0, "errors": 0, "dropped": 0}
+
+    # ----- đọc -----
+    def _load(self, key: tuple[int, int]) -> int:
+        db = SessionLocal()
+        try:
+            w = db.query(Warning).filter_by(chat_id=key[0], user_id=key[1]).first()
+        finally:
+            db.close()
+        return int(w.count or 0) if w else 0
+
+    def warning_count(self, chat_id: int, user_id: int) -> int:
+        key = (chat_id, user_id)
+        with self._lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                return self._counts[key]
+        n = self._load(key)
+        with self._lock:
+            return self._counts.setdefault(key, n)
+
+    # ----- ghi -----
+    def add_warning(self, chat_id: int, user_id: int, n: int = 1) -> int:
+        """Tăng cảnh cáo trong RAM, trả về tổng mới."""
+        key = (chat_id, user_id)
+        loaded = self.warning_count(chat_id, user_id)  # nạp từ DB nếu chưa có trong cache
+        with self._lock:
+            # key có thể vừa bị _trim của thread khác bỏ ra (không còn pending) → dùng số vừa đọc
+            total = self._counts.get(key, loaded) + n
+            self._counts[key] = total
+            self._counts.move_to_end(key)
+            self._deltas[key] = self._deltas.get(key, 0) + n
+            self._trim()
+            full = len(self._deltas) + len(self._logs) >= self.max_pending
+        if full:
+            self.flush()
+        return total
+
+    def _append_log(self, chat_id: int, user_id: int, rule: str, snippet: str) -> None:
+        with self._lock:
+            self._logs.append({
+                "chat_id": chat_id, "user_id": user_id, "rule": rule,
+                "snippet": _snippet(snippet), "created_at": now_utc(),
+            })
+
+    def record(self, chat_id: int, user_id: int, rule: str, snippet: str = "") -> int:
+        """Xếp 1 dòng ViolationLog + tăng cảnh cáo; trả về số cảnh cáo mới."""
+        self._append_log(chat_id, user_id, rule, snippet)
+        return self.add_warning(chat_id, user_id)
+
+    def log(self, chat_id: int, user_id: int, rule: str, snippet: str = "") -> None:
+        """Chỉ xếp 1 dòng ViolationLog, không tăng cảnh cáo (không kéo theo autoban)."""
+        self._append_log(chat_id, user_id, rule, snippet)
+        with self._lock:
+            full = len(self._deltas) + len(self._logs) >= self.max_pending
+        if full:
+            self.flush()
+
+    def reset(self, chat_id: int, user_id: int) -> None:
+        """Gọi sau khi /warn_clear đã đặt count = 0 trong DB."""
+        key = (chat_id, user_id)
+        with self._lock:
+            self._deltas.pop(key, None)
+            self._counts[key] = 0
+
+    def clear(self, db, chat_id: int, user_id: int) -> bool:
+        """Xoá cảnh cáo (DB + RAM) mà không để flush đang chạy ghi đè; True nếu có dòng."""
+        self.flush()
+        with self._flush_lock:
+            w = db.query(Warning).filter_by(chat_id=chat_id, user_id=user_id).first()
+            if w:
+                w.count = 0
+                db.commit()
+            self.reset(chat_id, user_id)
+        return w is not None
+
+    def _trim(self) -> None:
+        # chỉ bỏ key không còn pending để không mất cảnh cáo
+        while len(self._counts) > self.cache_size:
+            for key in self._counts:
+                if key not in self._deltas:
+                    del self._counts[key]
+                    break
+            else:
+                return
+
+    # ----- flush -----
+    def pending(self) -> int:
+        return len(self._logs) + len(self._deltas)
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        with self._lock:
+            logs, self._logs = self._logs, []
+            deltas, self._deltas = self._deltas, {}
+        if not logs and not deltas:
+            return 0
+
+        now = now_utc()
+        rows = [{"chat_id": k[0], "user_id": k[1], "count": d, "last_warned": now}
+                for k, d in deltas.items()]
+        db = SessionLocal()
+        try:
+            if logs:
+                db.execute(insert(ViolationLog), logs)
+            totals = upsert_warnings(db, rows) if rows else {}
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self.stats["errors"] += 1
+            self._failures += 1
+            if self._failures == 1:
+                print("[violations] flush error:", e)
+            if self._failures >= VIOLATION_MAX_RETRIES:
+                # lỗi lặp lại (vd. thiếu unique index) → bỏ lô thay vì thử lại mãi
+                print(f"[violations] dropped {len(logs)} logs + {len(deltas)} warning counters "
+                      f"after {self._failures} failed flushes:", e)
+                self.stats["dropped"] += len(logs) + len(deltas)
+                self._failures = 0
+                with self._lock:
+                    # bộ đếm RAM đang tính cả phần bị bỏ → đọc lại từ DB lần sau
+                    for k in deltas:
+                        if k not in self._deltas:
+                            self._counts.pop(k, None)
+                return 0
+            # trả lại hàng đợi để lần sau ghi tiếp (giữ tối đa VIOLATION_MAX_BUFFER log mới nhất)
+            with self._lock:
+                self._logs[:0] = logs
+                over = len(self._logs) - VIOLATION_MAX_BUFFER
+                if over > 0:
+                    del self._logs[:over]
+                    self.stats["dropped"] += over
+                for k, d in deltas.items():
+                    self._deltas[k] = self._deltas.get(k, 0) + d
+            return 0
+        finally:
+            db.close()
+        self._failures = 0
+
+        # đồng bộ cache với số trong DB (kể cả phần do tiến trình khác cộng vào)
+        with self._lock:
+            for key, total in totals.items():
+                if key in self._counts:
+                    self._counts[key] = total + self._deltas.get(key, 0)
+        self.stats["flushes"] += 1
+        self.stats["rows"] += len(logs) + len(deltas)
+        return len(logs) + len(deltas)
+
+
+VIOLATIONS = ViolationWriter()
+
+
+def flush_violations() -> int:
+    return VIOLATIONS.flush()
+
+
+async def violation_flush_job(context) -> None:
+    await run_sync(VIOLATIONS.flush)
@@ -0,0 +1,86 @@
+# core/welcome.py
+"""
+Gom lời chào khi nhiều người vào nhóm cùng lúc.
+
+Trước đây mỗi thành viên mới = 1 `send_message` + 1 lịch xoá; đợt mời hàng
+trăm người/phút thành hàng trăm lần gọi API. Ở đây người vào đầu tiên mở 1
+"cửa sổ" JOIN_WINDOW giây cho nhóm; ai vào trong cửa sổ chỉ được thêm vào bộ
+đệm. Hết cửa sổ gửi 1 lời chào nhắc tên tất cả (tách tin nếu vượt 4096 ký tự),
+mẫu lời chào + TTL lấy từ ChatRuleSet đã cache thay vì query DB mỗi lần.
+"""
+import asyncio
+import os
+
+from telegram.constants import MessageLimit, ParseMode
+from telegram.error import RetryAfter
+
+from core.deletions import DELETIONS
+from core.ratelimit import SEND_LIMITER, retry_after_seconds
+from core.rules import aget_ruleset
+
+JOIN_WINDOW = float(os.getenv("JOIN_WINDOW", "3"))   # giây gom thành viên mới trước khi chào
+
+
+def welcome_chunks(template: str, mentions: list[str], limit: int = MessageLimit.MAX_TEXT_LENGTH) -> list[str]:
+    """Thay {name} bằng danh sách tên, tách thành nhiều tin sao cho mỗi tin ≤ `limit`."""
+    k = template.count("{name}")
+    if not k:
+        return [template]
+    base = len(template) - k * len("{name}")
+    out, cur, size = [], [], 0
+    for m in mentions:
+        extra = len(m) + (2 if cur else 0)          # ", " giữa các tên
+        if cur and base + k * (size + extra) > limit:
+            out.append(template.replace("{name}", ", ".join(cur)))
+            cur, size, extra = [], 0, len(m)
+        cur.append(m)
+        size += extra
+    if cur:
+        out.append(template.replace("{name}", ", ".join(cur)))
+    return out
+
+
+class JoinBatcher:
+    def __init__(self, window: float = JOIN_WINDOW):
+        self.window = window
+        self._pending: dict[int, list[str]] = {}    # chat_id -> mention HTML đang chờ chào
+        self.stats = {"joins": 0, "batches": 0, "messages": 0, "failed": 0}
+
+    def add(self, app, chat_id: int, mentions: list[str]) -> None:
+        if not mentions:
+            return
+        self.stats["joins"] += len(mentions)
+        buf = self._pending.get(chat_id)
+        if buf is not None:
+            buf.extend(mentions)
+            return
+        self._pending[chat_id] = list(mentions)
+        app.create_task(self._flush_later(app.bot, chat_id))
+
+    async def _flush_later(self, bot, chat_id: int) -> None:
+        if self.window > 0:
+            await asyncio.sleep(self.window)
+        mentions = self._pending.pop(chat_id, [])
+        rs = await aget_ruleset(chat_id)
+        if not mentions or not rs.welcome_text:
+            return
+        self.stats["batches"] += 1
+        sent_ids = []
+        for text in welcome_chunks(rs.welcome_text, mentions):
+            await SEND_LIMITER.wait(chat_id)
+            try:
+                sent = await bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.HTML)
+            except RetryAfter as e:
+                SEND_LIMITER.backoff(retry_after_seconds(e), chat_id)
+                self.stats["failed"] += 1
+                continue
+            except Exception:
+                self.stats["failed"] += 1
+                continue
+            self.stats["messages"] += 1
+            sent_ids.append(sent.message_id)
+        if rs.welcome_ttl > 0:
+            await DELETIONS.schedule(chat_id, sent_ids, rs.welcome_ttl)
+
+
+JOINS = JoinBatcher()
@@ -3,7 +3,8 @@
 import sys
 sys.modules.pop("core.models", None)  # tránh import vòng khi redeploy
 
-import os, re, asyncio
+import asyncio
+import os, re
 from datetime import datetime, timezone, timedelta
 
 from telegram import (
@@ -14,19 +15,30 @@ from telegram.constants import ParseMode
 from telegram.error import Conflict
 from telegram.ext import (
     Application, CommandHandler, MessageHandler,
-    ContextTypes, filters, CallbackQueryHandler
+    ContextTypes, filters, CallbackQueryHandler, ChatMemberHandler
 )
 
 # models & helpers
 from core.models import (
     init_db, SessionLocal, Setting, Filter, Whitelist,
     User, count_users, Warning, Blacklist,
-    Supporter, SupportSetting, list_supporters, get_support_enabled,
-    get_or_create_autoban, log_violation
 )
 from core.lang import t, LANG
+from core.db import run_db, run_sync, shutdown_db_pool
+from core.rules import aget_ruleset, invalidate_rules
+from core.config_repo import get_setting, set_setting
+from core.domains import to_host
+from core.tokenizer import scan_message
+from core.admins import is_admin, on_chat_member_update
+from core.flood import FloodLimiter
+from core.dispatch import UPDATE_PROCESSOR
+from core.violations import VIOLATIONS, violation_flush_job, VIOLATION_FLUSH_INTERVAL
+from core.deletions import DELETIONS, deletion_tick_job, DELETE_TICK
+from core.joins import on_join, JOIN_STAGES
+from core.captcha import CAPTCHA, captcha_tick_job, CAPTCHA_TICK, CAPTCHA_TIMEOUT
+from core.raid import RAID, start_lockdown
+from core.fingerprint import SPAMPRINT
 from keep_alive_server import keep_alive
-from core.models import set_welcome_message, get_welcome_message
 
 # ====== CHO PHÉP NHỮNG LỆNH NÀO ======
 ALLOWED_COMMANDS = {
@@ -37,6 +49,7 @@ ALLOWED_COMMANDS = {
     "/antimention_on", "/antimention_off",
     "/antiforward_on", "/antiforward_off",
     "/nobots_on", "/nobots_off",
+    "/captcha_on", "/captcha_off",
     "/setflood",
     "/warn", "/warn_info", "/warn_clear", "/warn_top",
     "/trial", "/redeem", "/genkey",
@@ -46,6 +59,7 @@ ALLOWED_COMMANDS = {
     "/clear_cache",
     "/welcome_ttl",
     "/antispam_on", "/antispam_off",
+    "/dupspam_on", "/dupspam_off",
     "/log_view",
 }
 
@@ -55,49 +69,13 @@ OWNER_ID = int(os.getenv("OWNER_ID", "0"))
 CONTACT_USERNAME = os.getenv("CONTACT_USERNAME", "").strip()
 
 # ====== STATE ======
-FLOOD: dict[tuple[int,int], list[float]] = {}
+FLOOD = FloodLimiter()
 
 # ---------------- URL/DOMAIN HELPERS ----------------
 LINK_RE = re.compile(
     r"(https?://[^\s<>()]+|www\.[^\s<>()]+|t\.me/[^\s<>()]+|@\w+|[a-zA-Z0-9-]+\.(com|net|org|vn|xyz|info|io|co|biz|me|app|site|top|store|ru|cn|uk|us)(/[^\s<>()]+)?)",
     re.IGNORECASE
 )
-URL_RE = re.compile(r"(https?://[^\s<>()]+|www\.[^\s<>()]+|t\.me/[^\s<>()]+)", re.IGNORECASE)
-DOMAIN_RE = re.compile(r"\b([a-z0-9][a-z0-9\-\.]+\.[a-z]{2,})\b", re.IGNORECASE)
-MENTION_RE = re.compile(r"(?<!\w)@\w+", re.IGNORECASE)
-TRAILING_PUNCT_RE = re.compile(r"[),.;!?]+$")
-
-def to_host(domain_or_url: str) -> str:
-    s = (domain_or_url or "").strip().lower()
-    if not s:
-        return ""
-    s = TRAILING_PUNCT_RE.sub("", s)
-    s = re.sub(r"^https?://", "", s)
-    s = s.split("/")[0].split("?")[0].split("#")[0].strip()
-    if s.startswith("www."):
-        s = s[4:]
-    return s
-
-def extract_hosts(text: str) -> list[str]:
-    text = (text or "").strip()
-    hosts = []
-    for url in URL_RE.findall(text):
-        hosts.append(to_host(url))
-    for dom in DOMAIN_RE.findall(text):
-        hosts.append(to_host(dom))
-    out, seen = [], set()
-    for h in hosts:
-        if h and h not in seen:
-            out.append(h); seen.add(h)
-    return out
-
-def host_allowed(host: str, allow_list: list[str]) -> bool:
-    h = to_host(host)
-    for d in allow_list:
-        dd = to_host(d)
-        if dd and (h == dd or h.endswith("." + dd)):
-            return True
-    return False
 
 def remove_links(text: str) -> str:
     return re.sub(LINK_RE, "[link bị xóa]", text or "")
@@ -111,10 +89,11 @@ except Exception as e:
     register_clear_cache = lambda app: None
 
 try:
-    from pro.scheduler import attach_scheduler
+    from pro.scheduler import attach_scheduler, start_scheduler
 except Exception as e:
     print("pro.scheduler warn:", e)
     attach_scheduler = lambda app: None
+    start_scheduler = lambda app: None
 
 # ====== UPTIME ======
 START_AT = datetime.now(timezone.utc)
@@ -136,30 +115,19 @@ def get_settings(*args, **kwargs) -> Setting:
         chat_id = args[0]
         db = SessionLocal()
         try:
-            s = db.query(Setting).filter_by(chat_id=chat_id).one_or_none()
-            if not s:
-                s = Setting(
-                    chat_id=chat_id,
-                    antilink=True, antimention=True, antiforward=True,
-                    flood_limit=3, flood_mode="mute",
-                )
-                db.add(s); db.commit()
-            return s
+            return get_setting(db, chat_id)
         finally:
             db.close()
     if len(args) == 2:
         db, chat_id = args
-        s = db.query(Setting).filter_by(chat_id=chat_id).one_or_none()
-        if not s:
-            s = Setting(
-                chat_id=chat_id,
-                antilink=True, antimention=True, antiforward=True,
-                flood_limit=3, flood_mode="mute",
-            )
-            db.add(s); db.commit()
-        return s
+        return get_setting(db, chat_id)
     raise TypeError("get_settings() expected (chat_id) or (db, chat_id)")
 
+def _blacklist_add(db, chat_id: int, user_id: int) -> None:
+    if not db.query(Blacklist).filter_by(chat_id=chat_id, user_id=user_id).one_or_none():
+        db.add(Blacklist(chat_id=chat_id, user_id=user_id))
+        db.commit()
+
 # ====== ADMIN CHECK ======
 async def _must_admin_in_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     chat = update.effective_chat
@@ -167,8 +135,7 @@ async def _must_admin_in_group(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.effective_message.reply_text("⚠️ Lệnh này chỉ dùng trong nhóm.")
         return False
     try:
-        m = await context.bot.get_chat_member(chat.id, update.effective_user.id)
-        if m.status not in ("administrator", "creator"):
+        if not await is_admin(context.bot, chat.id, update.effective_user.id):
             await update.effective_message.reply_text("⚠️ Chỉ admin mới dùng lệnh này.")
             return False
         return True
@@ -216,12 +183,13 @@ def _get_target_user(update: Update, args) -> tuple[int | None, str]:
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     m = update.effective_message
     user = update.effective_user
-    db = SessionLocal()
-    u = db.get(User, user.id)
-    if not u:
-        u = User(id=user.id, username=user.username or "")
-        db.add(u); db.commit()
-    total = count_users(); db.close()
+
+    def _tx(db):
+        if not db.get(User, user.id):
+            db.add(User(id=user.id, username=user.username or ""))
+            db.commit()
+        return db.query(User).count()
+    total = await run_db(_tx)
 
     lang = USER_LANG.get(user.id, "vi")
     hello = t(lang, "start", name=user.first_name, count=total)
@@ -252,7 +220,7 @@ async def lang_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # ====== STATS / STATUS ======
 async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    total = count_users()
+    total = await run_sync(count_users)
     await update.effective_message.reply_text(f"📊 Tổng người dùng bot: {total:,}")
 
 async def status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -261,7 +229,16 @@ async def status_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     msg = await m.reply_text("⏳ Đang đo ping…")
     dt = (datetime.now(timezone.utc) - t0).total_seconds() * 1000
     up = datetime.now(timezone.utc) - START_AT
-    await msg.edit_text(f"✅ Online | 🕒 Uptime: {_fmt_td(up)} | 🏓 Ping: {dt:.0f} ms")
+    fs = FLOOD.stats()
+    us = UPDATE_PROCESSOR.stats()
+    js = JOIN_STAGES.stats().get("total", {"avg_ms": 0.0, "max_ms": 0.0})
+    await msg.edit_text(
+        f"✅ Online | 🕒 Uptime: {_fmt_td(up)} | 🏓 Ping: {dt:.0f} ms\n"
+        f"🌊 Flood keys: {fs['keys']:,} (peak {fs['peak_keys']:,}, evicted {fs['evicted_idle'] + fs['evicted_cap']:,})\n"
+        f"📥 Update queue: {us['depth']:,} (peak {us['peak_depth']:,}) | "
+        f"{us['active_chats']}/{us['max_concurrent']} chats đang xử lý\n"
+        f"👋 Join: {JOIN_STAGES.counts['events']:,} lượt, {js['avg_ms']:.1f} ms/lượt (max {js['max_ms']:.0f} ms)"
+    )
 
 async def uptime_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     up = datetime.now(timezone.utc) - START_AT
@@ -283,8 +260,7 @@ async def warn_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await msg.reply_text("Hãy reply vào tin có link rồi gõ /warn")
 
     try:
-        member = await context.bot.get_chat_member(chat_id, admin_user.id)
-        if member.status not in ("administrator", "creator"):
+        if not await is_admin(context.bot, chat_id, admin_user.id):
             return await msg.reply_text("Chỉ admin mới dùng lệnh này.")
     except Exception:
         return await msg.reply_text("Không thể kiểm tra quyền admin.")
@@ -293,15 +269,12 @@ async def warn_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     target_user = target_msg.from_user
     text = (target_msg.text or target_msg.caption or "")
 
-    if not LINK_RE.search(text):
+    scan = scan_message(target_msg)
+    if not scan.has_link:
         return await msg.reply_text("Tin được reply không chứa link.")
 
-    db = SessionLocal()
-
-    wl_hosts = [w.domain for w in db.query(Whitelist).filter_by(chat_id=chat_id).all()]
-    msg_hosts = extract_hosts(text)
-    if any(host_allowed(h, wl_hosts) for h in msg_hosts):
-        db.close()
+    whitelist = (await aget_ruleset(chat_id)).whitelist
+    if any(whitelist.allows(h) for h in scan.hosts):
         return await msg.reply_text("Domain này nằm trong whitelist, không cảnh báo.")
 
     try:
@@ -316,23 +289,16 @@ async def warn_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         pass
 
     # tăng cảnh cáo
-    w = db.query(Warning).filter_by(chat_id=chat_id, user_id=target_user.id).one_or_none()
-    if not w:
-        w = Warning(chat_id=chat_id, user_id=target_user.id, count=1)
-        db.add(w)
-    else:
-        w.count += 1
-        w.last_warned = datetime.now(timezone.utc)
-    db.commit()
+    count = await run_sync(VIOLATIONS.add_warning, chat_id, target_user.id)
 
     await context.bot.send_message(
         chat_id,
-        f"⚠️ <b>Cảnh báo:</b> <a href='tg://user?id={target_user.id}'>Người này</a> đã chia sẻ link không được phép. ({w.count}/3)",
+        f"⚠️ <b>Cảnh báo:</b> <a href='tg://user?id={target_user.id}'>Người này</a> đã chia sẻ link không được phép. ({count}/3)",
         parse_mode=ParseMode.HTML
     )
 
     try:
-        if 3 <= w.count < 5:
+        if 3 <= count < 5:
             until = datetime.now(timezone.utc) + timedelta(hours=24)
             await context.bot.restrict_chat_member(
                 chat_id, target_user.id,
@@ -340,13 +306,10 @@ async def warn_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 until_date=until
             )
             await context.bot.send_message(chat_id, "🚫 Người này bị cấm 24h do vi phạm nhiều lần (>=3).")
-        elif w.count >= 5:
+        elif count >= 5:
             await context.bot.ban_chat_member(chat_id, target_user.id)
             await context.bot.send_message(chat_id, "⛔️ Người này đã bị kick khỏi nhóm do tái phạm quá nhiều lần (>=5).")
-            bl = db.query(Blacklist).filter_by(chat_id=chat_id, user_id=target_user.id).one_or_none()
-            if not bl:
-                db.add(Blacklist(chat_id=chat_id, user_id=target_user.id))
-                db.commit()
+            await run_db(_blacklist_add, chat_id, target_user.id)
             await context.bot.send_message(
                 chat_id,
                 f"🚫 <b>Đã đưa vào danh sách đen:</b> <a href='tg://user?id={target_user.id}'>Người này</a>.",
@@ -355,8 +318,6 @@ async def warn_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         pass
 
-    db.close()
-
 # ====== WHITELIST ======
 async def wl_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await _must_admin_in_group(update, context):
@@ -368,31 +329,28 @@ async def wl_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
     domain = to_host(raw)
     if not domain:
         return await m.reply_text("Domain không hợp lệ.")
-    db = SessionLocal()
-    try:
-        chat_id = update.effective_chat.id
-        ex = db.query(Whitelist).filter_by(chat_id=chat_id, domain=domain).one_or_none()
-        if ex:
-            return await m.reply_text(f"Domain đã có trong whitelist: {domain}")
+    chat_id = update.effective_chat.id
+
+    def _tx(db):
+        if db.query(Whitelist).filter_by(chat_id=chat_id, domain=domain).one_or_none():
+            return None
         db.add(Whitelist(chat_id=chat_id, domain=domain))
         db.commit()
-        total = db.query(Whitelist).filter_by(chat_id=chat_id).count()
-        await m.reply_text(f"✅ Đã thêm whitelist: {domain}\nTổng whitelist của nhóm: {total}")
-    finally:
-        db.close()
+        invalidate_rules(chat_id)
+        return db.query(Whitelist).filter_by(chat_id=chat_id).count()
+    total = await run_db(_tx)
+    if total is None:
+        return await m.reply_text(f"Domain đã có trong whitelist: {domain}")
+    await m.reply_text(f"✅ Đã thêm whitelist: {domain}\nTổng whitelist của nhóm: {total}")
 
 async def wl_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await _must_admin_in_group(update, context):
         return
-    db = SessionLocal()
-    try:
-        items = db.query(Whitelist).filter_by(chat_id=update.effective_chat.id).all()
-        if not items:
-            await update.effective_message.reply_text("Danh sách trống.")
-            return
-        await update.effective_message.reply_text("\n".join(f"• {w.domain}" for w in items))
-    finally:
-        db.close()
+    domains = (await aget_ruleset(update.effective_chat.id)).whitelist.domains()
+    if not domains:
+        await update.effective_message.reply_text("Danh sách trống.")
+        return
+    await update.effective_message.reply_text("\n".join(f"• {d}" for d in domains))
 
 async def wl_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await _must_admin_in_group(update, context):
@@ -404,18 +362,23 @@ async def wl_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
     domain = to_host(raw)
     if not domain:
         return await m.reply_text("Domain không hợp lệ.")
-    db = SessionLocal()
-    try:
-        chat_id = update.effective_chat.id
+    chat_id = update.effective_chat.id
+    if domain not in (await aget_ruleset(chat_id)).whitelist:
+        await m.reply_text("❗Không tìm thấy domain trong whitelist.\n💡Hãy thử /wl_list để xem danh sách hiện tại.")
+        return
+
+    def _tx(db):
         row = db.query(Whitelist).filter_by(chat_id=chat_id, domain=domain).one_or_none()
         if not row:
-            await m.reply_text("❗Không tìm thấy domain trong whitelist.\n💡Hãy thử /wl_list để xem danh sách hiện tại.")
-            return
+            return False
         db.delete(row)
         db.commit()
-        await m.reply_text(f"🗑️ Đã xoá khỏi whitelist: {domain}")
-    finally:
-        db.close()
+        invalidate_rules(chat_id)
+        return True
+    if not await run_db(_tx):
+        await m.reply_text("❗Không tìm thấy domain trong whitelist.\n💡Hãy thử /wl_list để xem danh sách hiện tại.")
+        return
+    await m.reply_text(f"🗑️ Đã xoá khỏi whitelist: {domain}")
 
 # ====== WARN INFO / CLEAR / TOP ======
 async def warn_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -423,13 +386,8 @@ async def warn_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid, name = _get_target_user(update, context.args)
     if not uid:
         return await update.effective_message.reply_text("Reply tin nhắn hoặc dùng: /warn_info <user_id>")
-    db = SessionLocal()
-    try:
-        row = db.query(Warning).filter_by(chat_id=chat_id, user_id=uid).one_or_none()
-        count = row.count if row else 0
-        await update.effective_message.reply_text(f"⚠️ {name} hiện có {count} cảnh cáo.")
-    finally:
-        db.close()
+    count = await run_sync(VIOLATIONS.warning_count, chat_id, uid)
+    await update.effective_message.reply_text(f"⚠️ {name} hiện có {count} cảnh cáo.")
 
 async def warn_clear(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await _must_admin_in_group(update, context):
@@ -438,34 +396,31 @@ async def warn_clear(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid, name = _get_target_user(update, context.args)
     if not uid:
         return await update.effective_message.reply_text("Reply tin nhắn hoặc dùng: /warn_clear <user_id>")
-    db = SessionLocal()
-    try:
-        row = db.query(Warning).filter_by(chat_id=chat_id, user_id=uid).one_or_none()
-        if row:
-            row.count = 0
-            db.commit()
-            await update.effective_message.reply_text(f"✅ Đã xoá toàn bộ cảnh cáo của {name}.")
-        else:
-            await update.effective_message.reply_text("Người này chưa có cảnh cáo nào.")
-    finally:
-        db.close()
+    if await run_db(VIOLATIONS.clear, chat_id, uid):
+        await update.effective_message.reply_text(f"✅ Đã xoá toàn bộ cảnh cáo của {name}.")
+    else:
+        await update.effective_message.reply_text("Người này chưa có cảnh cáo nào.")
+
+def _warn_top(db, chat_id: int, limit: int = 10) -> list[Warning]:
+    # đi theo index ix_warnings_chat_count (chat_id, count DESC) — xem bench/explain_indexes.py
+    return (
+        db.query(Warning)
+          .filter_by(chat_id=chat_id)
+          .order_by(Warning.count.desc())
+          .limit(limit).all()
+    )
 
 async def warn_top(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    db = SessionLocal()
-    try:
-        rows = (
-            db.query(Warning)
-              .filter_by(chat_id=chat_id)
-              .order_by(Warning.count.desc())
-              .limit(10).all()
-        )
-        if not rows:
-            return await update.effective_message.reply_text("Chưa có ai bị cảnh cáo.")
-        lines = [f"{i+1}. user_id {r.user_id}: {r.count} cảnh cáo" for i, r in enumerate(rows)]
-        await update.effective_message.reply_text("🏆 Top cảnh cáo:\n" + "\n".join(lines))
-    finally:
-        db.close()
+
+    def _tx(db):
+        VIOLATIONS.flush()
+        return _warn_top(db, chat_id)
+    rows = await run_db(_tx)
+    if not rows:
+        return await update.effective_message.reply_text("Chưa có ai bị cảnh cáo.")
+    lines = [f"{i+1}. user_id {r.user_id}: {r.count} cảnh cáo" for i, r in enumerate(rows)]
+    await update.effective_message.reply_text("🏆 Top cảnh cáo:\n" + "\n".join(lines))
 
 # ====== FILTERS & TOGGLES ======
 async def filter_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -478,29 +433,28 @@ async def filter_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
     pattern = " ".join(context.args).strip()
     if not pattern:
         return await update.effective_message.reply_text("Từ khoá rỗng.")
-    db = SessionLocal()
-    try:
-        f = Filter(chat_id=update.effective_chat.id, pattern=pattern)
+    chat_id = update.effective_chat.id
+
+    def _tx(db):
+        f = Filter(chat_id=chat_id, pattern=pattern)
         db.add(f)
         db.commit()
-        await update.effective_message.reply_text(
-            f"✅ Đã thêm filter #{f.id}: <code>{pattern}</code>", parse_mode=ParseMode.HTML
-        )
-    finally:
-        db.close()
+        invalidate_rules(chat_id)
+        return f.id
+    fid = await run_db(_tx)
+    await update.effective_message.reply_text(
+        f"✅ Đã thêm filter #{fid}: <code>{pattern}</code>", parse_mode=ParseMode.HTML
+    )
 
 async def filter_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await _must_admin_in_group(update, context):
         return
-    db = SessionLocal()
-    try:
-        items = db.query(Filter).filter_by(chat_id=update.effective_chat.id).all()
-        if not items:
-            return await update.effective_message.reply_text("Danh sách filter trống.")
-        out = ["<b>Filters:</b>"] + [f"{i.id}. <code>{i.pattern}</code>" for i in items]
-        await update.effective_message.reply_text("\n".join(out), parse_mode=ParseMode.HTML)
-    finally:
-        db.close()
+    chat_id = update.effective_chat.id
+    items = await run_db(lambda db: db.query(Filter).filter_by(chat_id=chat_id).all())
+    if not items:
+        return await update.effective_message.reply_text("Danh sách filter trống.")
+    out = ["<b>Filters:</b>"] + [f"{i.id}. <code>{i.pattern}</code>" for i in items]
+    await update.effective_message.reply_text("\n".join(out), parse_mode=ParseMode.HTML)
 
 async def filter_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await _must_admin_in_group(update, context):
@@ -511,29 +465,23 @@ async def filter_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
         fid = int(context.args[0])
     except ValueError:
         return await update.effective_message.reply_text("ID không hợp lệ.")
-    db = SessionLocal()
-    try:
-        it = db.query(Filter).filter_by(id=fid, chat_id=update.effective_chat.id).one_or_none()
+    chat_id = update.effective_chat.id
+
+    def _tx(db):
+        it = db.query(Filter).filter_by(id=fid, chat_id=chat_id).one_or_none()
         if not it:
-            return await update.effective_message.reply_text("Không tìm thấy ID.")
+            return False
         db.delete(it)
         db.commit()
-        await update.effective_message.reply_text(f"🗑️ Đã xoá filter #{fid}.")
-    finally:
-        db.close()
+        invalidate_rules(chat_id)
+        return True
+    if not await run_db(_tx):
+        return await update.effective_message.reply_text("Không tìm thấy ID.")
+    await update.effective_message.reply_text(f"🗑️ Đã xoá filter #{fid}.")
 
 async def _toggle(update: Update, field: str, val: bool, label: str):
-    db = SessionLocal()
-    try:
-        s = db.query(Setting).filter_by(chat_id=update.effective_chat.id).one_or_none()
-        if not s:
-            s = Setting(chat_id=update.effective_chat.id)
-            db.add(s)
-        setattr(s, field, val)
-        db.commit()
-        await update.effective_message.reply_text(("✅ Bật " if val else "❎ Tắt ") + label + ".")
-    finally:
-        db.close()
+    await run_db(set_setting, update.effective_chat.id, **{field: val})
+    await update.effective_message.reply_text(("✅ Bật " if val else "❎ Tắt ") + label + ".")
 
 async def antilink_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await _must_admin_in_group(update, context): return
@@ -567,66 +515,34 @@ async def setflood(update: Update, context: ContextTypes.DEFAULT_TYPE):
         n = max(2, int(context.args[0]))
     except ValueError:
         return await update.effective_message.reply_text("Giá trị không hợp lệ.")
-    db = SessionLocal()
-    try:
-        s = db.query(Setting).filter_by(chat_id=update.effective_chat.id).one_or_none()
-        if not s:
-            s = Setting(chat_id=update.effective_chat.id)
-            db.add(s)
-        s.flood_limit = n
-        db.commit()
-        await update.effective_message.reply_text(f"✅ Flood limit = {n}")
-    finally:
-        db.close()
+    await run_db(set_setting, update.effective_chat.id, flood_limit=n)
+    await update.effective_message.reply_text(f"✅ Flood limit = {n}")
 
 async def nobots_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await _must_admin_in_group(update, context):
         return
-    db = SessionLocal()
-    try:
-        s = get_settings(db, update.effective_chat.id)
-        s.nobots = True
-        db.commit()
-        await update.effective_message.reply_text("✅ Đã bật chặn bot khi có thành viên mới.")
-    finally:
-        db.close()
+    await run_db(set_setting, update.effective_chat.id, nobots=True)
+    await update.effective_message.reply_text("✅ Đã bật chặn bot khi có thành viên mới.")
 
 async def nobots_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await _must_admin_in_group(update, context):
         return
-    db = SessionLocal()
-    try:
-        s = get_settings(db, update.effective_chat.id)
-        s.nobots = False
-        db.commit()
-        await update.effective_message.reply_text("❎ Đã tắt chặn bot khi có thành viên mới.")
-    finally:
-        db.close()
+    await run_db(set_setting, update.effective_chat.id, nobots=False)
+    await update.effective_message.reply_text("❎ Đã tắt chặn bot khi có thành viên mới.")
 
-async def on_new_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    msg = update.effective_message
-    chat = update.effective_chat
-    if not msg or not chat:
+async def captcha_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await _must_admin_in_group(update, context):
         return
-    if not getattr(msg, "new_chat_members", None):
+    await run_db(set_setting, update.effective_chat.id, captcha=True)
+    await update.effective_message.reply_text(
+        f"✅ Đã bật captcha: thành viên mới phải bấm đúng trong {int(CAPTCHA_TIMEOUT)} giây, quá hạn sẽ bị kick."
+    )
+
+async def captcha_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await _must_admin_in_group(update, context):
         return
-    db = SessionLocal()
-    try:
-        s = get_settings(db, chat.id)
-        if not s.nobots:
-            return
-        for m in msg.new_chat_members:
-            if m.is_bot:
-                try:
-                    await context.bot.ban_chat_member(chat.id, m.id)
-                    await msg.reply_text(
-                        f"🤖 Đã xoá bot <b>{m.first_name}</b> (nobots đang bật).",
-                        parse_mode=ParseMode.HTML
-                    )
-                except Exception as e:
-                    print("Kick bot failed:", e)
-    finally:
-        db.close()
+    await run_db(set_setting, update.effective_chat.id, captcha=False)
+    await update.effective_message.reply_text("❎ Đã tắt captcha cho thành viên mới.")
 
 # ===== ANTISPAM (RAM) =====
 ANTISPAM_CHATS: set[int] = set()
@@ -635,29 +551,42 @@ async def antispam_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await _must_admin_in_group(update, context):
         return
     ANTISPAM_CHATS.add(update.effective_chat.id)
+    await run_db(set_setting, update.effective_chat.id, antispam=True)
     await update.effective_message.reply_text("✅ Đã bật chống spam ảnh & media.")
 
 async def antispam_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await _must_admin_in_group(update, context):
         return
     ANTISPAM_CHATS.discard(update.effective_chat.id)
+    await run_db(set_setting, update.effective_chat.id, antispam=False)
     await update.effective_message.reply_text("❎ Đã tắt chống spam ảnh & media.")
 
+# ===== DUPSPAM: spam rải nhiều nhóm (Setting.dupspam, mặc định tắt) =====
+async def dupspam_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await _must_admin_in_group(update, context):
+        return
+    await run_db(set_setting, update.effective_chat.id, dupspam=True)
+    await update.effective_message.reply_text(
+        "✅ Đã bật chặn spam rải nhiều nhóm: tin (gần) giống nhau xuất hiện ở nhiều nhóm cùng bật sẽ bị xoá."
+    )
+
+async def dupspam_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await _must_admin_in_group(update, context):
+        return
+    await run_db(set_setting, update.effective_chat.id, dupspam=False)
+    await update.effective_message.reply_text("❎ Đã tắt chặn spam rải nhiều nhóm.")
+
 # ===== AUTO BAN / MUTE =====
-async def _autoban_enforce(db, context, chat_id: int, user_id: int):
-    cfg = get_or_create_autoban(db, chat_id)
-    if not cfg or not cfg.enabled:
+async def _autoban_enforce(context, chat_id: int, user_id: int, count: int):
+    cfg = await aget_ruleset(chat_id)
+    if not cfg.autoban_enabled:
         return
-    w = db.query(Warning).filter_by(chat_id=chat_id, user_id=user_id).one_or_none()
-    count = (w.count if w else 0)
 
     # ban khi đạt ban_threshold
     if count >= cfg.ban_threshold:
         try:
             await context.bot.ban_chat_member(chat_id, user_id)
-            if not db.query(Blacklist).filter_by(chat_id=chat_id, user_id=user_id).one_or_none():
-                db.add(Blacklist(chat_id=chat_id, user_id=user_id))
-                db.commit()
+            await run_db(_blacklist_add, chat_id, user_id)
             await context.bot.send_message(
                 chat_id,
                 f"⛔️ Đã ban <a href='tg://user?id={user_id}'>user</a> (tự động).",
@@ -684,20 +613,42 @@ async def _autoban_enforce(db, context, chat_id: int, user_id: int):
         except Exception:
             pass
 
-async def _record_violation(db, context, chat_id: int, user_id: int, rule: str, raw_text: str):
-    """Ghi log + tăng cảnh cáo + enforce autoban."""
-    try:
-        log_violation(db, chat_id, user_id, rule, (raw_text or "")[:200])
-    except Exception:
-        pass
-    w = db.query(Warning).filter_by(chat_id=chat_id, user_id=user_id).one_or_none()
-    if not w:
-        db.add(Warning(chat_id=chat_id, user_id=user_id, count=1))
-    else:
-        w.count += 1
-        w.last_warned = datetime.now(timezone.utc)
-    db.commit()
-    await _autoban_enforce(db, context, chat_id, user_id)
+async def _record_violation(context, chat_id: int, user_id: int, rule: str, raw_text: str):
+    """Ghi log + tăng cảnh cáo (write-behind) + enforce autoban."""
+    count = await run_sync(VIOLATIONS.record, chat_id, user_id, rule, (raw_text or "")[:200])
+    await _autoban_enforce(context, chat_id, user_id, count)
+
+async def _purge_dupspam(context, msg, hits, text: str) -> bool:
+    """
+    Xoá các tin spam đa nhóm (bỏ qua admin từng nhóm); True nếu tin hiện tại bị xoá.
+    Chỉ ghi log `dupspam` (1 dòng / (nhóm, user) mỗi lượt xoá), không tính cảnh cáo
+    → không kéo theo autoban khi lỡ xoá nhầm thông báo đăng nhiều nhóm.
+    """
+    pairs = list({(cid, uid) for cid, _, uid in hits})
+    # kiểm tra admin của mọi nhóm song song thay vì lần lượt từng get_chat_member
+    checks = await asyncio.gather(*(is_admin(context.bot, cid, uid) for cid, uid in pairs),
+                                  return_exceptions=True)
+    admins = {p for p, ok in zip(pairs, checks) if ok is True}
+    current = False
+    others: dict[int, list[int]] = {}
+    offenders: set[tuple[int, int]] = set()
+    for cid, mid, uid in hits:
+        if (cid, uid) in admins:
+            continue
+        if cid == msg.chat_id and mid == msg.message_id:
+            current = True
+            try:
+                await msg.delete()
+            except Exception:
+                pass
+        else:
+            others.setdefault(cid, []).append(mid)
+        offenders.add((cid, uid))
+    for cid, uid in offenders:
+        await run_sync(VIOLATIONS.log, cid, uid, "dupspam", (text or "")[:200])
+    for cid, mids in others.items():
+        await DELETIONS.schedule(cid, mids, 0)   # deleteMessages theo lô
+    return current
 
 # ====== Guard (lọc tin nhắn thường) ======
 async def guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -713,12 +664,11 @@ async def guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # --- AntiSpam: chặn media với member, trừ ảnh báo lỗi ---
     if chat and chat.id in ANTISPAM_CHATS:
         try:
-            member = await context.bot.get_chat_member(chat.id, user.id)
-            is_admin = member.status in ("administrator", "creator")
+            sender_is_admin = await is_admin(context.bot, chat.id, user.id)
         except Exception:
-            is_admin = False
+            sender_is_admin = False
 
-        if not is_admin:
+        if not sender_is_admin:
             text_lower = (msg.caption or msg.text or "").lower()
             if any(kw in text_lower for kw in ["lỗi", "bug", "error", "report"]):
                 return
@@ -743,96 +693,83 @@ async def guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if text.startswith("/"):
         cmd = text.split()[0].lower()
         try:
-            member = await context.bot.get_chat_member(chat.id, user.id)
-            is_admin = member.status in ("administrator", "creator")
+            sender_is_admin = await is_admin(context.bot, chat.id, user.id)
         except Exception:
-            is_admin = False
+            sender_is_admin = False
 
-        if not is_admin and cmd not in ALLOWED_COMMANDS:
+        if not sender_is_admin and cmd not in ALLOWED_COMMANDS:
             try: await msg.delete()
             except Exception: pass
             return
         return  # để CommandHandler xử lý tiếp
 
-    # 2) Lọc nội dung thường
+    # 2) Lọc nội dung thường (luật lấy từ cache, chỉ mở DB khi ghi vi phạm)
     chat_id = chat.id
-    db = SessionLocal()
-    try:
-        s = get_settings(db, chat_id)
-
-        # 2.1. Từ khóa filter
-        for it in db.query(Filter).filter_by(chat_id=chat_id).all():
-            if it.pattern and it.pattern.lower() in low:
-                try: 
-                    await msg.delete()
-                except Exception: 
-                    pass
-                await _record_violation(db, context, chat_id, user.id, "filter", text)
-                return
+    rs = await aget_ruleset(chat_id)
+
+    # 2.0. Raid: đếm tin người mới / link trùng toàn nhóm (O(1)); đang khoá → ép antilink
+    locked = RAID.locked(chat_id)
+    scan = scan_message(msg) if (rs.antilink or rs.antimention or locked) else None
+    reason = RAID.on_message(chat_id, user.id, scan.urls if scan else ())
+    if reason:
+        await start_lockdown(context, chat_id, reason)
+        locked = True
+    if scan is None and locked:
+        scan = scan_message(msg)   # khoá vừa bật trên nhóm tắt hết antilink/antimention
+    antilink = rs.antilink or locked
+
+    violation, detail = None, ""
+    # 2.1. Từ khóa filter (Aho-Corasick, 1 lượt quét)
+    hit = rs.keywords.search(low)
+    if hit:
+        violation, detail = "filter", f"[filter #{hit[0]}] "
+
+    # 2.2. Chặn tin nhắn forward
+    if not violation and rs.antiforward and getattr(msg, "forward_origin", None):
+        violation = "forward"
+
+    # 2.3. Chặn link (TRỪ whitelist hoặc supporter) — 1 lượt quét dùng chung cho 2.0, 2.3 và 2.4
+    if not violation and antilink and scan.has_link:
+        if any(rs.whitelist.allows(h) for h in scan.hosts):
+            return  # nằm trong whitelist
+        if not rs.is_supporter(user.id):
+            violation = "link"
+
+    # 2.4. Chặn mention (loại URL trước rồi mới bắt @username)
+    if not violation and rs.antimention and scan.mentions:
+        violation = "mention"
+
+    if violation:
+        try:
+            await msg.delete()
+        except Exception:
+            pass
+        await _record_violation(context, chat_id, user.id, violation, detail + text)
+        return
 
-        # 2.2. Chặn tin nhắn forward
-        if s.antiforward and getattr(msg, "forward_origin", None):
-            try: 
-                await msg.delete()
-            except Exception: 
-                pass
-            await _record_violation(db, context, chat_id, user.id, "forward", text)
+    # 2.45. Spam rải nhiều nhóm (nhóm tự bật bằng /dupspam_on): nội dung (gần) giống nhau ở ≥ FP_CHATS nhóm → xoá ở mọi nhóm
+    if rs.dupspam:
+        hits = SPAMPRINT.check(chat_id, msg.message_id, user.id, text)
+        if hits and await _purge_dupspam(context, msg, hits, text):
             return
 
-        # 2.3. Chặn link (TRỪ whitelist hoặc supporter)
-        if s.antilink and LINK_RE.search(text):
-            wl_hosts  = [to_host(w.domain) for w in db.query(Whitelist).filter_by(chat_id=chat_id).all()]
-            msg_hosts = extract_hosts(text)
-
-            if any(host_allowed(h, wl_hosts) for h in msg_hosts):
-                return  # nằm trong whitelist
-
-            allow_support = False
-            try:
-                if get_support_enabled(db, chat_id):
-                    sup_ids = list_supporters(db, chat_id)
-                    allow_support = (user.id in sup_ids)
-            except Exception:
-                allow_support = False
-
-            if not allow_support:
-                try:
-                    await msg.delete()
-                except Exception:
-                    pass
-                await _record_violation(db, context, chat_id, user.id, "link", text)
-                return
-
-        # 2.4. Chặn mention (loại URL trước rồi mới bắt @username)
-        if s.antimention:
-            text_no_urls = URL_RE.sub("", text)
-            if MENTION_RE.search(text_no_urls):
-                try: 
-                    await msg.delete()
-                except Exception: 
-                    pass
-                await _record_violation(db, context, chat_id, user.id, "mention", text)
-                return
+    # 2.5. Chống flood nhẹ
+    if FLOOD.hit(chat_id, user.id, rs.flood_limit) and rs.flood_mode == "mute":
+        try:
+            until = datetime.now(timezone.utc) + timedelta(minutes=5)
+            await context.bot.restrict_chat_member(
+                chat_id, user.id,
+                ChatPermissions(can_send_messages=False),
+                until_date=until
+            )
+        except Exception:
+            pass
+        # không tính là violation để tránh quá “gắt”
 
-        # 2.5. Chống flood nhẹ
-        key = (chat_id, user.id)
-        now_ts = datetime.now(timezone.utc).timestamp()
-        bucket = [t for t in FLOOD.get(key, []) if now_ts - t < 10]
-        bucket.append(now_ts)
-        FLOOD[key] = bucket
-        if len(bucket) > s.flood_limit and s.flood_mode == "mute":
-            try:
-                until = datetime.now(timezone.utc) + timedelta(minutes=5)
-                await context.bot.restrict_chat_member(
-                    chat_id, user.id,
-                    ChatPermissions(can_send_messages=False),
-                    until_date=until
-                )
-            except Exception:
-                pass
-            # không tính là violation để tránh quá “gắt”
-    finally:
-        db.close()
+async def _flood_sweep_job(context: ContextTypes.DEFAULT_TYPE):
+    n = FLOOD.sweep()
+    if n:
+        print(f"[flood] swept {n} idle keys, stats={FLOOD.stats()}")
 
 # ====== Chặn lệnh không hợp lệ ======
 async def block_unknown_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -861,6 +798,11 @@ async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE):
         print("owner notify fail:", e)
 
 # ===== Startup hook =====
+async def on_shutdown(app: Application):
+    n = await run_sync(VIOLATIONS.flush)
+    shutdown_db_pool()
+    print(f"[shutdown] flushed {n} pending violation rows")
+
 async def on_startup(app: Application):
     try:
         await app.bot.delete_webhook(drop_pending_updates=True)
@@ -872,6 +814,8 @@ async def on_startup(app: Application):
         app.bot_data["contact"] = me.username or CONTACT_USERNAME
     except Exception:
         app.bot_data["contact"] = CONTACT_USERNAME or "admin"
+    # thread hết hạn PRO/TRIAL chỉ chạy với bot thật (không bật khi chỉ build_app)
+    start_scheduler(app)
     if OWNER_ID:
         try:
             await app.bot.send_message(
@@ -889,48 +833,9 @@ async def setwelcome_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "📌 Dùng: /setwelcome <câu chào>. Dùng {name} để thay tên thành viên."
         )
     content = " ".join(context.args).strip()
-    set_welcome_message(update.effective_chat.id, content)
+    await run_db(set_setting, update.effective_chat.id, welcome_text=content or None)
     await update.effective_message.reply_text("✅ Đã lưu câu chào thành công!")
 
-# 👋 Gửi lời chào khi có thành viên mới + auto-delete theo TTL
-async def _delete_later(bot, chat_id: int, message_id: int, ttl: int):
-    await asyncio.sleep(ttl)
-    try:
-        await bot.delete_message(chat_id, message_id)
-    except Exception:
-        pass
-
-async def welcome_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not getattr(update, "message", None) or not update.message.new_chat_members:
-        return
-
-    chat_id = update.effective_chat.id
-    welcome_text = get_welcome_message(chat_id)
-    if not welcome_text:
-        return
-
-    db = SessionLocal()
-    try:
-        s = db.query(Setting).filter_by(chat_id=chat_id).one_or_none()
-        ttl = int(getattr(s, "welcome_ttl", 0) or 0)
-    finally:
-        db.close()
-
-    for user in update.message.new_chat_members:
-        name = user.mention_html() if user else "bạn mới"
-        try:
-            sent = await context.bot.send_message(
-                chat_id=chat_id,
-                text=welcome_text.replace("{name}", name),
-                parse_mode=ParseMode.HTML
-            )
-            if ttl > 0:
-                context.application.create_task(
-                    _delete_later(context.bot, sent.chat.id, sent.message_id, ttl)
-                )
-        except Exception:
-            pass
-
 # ✅ Đặt thời gian tự xoá lời chào (0 = không xoá)
 async def welcome_ttl_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await _must_admin_in_group(update, context):
@@ -943,35 +848,21 @@ async def welcome_ttl_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ttl = max(0, int(context.args[0]))
     except ValueError:
         return await update.effective_message.reply_text("Giá trị không hợp lệ.")
-    db = SessionLocal()
-    try:
-        s = db.query(Setting).filter_by(chat_id=update.effective_chat.id).one_or_none()
-        if not s:
-            s = Setting(chat_id=update.effective_chat.id)
-            db.add(s)
-        s.welcome_ttl = ttl
-        db.commit()
-        await update.effective_message.reply_text(
-            f"✅ Đã đặt thời gian tự xoá lời chào = {ttl} giây."
-        )
-    finally:
-        db.close()
+    await run_db(set_setting, update.effective_chat.id, welcome_ttl=ttl)
+    await update.effective_message.reply_text(
+        f"✅ Đã đặt thời gian tự xoá lời chào = {ttl} giây."
+    )
 
 # ====== Main ======
-def main():
-    if not BOT_TOKEN:
-        raise SystemExit("❌ Missing BOT_TOKEN")
-
-    print("🚀 Booting bot...")
-    init_db()
-
-    try:
-        keep_alive()
-    except Exception as e:
-        print("Lỗi keep_alive:", e)
-
-    app = Application.builder().token(BOT_TOKEN).build()
+def build_app(token: str = BOT_TOKEN, base_url: str | None = None) -> Application:
+    """Dựng Application với đủ handler/job; base_url dùng cho Bot API giả lập (bench/loadtest.py)."""
+    # song song giữa các nhóm, tuần tự trong 1 nhóm
+    builder = Application.builder().token(token).concurrent_updates(UPDATE_PROCESSOR)
+    if base_url:
+        builder = builder.base_url(base_url)
+    app = builder.build()
     app.post_init = on_startup
+    app.post_shutdown = on_shutdown
     app.add_error_handler(on_error)
 
     # Commands
@@ -983,7 +874,8 @@ def main():
     app.add_handler(CommandHandler("uptime", uptime_cmd))
     app.add_handler(CommandHandler("ping", ping_cmd))
     app.add_handler(CommandHandler("setwelcome", setwelcome_cmd))
-    app.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, welcome_member))
+    # Thành viên mới: nobots → blacklist → lời chào trong 1 pipeline (core/joins.py)
+    app.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, on_join))
 
     # FREE whitelist
     app.add_handler(CommandHandler("wl_add", wl_add))
@@ -1003,9 +895,14 @@ def main():
     app.add_handler(CommandHandler("setflood", setflood))
     app.add_handler(CommandHandler("nobots_on", nobots_on))
     app.add_handler(CommandHandler("nobots_off", nobots_off))
+    app.add_handler(CommandHandler("captcha_on", captcha_on))
+    app.add_handler(CommandHandler("captcha_off", captcha_off))
+    app.add_handler(CallbackQueryHandler(CAPTCHA.on_button, pattern=r"^cap:\d+$"))
     app.add_handler(CommandHandler("welcome_ttl", welcome_ttl_cmd))
     app.add_handler(CommandHandler("antispam_on", antispam_on))
     app.add_handler(CommandHandler("antispam_off", antispam_off))
+    app.add_handler(CommandHandler("dupspam_on", dupspam_on))
+    app.add_handler(CommandHandler("dupspam_off", dupspam_off))
 
     # Warn utilities
     app.add_handler(CommandHandler("warn", warn_cmd))
@@ -1013,6 +910,21 @@ def main():
     app.add_handler(CommandHandler("warn_clear", warn_clear))
     app.add_handler(CommandHandler("warn_top", warn_top))
 
+    # Ghi vi phạm / cảnh cáo theo lô
+    app.job_queue.run_repeating(
+        violation_flush_job, interval=VIOLATION_FLUSH_INTERVAL, first=VIOLATION_FLUSH_INTERVAL,
+        name="violation_flush",
+    )
+
+    # Xoá tin theo lịch (lời chào có TTL) — lượt đầu nạp lại lịch còn dở sau restart
+    app.job_queue.run_repeating(deletion_tick_job, interval=DELETE_TICK, first=1, name="deletion_tick")
+
+    # Captcha quá hạn → kick (lượt đầu nạp lại thử thách còn dở sau restart)
+    app.job_queue.run_repeating(captcha_tick_job, interval=CAPTCHA_TICK, first=1, name="captcha_tick")
+
+    # Dọn key flood không còn hoạt động
+    app.job_queue.run_repeating(_flood_sweep_job, interval=60, first=60, name="flood_sweep")
+
     # PRO (an toàn nếu thiếu)
     register_handlers(app, owner_id=OWNER_ID)
     attach_scheduler(app)
@@ -1021,17 +933,33 @@ def main():
     # Inline buttons: Languages
     app.add_handler(CallbackQueryHandler(on_lang_button, pattern=r"^lang_(menu|vi|en)$"))
 
+    # Promote/demote → cập nhật cache quyền admin
+    app.add_handler(ChatMemberHandler(on_chat_member_update, ChatMemberHandler.ANY_CHAT_MEMBER))
+
     # Chặn mọi lệnh không được cho phép
     app.add_handler(MessageHandler(filters.COMMAND, block_unknown_commands))
 
     # Guard: lọc tin nhắn thường
     app.add_handler(MessageHandler(~filters.StatusUpdate.ALL & ~filters.COMMAND, guard))
+    return app
+
+def main():
+    if not BOT_TOKEN:
+        raise SystemExit("❌ Missing BOT_TOKEN")
+
+    print("🚀 Booting bot...")
+    init_db()
+
+    try:
+        keep_alive()
+    except Exception as e:
+        print("Lỗi keep_alive:", e)
 
-    # Lắng nghe thành viên mới vào nhóm để đá bot khi cần
-    app.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, on_new_member))
+    app = build_app()
 
     print("✅ Bot started, polling Telegram updates...")
-    app.run_polling(drop_pending_updates=True, timeout=60)
+    # chat_member chỉ được gửi khi khai báo rõ trong allowed_updates
+    app.run_polling(drop_pending_updates=True, timeout=60, allowed_updates=Update.ALL_TYPES)
 
 # ====== Entry point ======
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+# pro/entitlements.py
+"""
+Cache quyền PRO theo user: user_id -> hạn PRO/TRIAL (epoch giây).
+
+Mọi lệnh PRO đều gọi `_pro_ok` → trước đây 2 query (User + Trial) + chuẩn
+hoá timezone mỗi lần. Giờ lần kiểm tra lặp lại chỉ là 1 lần tra dict:
+
+- có hạn → PRO tới đúng thời điểm đó (hết hạn tự coi là miss, không cần job);
+- không có quyền → cache âm PRO_NEG_TTL giây.
+Nơi đổi quyền (trial_cmd, redeem_cmd, hẹn giờ hết hạn, admin panel) phải gọi
+`invalidate(user_id)`. Thread-safe: admin panel (Flask) và thread pool DB
+cùng ghi.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+PRO_CACHE_SIZE = int(os.getenv("PRO_CACHE_SIZE", "50000"))
+PRO_NEG_TTL = float(os.getenv("PRO_NEG_TTL", "300"))   # giây
+
+
+class EntitlementCache:
+    def __init__(self, max_size: int = PRO_CACHE_SIZE, negative_ttl: float = PRO_NEG_TTL,
+                 clock=time.time):
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        # > 0: PRO tới mốc này; < 0: không PRO, kiểm tra lại sau mốc -v
+        self._until: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._gen = 0               # tăng mỗi lần invalidate → bỏ kết quả query cũ đang chạy dở
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, user_id: int):
+        """True/False nếu có trong cache, None nếu phải hỏi DB."""
+        with self._lock:
+            v = self._until.get(user_id)
+            if v is not None:
+                now = self._clock()
+                if v > 0 and now < v:
+                    self.stats["hits"] += 1
+                    return True
+                if v < 0 and now < -v:
+                    self.stats["hits"] += 1
+                    return False
+                del self._until[user_id]
+            self.stats["misses"] += 1
+        return None
+
+    def generation(self) -> int:
+        return self._gen
+
+    def put(self, user_id: int, expires_at, gen: int) -> None:
+        """`expires_at`: datetime aware (hạn PRO/TRIAL muộn nhất) hoặc None."""
+        v = expires_at.timestamp() if expires_at else -(self._clock() + self.negative_ttl)
+        with self._lock:
+            if gen != self._gen:
+                return
+            self._until[user_id] = v
+            self._until.move_to_end(user_id)
+            while len(self._until) > self.max_size:
+                self._until.popitem(last=False)
+
+    def invalidate(self, *user_ids: int) -> None:
+        with self._lock:
+            self._gen += 1
+            for uid in user_ids:
+                self._until.pop(int(uid), None)
+            self.stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._gen += 1
+            self._until.clear()
+
+
+ENTITLEMENTS = EntitlementCache()
@@ -10,12 +10,19 @@ from telegram.constants import ParseMode
 from telegram.ext import Application, CommandHandler, ContextTypes
 
 from core.lang import t
+from core.db import run_db
+from core.rules import aget_ruleset, invalidate_rules
+from core.config_repo import set_setting, get_autoban, set_autoban, set_support
+from core.domains import to_host
+from core.admins import is_admin
+from core.violations import flush_violations
+from pro.scheduler import EXPIRY, PROMOS, next_promo_due
+from pro.entitlements import ENTITLEMENTS
 from core.models import (
     SessionLocal,
-    User, LicenseKey, Trial, Whitelist, PromoSetting, Setting,
-    SupportSetting, Supporter, list_supporters, get_support_enabled,
-    Warning, Blacklist,  # nếu chưa dùng có thể bỏ
-    get_or_create_autoban, log_violation, violations_summary, now_utc,
+    User, LicenseKey, Trial, Whitelist, PromoSetting,
+    Supporter, list_supporters, get_support_enabled,
+    violations_summary, now_utc, upsert_config,
 )
 
 # ========= i18n user lang (RAM) =========
@@ -38,19 +45,36 @@ def now_aw():
     return ensure_aware(now_utc())
 
 
-def _has_active_pro(db: SessionLocal, user_id: int) -> bool:
+def _pro_expiry(db: SessionLocal, user_id: int):
+    """Hạn PRO/TRIAL còn hiệu lực muộn nhất (aware) hoặc None."""
     now = now_aw()
+    best = None
     u = db.query(User).filter_by(id=user_id).one_or_none()
     if u and u.is_pro:
         exp = ensure_aware(u.pro_expires_at)
         if exp and exp > now:
-            return True
+            best = exp
     t_trial = db.query(Trial).filter_by(user_id=user_id, active=True).one_or_none()
     if t_trial:
         exp = ensure_aware(t_trial.expires_at)
-        if exp and exp > now:
-            return True
-    return False
+        if exp and exp > now and (best is None or exp > best):
+            best = exp
+    return best
+
+
+def _has_active_pro(db: SessionLocal, user_id: int) -> bool:
+    gen = ENTITLEMENTS.generation()
+    exp = _pro_expiry(db, user_id)
+    ENTITLEMENTS.put(user_id, exp, gen)
+    return exp is not None
+
+
+async def _pro_ok(update: Update) -> bool:
+    uid = update.effective_user.id
+    ok = ENTITLEMENTS.get(uid)           # lặp lại: 1 lần tra dict
+    if ok is not None:
+        return ok
+    return await run_db(_has_active_pro, uid)
 
 
 HELP_PRO_VI = (
@@ -92,8 +116,7 @@ async def _admin_only(update: Update, context: ContextTypes.DEFAULT_TYPE) -> boo
     try:
         chat_id = update.effective_chat.id
         user_id = update.effective_user.id
-        m = await context.bot.get_chat_member(chat_id, user_id)
-        return m.status in ("administrator", "creator")
+        return await is_admin(context.bot, chat_id, user_id)
     except Exception:
         return False
 
@@ -119,18 +142,9 @@ async def _toggle_setting(
     if not await _admin_only(update, context):
         return await m.reply_text("Chỉ admin mới dùng lệnh này. / Admin only.")
     chat_id = update.effective_chat.id
-    db = SessionLocal()
-    try:
-        s = db.query(Setting).filter_by(chat_id=chat_id).one_or_none()
-        if not s:
-            s = Setting(chat_id=chat_id)
-            db.add(s)
-            db.flush()
-        setattr(s, field, value)
-        db.commit()
-        await m.reply_text(f"{label}: {'✅ ON' if value else '❎ OFF'}")
-    finally:
-        db.close()
+
+    await run_db(set_setting, chat_id, **{field: value})
+    await m.reply_text(f"{label}: {'✅ ON' if value else '❎ OFF'}")
 
 
 # ==================== PRO core ====================
@@ -138,8 +152,8 @@ async def trial_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     m = update.effective_message
     lang = _lang(update)
     u = update.effective_user
-    db = SessionLocal()
-    try:
+
+    def _tx(db):
         user = _ensure_user(db, u.id, u.username)
         now = now_aw()
 
@@ -147,17 +161,15 @@ async def trial_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         exp_user = ensure_aware(user.pro_expires_at)
         if user.is_pro and exp_user and exp_user > now:
             remain = exp_user - now
-            days = max(0, remain.days)
-            return await m.reply_text(t(lang, "pro_active", days=days))
+            return t(lang, "pro_active", days=max(0, remain.days))
 
         # Đang có TRIAL còn hạn
         trow = db.query(Trial).filter_by(user_id=u.id).one_or_none()
         if trow:
             t_exp = ensure_aware(trow.expires_at)
             if trow.active and t_exp and t_exp > now:
-                d = (t_exp - now).days
-                return await m.reply_text(t(lang, "trial_active", days=d))
-            return await m.reply_text(t(lang, "trial_end"))
+                return t(lang, "trial_active", days=(t_exp - now).days)
+            return t(lang, "trial_end")
 
         # Cấp TRIAL 7 ngày
         exp_new = now + timedelta(days=7)
@@ -165,9 +177,11 @@ async def trial_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user.is_pro = True
         user.pro_expires_at = exp_new
         db.commit()
-        return await m.reply_text(t(lang, "trial_started"))
-    finally:
-        db.close()
+        EXPIRY.schedule("user", u.id, exp_new)
+        EXPIRY.schedule("trial", u.id, exp_new)
+        ENTITLEMENTS.invalidate(u.id)
+        return t(lang, "trial_started")
+    return await m.reply_text(await run_db(_tx))
 
 
 async def redeem_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -177,13 +191,13 @@ async def redeem_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await m.reply_text(t(lang, "redeem_usage"), parse_mode=ParseMode.HTML)
 
     key = context.args[0].strip()
-    db = SessionLocal()
-    try:
+    u = update.effective_user
+
+    def _tx(db):
         lk = db.query(LicenseKey).filter_by(key=key).one_or_none()
         if not lk or lk.used:
-            return await m.reply_text(t(lang, "redeem_invalid"))
+            return None
 
-        u = update.effective_user
         user = _ensure_user(db, u.id, u.username)
 
         days = lk.days or 30
@@ -198,9 +212,14 @@ async def redeem_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         lk.used = True
         lk.issued_to = u.id  # BigInteger trong DB, lưu int ok
         db.commit()
-        await m.reply_text(t(lang, "redeem_ok").replace("{days}", str(days)))
-    finally:
-        db.close()
+        EXPIRY.schedule("user", u.id, user.pro_expires_at)
+        EXPIRY.cancel("trial", u.id)
+        ENTITLEMENTS.invalidate(u.id)
+        return days
+    days = await run_db(_tx)
+    if days is None:
+        return await m.reply_text(t(lang, "redeem_invalid"))
+    await m.reply_text(t(lang, "redeem_ok").replace("{days}", str(days)))
 
 
 async def genkey_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE, owner_id: int = 0):
@@ -216,129 +235,107 @@ async def genkey_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE, owner_i
             return await m.reply_text(t(lang, "genkey_usage"), parse_mode=ParseMode.HTML)
 
     code = "PRO-" + secrets.token_urlsafe(12).upper()
-    db = SessionLocal()
-    try:
-        lk = LicenseKey(key=code, days=days)
-        db.add(lk)
+
+    def _tx(db):
+        db.add(LicenseKey(key=code, days=days))
         db.commit()
-        await m.reply_text(
-            t(lang, "genkey_created")
-            .replace("{days}", str(days))
-            .replace("{code}", f"<code>{code}</code>"),
-            parse_mode=ParseMode.HTML,
-            disable_web_page_preview=True,
-        )
-    finally:
-        db.close()
+    await run_db(_tx)
+    await m.reply_text(
+        t(lang, "genkey_created")
+        .replace("{days}", str(days))
+        .replace("{code}", f"<code>{code}</code>"),
+        parse_mode=ParseMode.HTML,
+        disable_web_page_preview=True,
+    )
 
 
 # ---------- AUTOBAN (per-group) ----------
 async def autoban_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
     m = update.effective_message
-    db = SessionLocal()
-    try:
-        # quyền admin
-        if not await _admin_only(update, context):
-            return await m.reply_text("Chỉ admin.")
-        # gói PRO
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(_lang(update), "need_pro"))
-
-        cfg = get_or_create_autoban(db, update.effective_chat.id)
-        cfg.enabled = True
-        db.commit()
-        await m.reply_text("AutoBan: ✅ ON")
-    finally:
-        db.close()
+    # quyền admin
+    if not await _admin_only(update, context):
+        return await m.reply_text("Chỉ admin.")
+    # gói PRO
+    if not await _pro_ok(update):
+        return await m.reply_text(t(_lang(update), "need_pro"))
+
+    await run_db(set_autoban, update.effective_chat.id, enabled=True)
+    await m.reply_text("AutoBan: ✅ ON")
 
 
 async def autoban_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
     m = update.effective_message
-    db = SessionLocal()
-    try:
-        if not await _admin_only(update, context):
-            return await m.reply_text("Chỉ admin.")
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(_lang(update), "need_pro"))
+    if not await _admin_only(update, context):
+        return await m.reply_text("Chỉ admin.")
+    if not await _pro_ok(update):
+        return await m.reply_text(t(_lang(update), "need_pro"))
 
-        cfg = get_or_create_autoban(db, update.effective_chat.id)
-        cfg.enabled = False
-        db.commit()
-        await m.reply_text("AutoBan: ❎ OFF")
-    finally:
-        db.close()
+    await run_db(set_autoban, update.effective_chat.id, enabled=False)
+    await m.reply_text("AutoBan: ❎ OFF")
 
 
 async def autoban_set(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await _admin_only(update, context):
         return await update.effective_message.reply_text("Chỉ admin.")
-    db = SessionLocal()
-    try:
-        # gói PRO
-        if not _has_active_pro(db, update.effective_user.id):
-            return await update.effective_message.reply_text(t(_lang(update), "need_pro"))
+    # gói PRO
+    if not await _pro_ok(update):
+        return await update.effective_message.reply_text(t(_lang(update), "need_pro"))
 
-        if len(context.args) < 3:
-            return await update.effective_message.reply_text(
-                "Cú pháp: /autoban_set <cảnh cáo→mute> <cảnh cáo→ban> <phút mute>"
-            )
-        w = max(1, int(context.args[0]))
-        b = max(w + 1, int(context.args[1]))
-        m = max(1, int(context.args[2]))
-        cfg = get_or_create_autoban(db, update.effective_chat.id)
-        cfg.warn_threshold, cfg.ban_threshold, cfg.mute_minutes = w, b, m
-        db.commit()
-        await update.effective_message.reply_text(
-            f"Đã đặt: warn→mute={w}, warn→ban={b}, mute={m} phút."
+    if len(context.args) < 3:
+        return await update.effective_message.reply_text(
+            "Cú pháp: /autoban_set <cảnh cáo→mute> <cảnh cáo→ban> <phút mute>"
         )
-    finally:
-        db.close()
+    w = max(1, int(context.args[0]))
+    b = max(w + 1, int(context.args[1]))
+    m = max(1, int(context.args[2]))
+    await run_db(set_autoban, update.effective_chat.id,
+                 warn_threshold=w, ban_threshold=b, mute_minutes=m)
+    await update.effective_message.reply_text(
+        f"Đã đặt: warn→mute={w}, warn→ban={b}, mute={m} phút."
+    )
 
 
 async def autoban_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     m = update.effective_message
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(_lang(update), "need_pro"))
-
-        cfg = get_or_create_autoban(db, update.effective_chat.id)
-        await m.reply_text(
-            f"AutoBan: {'✅' if cfg.enabled else '❎'} | "
-            f"warn→mute={cfg.warn_threshold} | warn→ban={cfg.ban_threshold} | "
-            f"mute={cfg.mute_minutes} phút"
-        )
-    finally:
-        db.close()
+    if not await _pro_ok(update):
+        return await m.reply_text(t(_lang(update), "need_pro"))
+
+    cfg = await run_db(get_autoban, update.effective_chat.id)
+    await m.reply_text(
+        f"AutoBan: {'✅' if cfg.enabled else '❎'} | "
+        f"warn→mute={cfg.warn_threshold} | warn→ban={cfg.ban_threshold} | "
+        f"mute={cfg.mute_minutes} phút"
+    )
 
 
 # ---------- LOG VI PHẠM ----------
+def _summary(db, chat_id: int, y: int, m: int):
+    flush_violations()
+    return violations_summary(db, chat_id, y, m)
+
+
 async def log_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # chỉ admin + PRO
     if not await _admin_only(update, context):
         return await update.effective_message.reply_text("Chỉ admin.")
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await update.effective_message.reply_text(t(_lang(update), "need_pro"))
-
-        now = now_utc()
-        y, m = now.year, now.month
-        by_rule, top_users = violations_summary(db, update.effective_chat.id, y, m)
-        if not by_rule and not top_users:
-            return await update.effective_message.reply_text("Tháng này chưa có log.")
-        lines = ["📊 Log vi phạm trong tháng (tạm tính):"]
-        if by_rule:
-            lines.append("• Theo loại:")
-            for r, c in by_rule:
-                lines.append(f"  - {r}: {c}")
-        if top_users:
-            lines.append("• Top 5 user:")
-            for i, (uid, c) in enumerate(top_users[:5], 1):
-                lines.append(f"  {i}. user {uid}: {c} lần")
-        await update.effective_message.reply_text("\n".join(lines))
-    finally:
-        db.close()
+    if not await _pro_ok(update):
+        return await update.effective_message.reply_text(t(_lang(update), "need_pro"))
+
+    now = now_utc()
+    y, m = now.year, now.month
+    by_rule, top_users = await run_db(_summary, update.effective_chat.id, y, m)
+    if not by_rule and not top_users:
+        return await update.effective_message.reply_text("Tháng này chưa có log.")
+    lines = ["📊 Log vi phạm trong tháng (tạm tính):"]
+    if by_rule:
+        lines.append("• Theo loại:")
+        for r, c in by_rule:
+            lines.append(f"  - {r}: {c}")
+    if top_users:
+        lines.append("• Top 5 user:")
+        for i, (uid, c) in enumerate(top_users[:5], 1):
+            lines.append(f"  {i}. user {uid}: {c} lần")
+    await update.effective_message.reply_text("\n".join(lines))
 
 
 async def log_month(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -350,24 +347,20 @@ async def log_month(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
         return await update.effective_message.reply_text("Dùng: /log_month YYYY-MM (ví dụ 2025-11)")
     y, m = map(int, context.args[0].split("-"))
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await update.effective_message.reply_text(t(_lang(update), "need_pro"))
-
-        by_rule, top_users = violations_summary(db, update.effective_chat.id, y, m)
-        lines = [f"📅 Tháng {y}-{m:02d}:"]
-        if by_rule:
-            lines.append("• Theo loại:")
-            for r, c in by_rule:
-                lines.append(f"  - {r}: {c}")
-        if top_users:
-            lines.append("• Top 10 user:")
-            for i, (uid, c) in enumerate(top_users, 1):
-                lines.append(f"  {i}. user {uid}: {c} lần")
-        await update.effective_message.reply_text("\n".join(lines))
-    finally:
-        db.close()
+    if not await _pro_ok(update):
+        return await update.effective_message.reply_text(t(_lang(update), "need_pro"))
+
+    by_rule, top_users = await run_db(_summary, update.effective_chat.id, y, m)
+    lines = [f"📅 Tháng {y}-{m:02d}:"]
+    if by_rule:
+        lines.append("• Theo loại:")
+        for r, c in by_rule:
+            lines.append(f"  - {r}: {c}")
+    if top_users:
+        lines.append("• Top 10 user:")
+        for i, (uid, c) in enumerate(top_users, 1):
+            lines.append(f"  {i}. user {uid}: {c} lần")
+    await update.effective_message.reply_text("\n".join(lines))
 
 
 async def log_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -382,17 +375,19 @@ async def log_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     from sqlalchemy import and_
     from core.models import ViolationLog, month_range
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await update.effective_message.reply_text(t(_lang(update), "need_pro"))
+    if not await _pro_ok(update):
+        return await update.effective_message.reply_text(t(_lang(update), "need_pro"))
+
+    chat_id = update.effective_chat.id
 
+    def _tx(db):
+        flush_violations()
         s, e = month_range(y, m)
-        rows = (
+        return (
             db.query(ViolationLog)
             .filter(
                 and_(
-                    ViolationLog.chat_id == update.effective_chat.id,
+                    ViolationLog.chat_id == chat_id,
                     ViolationLog.created_at >= s,
                     ViolationLog.created_at < e,
                 )
@@ -400,27 +395,26 @@ async def log_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
             .order_by(ViolationLog.created_at.asc())
             .all()
         )
-        if not rows:
-            return await update.effective_message.reply_text("Không có dữ liệu.")
-
-        # build CSV text
-        text_buf = StringIO()
-        text_buf.write("created_at,user_id,rule,snippet\n")
-        for r in rows:
-            sn = (r.snippet or "").replace("\n", " ").replace(",", " ")
-            text_buf.write(f"{r.created_at.isoformat()},{r.user_id},{r.rule},{sn}\n")
-
-        # encode to bytes & send via BytesIO
-        csv_bytes = text_buf.getvalue().encode("utf-8")
-        byte_buf = BytesIO(csv_bytes)
-        byte_buf.seek(0)
-
-        await update.effective_message.reply_document(
-            document=InputFile(byte_buf, filename=f"violations_{y}-{m:02d}.csv"),
-            caption=f"Log vi phạm {y}-{m:02d}",
-        )
-    finally:
-        db.close()
+    rows = await run_db(_tx)
+    if not rows:
+        return await update.effective_message.reply_text("Không có dữ liệu.")
+
+    # build CSV text
+    text_buf = StringIO()
+    text_buf.write("created_at,user_id,rule,snippet\n")
+    for r in rows:
+        sn = (r.snippet or "").replace("\n", " ").replace(",", " ")
+        text_buf.write(f"{r.created_at.isoformat()},{r.user_id},{r.rule},{sn}\n")
+
+    # encode to bytes & send via BytesIO
+    csv_bytes = text_buf.getvalue().encode("utf-8")
+    byte_buf = BytesIO(csv_bytes)
+    byte_buf.seek(0)
+
+    await update.effective_message.reply_document(
+        document=InputFile(byte_buf, filename=f"violations_{y}-{m:02d}.csv"),
+        caption=f"Log vi phạm {y}-{m:02d}",
+    )
 
 
 # ==================== Whitelist (PRO) ====================
@@ -429,40 +423,40 @@ async def wl_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
     lang = _lang(update)
     if not await _admin_only(update, context):
         return await m.reply_text("Chỉ admin mới dùng lệnh này. / Admin only.")
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(lang, "need_pro"))
+    if not await _pro_ok(update):
+        return await m.reply_text(t(lang, "need_pro"))
 
-        if not context.args:
-            return await m.reply_text("Cú pháp / Usage: /wl_del domain.com", parse_mode=ParseMode.HTML)
-        domain = (context.args[0] or "").lower().strip().strip("/")
+    if not context.args:
+        return await m.reply_text("Cú pháp / Usage: /wl_del domain.com", parse_mode=ParseMode.HTML)
+    chat_id = update.effective_chat.id
+    domain = to_host(context.args[0])
+    if domain not in (await aget_ruleset(chat_id)).whitelist:
+        return await m.reply_text(t(lang, "wl_not_found"))
 
-        it = db.query(Whitelist).filter_by(chat_id=update.effective_chat.id, domain=domain).one_or_none()
+    def _tx(db):
+        it = db.query(Whitelist).filter_by(chat_id=chat_id, domain=domain).one_or_none()
         if not it:
-            return await m.reply_text(t(lang, "wl_not_found"))
+            return False
         db.delete(it)
         db.commit()
-        await m.reply_text(t(lang, "wl_deleted").replace("{domain}", domain))
-    finally:
-        db.close()
+        invalidate_rules(chat_id)
+        return True
+    if not await run_db(_tx):
+        return await m.reply_text(t(lang, "wl_not_found"))
+    await m.reply_text(t(lang, "wl_deleted").replace("{domain}", domain))
 
 
 async def wl_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     m = update.effective_message
     lang = _lang(update)
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(lang, "need_pro"))
+    if not await _pro_ok(update):
+        return await m.reply_text(t(lang, "need_pro"))
 
-        items = db.query(Whitelist).filter_by(chat_id=update.effective_chat.id).all()
-        if not items:
-            return await m.reply_text(t(lang, "wl_empty"))
-        out = "\n".join(f"• {i.domain}" for i in items)
-        await m.reply_text(out, disable_web_page_preview=True)
-    finally:
-        db.close()
+    domains = (await aget_ruleset(update.effective_chat.id)).whitelist.domains()
+    if not domains:
+        return await m.reply_text(t(lang, "wl_empty"))
+    out = "\n".join(f"• {d}" for d in domains)
+    await m.reply_text(out, disable_web_page_preview=True)
 
 
 # ==================== Anti-spam toggle (FREE; gắn cờ trong Setting) ====================
@@ -475,26 +469,24 @@ async def antispam_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # ==================== Quảng cáo tự động (PRO) ====================
+def _promo_update(db, chat_id: int, defaults: dict, **fields) -> None:
+    s = upsert_config(db, PromoSetting, chat_id, defaults, **fields)
+    # dời lịch ngay: bật/tắt/đổi chu kỳ có hiệu lực từ tick kế tiếp
+    s.next_send_at = next_promo_due(s, now_utc())
+    db.commit()
+    PROMOS.schedule(chat_id, s.next_send_at)
+
+
 async def ad_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
     m = update.effective_message
     lang = _lang(update)
     if not await _admin_only(update, context):
         return await m.reply_text("Chỉ admin mới dùng lệnh này. / Admin only.")
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(lang, "need_pro"))
-
-        s = db.query(PromoSetting).filter_by(chat_id=update.effective_chat.id).one_or_none()
-        if not s:
-            s = PromoSetting(chat_id=update.effective_chat.id, is_enabled=True)
-            db.add(s)
-        else:
-            s.is_enabled = True
-        db.commit()
-        await m.reply_text(t(lang, "pro_on"))
-    finally:
-        db.close()
+    if not await _pro_ok(update):
+        return await m.reply_text(t(lang, "need_pro"))
+
+    await run_db(_promo_update, update.effective_chat.id, {}, is_enabled=True)
+    await m.reply_text(t(lang, "pro_on"))
 
 
 async def ad_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -502,21 +494,11 @@ async def ad_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
     lang = _lang(update)
     if not await _admin_only(update, context):
         return await m.reply_text("Chỉ admin mới dùng lệnh này. / Admin only.")
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(lang, "need_pro"))
-
-        s = db.query(PromoSetting).filter_by(chat_id=update.effective_chat.id).one_or_none()
-        if not s:
-            s = PromoSetting(chat_id=update.effective_chat.id, is_enabled=False)
-            db.add(s)
-        else:
-            s.is_enabled = False
-        db.commit()
-        await m.reply_text(t(lang, "pro_off"))
-    finally:
-        db.close()
+    if not await _pro_ok(update):
+        return await m.reply_text(t(lang, "need_pro"))
+
+    await run_db(_promo_update, update.effective_chat.id, {}, is_enabled=False)
+    await m.reply_text(t(lang, "pro_off"))
 
 
 async def ad_set(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -528,21 +510,11 @@ async def ad_set(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not text:
         return await m.reply_text("Cú pháp / Usage: /ad_set <nội dung | content>", parse_mode=ParseMode.HTML)
 
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(lang, "need_pro"))
-
-        s = db.query(PromoSetting).filter_by(chat_id=update.effective_chat.id).one_or_none()
-        if not s:
-            s = PromoSetting(chat_id=update.effective_chat.id, is_enabled=True, content=text)
-            db.add(s)
-        else:
-            s.content = text
-        db.commit()
-        await m.reply_text(t(lang, "ad_updated"))
-    finally:
-        db.close()
+    if not await _pro_ok(update):
+        return await m.reply_text(t(lang, "need_pro"))
+
+    await run_db(_promo_update, update.effective_chat.id, {"is_enabled": True}, content=text)
+    await m.reply_text(t(lang, "ad_updated"))
 
 
 async def ad_interval(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -557,22 +529,12 @@ async def ad_interval(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         return await m.reply_text("Giá trị không hợp lệ / Invalid value.")
 
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(lang, "need_pro"))
-
-        s = db.query(PromoSetting).filter_by(chat_id=update.effective_chat.id).one_or_none()
-        if not s:
-            s = PromoSetting(chat_id=update.effective_chat.id, is_enabled=True, interval_minutes=minutes)
-            db.add(s)
-        else:
-            s.interval_minutes = minutes
-        s.last_sent_at = None
-        db.commit()
-        await m.reply_text(t(lang, "ad_interval_set").replace("{minutes}", str(minutes)))
-    finally:
-        db.close()
+    if not await _pro_ok(update):
+        return await m.reply_text(t(lang, "need_pro"))
+
+    await run_db(_promo_update, update.effective_chat.id, {"is_enabled": True},
+                 interval_minutes=minutes, last_sent_at=None)
+    await m.reply_text(t(lang, "ad_interval_set").replace("{minutes}", str(minutes)))
 
 
 def _fmt_ts(dt):
@@ -589,26 +551,22 @@ async def ad_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     lang = _lang(update)
     if not await _admin_only(update, context):
         return await m.reply_text("Chỉ admin mới dùng lệnh này. / Admin only.")
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(lang, "need_pro"))
+    if not await _pro_ok(update):
+        return await m.reply_text(t(lang, "need_pro"))
 
-        chat_id = update.effective_chat.id
-        s = db.query(PromoSetting).filter_by(chat_id=chat_id).one_or_none()
-        if not s:
-            return await m.reply_text(t(lang, "wl_empty"))
-
-        msg = (
-            f"📊 <b>{t(lang, 'ad_status_title')}</b>\n"
-            f"• {t(lang,'ad_status_enabled')}: {'✅' if s.is_enabled else '❎'}\n"
-            f"• {t(lang,'ad_status_interval')}: {s.interval_minutes} phút\n"
-            f"• {t(lang,'ad_status_content')}: {('OK' if (s.content or '').strip() else '—')}\n"
-            f"• {t(lang,'ad_status_last')}: {_fmt_ts(s.last_sent_at)}"
-        )
-        await m.reply_text(msg, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
-    finally:
-        db.close()
+    chat_id = update.effective_chat.id
+    s = await run_db(lambda db: db.query(PromoSetting).filter_by(chat_id=chat_id).one_or_none())
+    if not s:
+        return await m.reply_text(t(lang, "wl_empty"))
+
+    msg = (
+        f"📊 <b>{t(lang, 'ad_status_title')}</b>\n"
+        f"• {t(lang,'ad_status_enabled')}: {'✅' if s.is_enabled else '❎'}\n"
+        f"• {t(lang,'ad_status_interval')}: {s.interval_minutes} phút\n"
+        f"• {t(lang,'ad_status_content')}: {('OK' if (s.content or '').strip() else '—')}\n"
+        f"• {t(lang,'ad_status_last')}: {_fmt_ts(s.last_sent_at)}"
+    )
+    await m.reply_text(msg, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
 
 
 # ==================== CLEAR PERSONAL CACHE (FREE) ====================
@@ -645,42 +603,22 @@ async def support_on(update: Update, context: ContextTypes.DEFAULT_TYPE):
     m = update.effective_message
     if not await _admin_only(update, context):
         return await m.reply_text("Chỉ admin mới dùng lệnh này.")
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(_lang(update), "need_pro"))
-
-        s = db.query(SupportSetting).filter_by(chat_id=update.effective_chat.id).one_or_none()
-        if not s:
-            s = SupportSetting(chat_id=update.effective_chat.id, is_enabled=True)
-            db.add(s)
-        else:
-            s.is_enabled = True
-        db.commit()
-        await m.reply_text("support_on ✅ (người trong danh sách hỗ trợ được gửi link)")
-    finally:
-        db.close()
+    if not await _pro_ok(update):
+        return await m.reply_text(t(_lang(update), "need_pro"))
+
+    await run_db(set_support, update.effective_chat.id, True)
+    await m.reply_text("support_on ✅ (người trong danh sách hỗ trợ được gửi link)")
 
 
 async def support_off(update: Update, context: ContextTypes.DEFAULT_TYPE):
     m = update.effective_message
     if not await _admin_only(update, context):
         return await m.reply_text("Chỉ admin mới dùng lệnh này.")
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(_lang(update), "need_pro"))
-
-        s = db.query(SupportSetting).filter_by(chat_id=update.effective_chat.id).one_or_none()
-        if not s:
-            s = SupportSetting(chat_id=update.effective_chat.id, is_enabled=False)
-            db.add(s)
-        else:
-            s.is_enabled = False
-        db.commit()
-        await m.reply_text("support_off ❎ (mọi link kiểm tra như thường)")
-    finally:
-        db.close()
+    if not await _pro_ok(update):
+        return await m.reply_text(t(_lang(update), "need_pro"))
+
+    await run_db(set_support, update.effective_chat.id, False)
+    await m.reply_text("support_off ❎ (mọi link kiểm tra như thường)")
 
 
 async def support_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -698,24 +636,27 @@ async def support_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not target_id:
         return await m.reply_text("Vui lòng reply vào người cần thêm rồi gõ /support_add")
 
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(_lang(update), "need_pro"))
-
-        if not get_support_enabled(db, update.effective_chat.id):
-            return await m.reply_text("Hãy bật trước bằng /support_on")
-        ex = db.query(Supporter).filter_by(chat_id=update.effective_chat.id, user_id=target_id).one_or_none()
-        if ex:
-            return await m.reply_text("Người này đã trong danh sách hỗ trợ.")
-        db.add(Supporter(chat_id=update.effective_chat.id, user_id=target_id))
+    if not await _pro_ok(update):
+        return await m.reply_text(t(_lang(update), "need_pro"))
+
+    chat_id = update.effective_chat.id
+
+    def _tx(db):
+        if not get_support_enabled(db, chat_id):
+            return "Hãy bật trước bằng /support_on"
+        if db.query(Supporter).filter_by(chat_id=chat_id, user_id=target_id).one_or_none():
+            return "Người này đã trong danh sách hỗ trợ."
+        db.add(Supporter(chat_id=chat_id, user_id=target_id))
         db.commit()
-        await m.reply_text(
-            f"Đã thêm người hỗ trợ: <a href='tg://user?id={target_id}'>user</a>",
-            parse_mode=ParseMode.HTML,
-        )
-    finally:
-        db.close()
+        invalidate_rules(chat_id)
+        return None
+    err = await run_db(_tx)
+    if err:
+        return await m.reply_text(err)
+    await m.reply_text(
+        f"Đã thêm người hỗ trợ: <a href='tg://user?id={target_id}'>user</a>",
+        parse_mode=ParseMode.HTML,
+    )
 
 
 async def support_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -727,37 +668,39 @@ async def support_del(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         return await m.reply_text("Vui lòng reply vào người cần xoá rồi gõ /support_del")
 
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(_lang(update), "need_pro"))
+    if not await _pro_ok(update):
+        return await m.reply_text(t(_lang(update), "need_pro"))
 
-        it = db.query(Supporter).filter_by(chat_id=update.effective_chat.id, user_id=target_id).one_or_none()
+    chat_id = update.effective_chat.id
+
+    def _tx(db):
+        it = db.query(Supporter).filter_by(chat_id=chat_id, user_id=target_id).one_or_none()
         if not it:
-            return await m.reply_text("Không tìm thấy trong danh sách hỗ trợ.")
+            return False
         db.delete(it)
         db.commit()
-        await m.reply_text("Đã xoá khỏi danh sách hỗ trợ.")
-    finally:
-        db.close()
+        invalidate_rules(chat_id)
+        return True
+    if not await run_db(_tx):
+        return await m.reply_text("Không tìm thấy trong danh sách hỗ trợ.")
+    await m.reply_text("Đã xoá khỏi danh sách hỗ trợ.")
 
 
 async def support_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     m = update.effective_message
-    db = SessionLocal()
-    try:
-        if not _has_active_pro(db, update.effective_user.id):
-            return await m.reply_text(t(_lang(update), "need_pro"))
-
-        uids = list_supporters(db, update.effective_chat.id)
-        if not get_support_enabled(db, update.effective_chat.id):
-            return await m.reply_text("Support mode: ❎\nDanh sách trống.")
-        if not uids:
-            return await m.reply_text("Support mode: ✅\nChưa có người hỗ trợ.")
-        out = ["Support mode: ✅"] + [f"• <a href='tg://user?id={x}'>user {x}</a>" for x in uids]
-        await m.reply_text("\n".join(out), parse_mode=ParseMode.HTML, disable_web_page_preview=True)
-    finally:
-        db.close()
+    if not await _pro_ok(update):
+        return await m.reply_text(t(_lang(update), "need_pro"))
+
+    chat_id = update.effective_chat.id
+    enabled, uids = await run_db(
+        lambda db: (get_support_enabled(db, chat_id), list_supporters(db, chat_id))
+    )
+    if not enabled:
+        return await m.reply_text("Support mode: ❎\nDanh sách trống.")
+    if not uids:
+        return await m.reply_text("Support mode: ✅\nChưa có người hỗ trợ.")
+    out = ["Support mode: ✅"] + [f"• <a href='tg://user?id={x}'>user {x}</a>" for x in uids]
+    await m.reply_text("\n".join(out), parse_mode=ParseMode.HTML, disable_web_page_preview=True)
 
 
 # ==================== Register vào Application ====================
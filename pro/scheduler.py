@@ -1,16 +1,45 @@
 # pro/scheduler.py
+import asyncio
+import heapq
+import os
+import threading
+import time
 from datetime import timedelta
-from pytz import utc
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy import select, update
 
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, RetryAfter
 
+from core.db import run_db, run_sync
+from core.ratelimit import SEND_LIMITER, retry_after_seconds
+from pro.entitlements import ENTITLEMENTS
 from core.models import (
     SessionLocal, User, Trial, now_utc,
-    PromoSetting,
+    PromoSetting, engine,
 )
 
+EXPIRE_CHUNK = int(os.getenv("EXPIRE_CHUNK", "1000"))
+EXPIRY_HORIZON = float(os.getenv("EXPIRY_HORIZON", "21600"))   # giây: chỉ nạp hạn trong 6h tới
+PROMO_HORIZON = float(os.getenv("PROMO_HORIZON", "3600"))       # giây: cửa sổ nạp lịch quảng cáo
+PROMO_CONCURRENCY = int(os.getenv("PROMO_CONCURRENCY", "8"))     # số tin QC gửi song song
+PROMO_MAX_RETRIES = int(os.getenv("PROMO_MAX_RETRIES", "3"))     # số lần thử lại khi bị 429
+PROMO_FAIL_BACKOFF = float(os.getenv("PROMO_FAIL_BACKOFF", "60"))      # giây chờ sau lần lỗi đầu, gấp đôi mỗi lần
+PROMO_MAX_BACKOFF = float(os.getenv("PROMO_MAX_BACKOFF", "21600"))     # trần thời gian chờ (6h)
+# lỗi BadRequest coi như nhóm không còn tồn tại (tắt QC thay vì thử lại mãi).
+# Thiếu quyền gửi (admin tạm mute bot…) chỉ là lỗi tạm → đi đường lùi dần.
+_PROMO_GONE = ("chat not found",)
+
+PROMO_STATS = {"ticks": 0, "sent": 0, "failed": 0, "disabled": 0, "last_tick": None}
+_PROMO_FAILS: dict[int, int] = {}     # chat_id -> số lần gửi lỗi liên tiếp
+
+# tiến độ lượt quét hết hạn gần nhất (đọc được khi đang chạy)
+EXPIRY_STATS = {
+    "runs": 0, "running": False, "chunks": 0,
+    "users": 0, "trials": 0,            # số đã hết hạn trong lượt hiện tại / gần nhất
+    "users_total": 0, "trials_total": 0,
+    "last_run_at": None, "last_duration": 0.0, "errors": 0,
+}
+
 # ==== Datetime helpers (NAIVE UTC) ====
 def to_naive_utc(dt):
     """
@@ -23,98 +52,462 @@ def to_naive_utc(dt):
 
 
 # ---------- JOB 1: Hết hạn PRO / TRIAL (APScheduler, sync) ----------
-def _expire_pro():
+def _expire_chunks(db, model, due, values: dict, chunk: int, stat=None, on_chunk=None, key=None) -> None:
+    """
+    UPDATE theo lô `chunk` dòng (dùng index (cờ, hạn)), commit từng lô.
+    `on_chunk(ids)` nhận cột `key` (mặc định model.id) của các dòng đã hết hạn
+    trong từng lô — bộ nhớ chỉ tối đa 1 lô.
+    """
+    key = model.id if key is None else key
+    pick = select(model.id).where(*due).limit(chunk)
+    returning = engine.dialect.update_returning
+    while True:
+        if returning:
+            stmt = (update(model).where(model.id.in_(pick.scalar_subquery()))
+                    .values(**values).returning(key))
+            ids = list(db.execute(stmt, execution_options={"synchronize_session": False}).scalars())
+        else:
+            # DB không hỗ trợ UPDATE … RETURNING: chọn trước rồi update đúng các dòng đó
+            rows = db.execute(select(model.id, key).where(*due).limit(chunk)).all()
+            ids = [r[1] for r in rows]
+            if rows:
+                db.execute(update(model).where(model.id.in_([r[0] for r in rows])).values(**values),
+                           execution_options={"synchronize_session": False})
+        db.commit()
+        if not ids:
+            return
+        if stat:
+            EXPIRY_STATS[stat] += len(ids)
+            EXPIRY_STATS["chunks"] += 1
+        if on_chunk:
+            on_chunk(ids)
+        if len(ids) < chunk:
+            return
+
+
+def _expire_pro(chunk: int = EXPIRE_CHUNK):
+    """Tắt PRO / TRIAL đã hết hạn bằng UPDATE hàng loạt; trả về (số user, số trial)."""
+    t0 = time.perf_counter()
+    EXPIRY_STATS.update(running=True, chunks=0, users=0, trials=0, last_run_at=now_utc())
     db = SessionLocal()
     try:
         now = now_utc()  # naive UTC
 
-        # Hết hạn PRO
-        for u in db.query(User).filter(User.is_pro == True).all():
-            exp = to_naive_utc(u.pro_expires_at)
-            if exp and exp <= now:
-                print(f"[SCHEDULER] Hết hạn PRO user_id={u.id}")
-                u.is_pro = False
-                u.pro_expires_at = None
-
-        # Hết hạn TRIAL
-        for t in db.query(Trial).filter(Trial.active == True).all():
-            exp = to_naive_utc(t.expires_at)
-            if exp and exp <= now:
-                print(f"[SCHEDULER] Hết hạn TRIAL user_id={t.user_id}")
-                t.active = False
+        # Hết hạn PRO (id của User chính là user_id)
+        _expire_chunks(
+            db, User, (User.is_pro == True, User.pro_expires_at <= now),
+            {"is_pro": False, "pro_expires_at": None}, chunk, "users",
+            on_chunk=lambda ids: ENTITLEMENTS.invalidate(*ids),
+        )
 
-        db.commit()
+        # Hết hạn TRIAL (RETURNING user_id → chỉ bỏ cache của đúng các user đó)
+        _expire_chunks(
+            db, Trial, (Trial.active == True, Trial.expires_at <= now),
+            {"active": False}, chunk, "trials",
+            on_chunk=lambda ids: ENTITLEMENTS.invalidate(*ids), key=Trial.user_id,
+        )
     except Exception as e:
+        db.rollback()
+        EXPIRY_STATS["errors"] += 1
         print("[SCHEDULER] Lỗi khi cập nhật hạn PRO/TRIAL:", e)
     finally:
         db.close()
+        EXPIRY_STATS["runs"] += 1
+        EXPIRY_STATS["users_total"] += EXPIRY_STATS["users"]
+        EXPIRY_STATS["trials_total"] += EXPIRY_STATS["trials"]
+        EXPIRY_STATS["last_duration"] = time.perf_counter() - t0
+        EXPIRY_STATS["running"] = False
+
+    if EXPIRY_STATS["users"] or EXPIRY_STATS["trials"]:
+        print(f"[SCHEDULER] Hết hạn PRO={EXPIRY_STATS['users']} TRIAL={EXPIRY_STATS['trials']} "
+              f"({EXPIRY_STATS['chunks']} lô, {EXPIRY_STATS['last_duration']:.2f}s)")
+    return EXPIRY_STATS["users"], EXPIRY_STATS["trials"]
+
+
+# ---------- Hẹn giờ hết hạn theo sự kiện ----------
+class ExpiryTimers:
+    """
+    Min-heap các hạn PRO / TRIAL sắp tới, chạy trên 1 thread riêng và "thức dậy"
+    đúng lúc hạn gần nhất tới, thay cho quét toàn bảng mỗi 30 phút.
+
+    - Chỉ nạp lười các hạn trong `horizon` giây tới (query theo index
+      (is_pro, pro_expires_at) / (active, expires_at)); hết cửa sổ thì nạp tiếp.
+    - trial_cmd / redeem_cmd / admin panel gọi `schedule` / `cancel` khi đổi hạn.
+    - Mục cũ trong heap không bị xoá ngay (lazy deletion): `_due` giữ hạn hiện
+      hành của mỗi key, mục pop ra không khớp thì bỏ qua. UPDATE lúc hết hạn vẫn
+      kèm điều kiện `<= now` nên gia hạn chen ngang cũng không bị ghi đè.
+    """
+
+    KINDS = ("user", "trial")
+
+    def __init__(self, horizon: float = EXPIRY_HORIZON, chunk: int = EXPIRE_CHUNK):
+        self.horizon = timedelta(seconds=horizon)
+        self.chunk = chunk
+        self._heap: list = []                 # (deadline, kind, user_id)
+        self._due: dict = {}                  # (kind, user_id) -> deadline hiện hành
+        self._cond = threading.Condition()
+        self._loaded_until = None             # đã nạp mọi hạn <= mốc này (naive UTC)
+        self._thread = None
+        self._stopping = False
+        self.stats = {"loads": 0, "loaded": 0, "scheduled": 0, "cancelled": 0,
+                      "fired": 0, "expired_users": 0, "expired_trials": 0, "errors": 0}
+
+    # ----- API cho handler / admin panel (thread-safe) -----
+    def schedule(self, kind: str, user_id: int, deadline) -> None:
+        deadline = to_naive_utc(deadline)
+        if deadline is None:
+            return self.cancel(kind, user_id)
+        key = (kind, int(user_id))
+        with self._cond:
+            self.stats["scheduled"] += 1
+            if self._loaded_until is not None and deadline > self._loaded_until:
+                # ngoài cửa sổ: lượt nạp sau sẽ đọc từ DB
+                self._due.pop(key, None)
+                return
+            self._due[key] = deadline
+            heapq.heappush(self._heap, (deadline, kind, key[1]))
+            self._cond.notify()
+
+    def cancel(self, kind: str, user_id: int) -> None:
+        with self._cond:
+            if self._due.pop((kind, int(user_id)), None) is not None:
+                self.stats["cancelled"] += 1
+
+    def pending(self) -> int:
+        return len(self._due)
+
+    # ----- vòng lặp -----
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="expiry", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        # bắt kịp phần đã hết hạn khi bot tắt (UPDATE theo lô), rồi mới chuyển sang hẹn giờ
+        _expire_pro(self.chunk)
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    now = now_utc()
+                    if self._loaded_until is None or now >= self._loaded_until:
+                        break                                   # cần nạp cửa sổ mới
+                    if self._heap and self._heap[0][0] <= now:
+                        break                                   # có hạn tới
+                    nxt = self._heap[0][0] if self._heap else self._loaded_until
+                    nxt = min(nxt, self._loaded_until)
+                    self._cond.wait(max(0.05, (nxt - now).total_seconds()))
+                need_load = self._loaded_until is None or now >= self._loaded_until
+                due = self._pop_due(now)
+            try:
+                if need_load:
+                    self._load(now)
+                if due:
+                    self._fire(due)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print("[expiry] lỗi:", e)
+                time.sleep(1)
+
+    def _pop_due(self, now) -> dict:
+        out = {"user": [], "trial": []}
+        while self._heap and self._heap[0][0] <= now:
+            deadline, kind, uid = heapq.heappop(self._heap)
+            if self._due.get((kind, uid)) == deadline:
+                del self._due[(kind, uid)]
+                out[kind].append(uid)
+        return out if (out["user"] or out["trial"]) else {}
+
+    def _load(self, now) -> None:
+        until = now + self.horizon
+        db = SessionLocal()
+        try:
+            users = db.execute(
+                select(User.id, User.pro_expires_at)
+                .where(User.is_pro == True, User.pro_expires_at <= until)
+            ).all()
+            trials = db.execute(
+                select(Trial.user_id, Trial.expires_at)
+                .where(Trial.active == True, Trial.expires_at <= until)
+            ).all()
+        finally:
+            db.close()
+        with self._cond:
+            for kind, rows in (("user", users), ("trial", trials)):
+                for uid, exp in rows:
+                    exp = to_naive_utc(exp)
+                    self._due[(kind, uid)] = exp
+                    heapq.heappush(self._heap, (exp, kind, uid))
+            self._loaded_until = until
+            self.stats["loads"] += 1
+            self.stats["loaded"] += len(users) + len(trials)
+
+    def _fire(self, due: dict) -> None:
+        now = now_utc()
+        db = SessionLocal()
+        try:
+            for i in range(0, len(due["user"]), self.chunk):
+                ids = due["user"][i:i + self.chunk]
+                _expire_chunks(
+                    db, User, (User.id.in_(ids), User.is_pro == True, User.pro_expires_at <= now),
+                    {"is_pro": False, "pro_expires_at": None}, self.chunk,
+                    on_chunk=lambda got: self._count("expired_users", got),
+                )
+            for i in range(0, len(due["trial"]), self.chunk):
+                ids = due["trial"][i:i + self.chunk]
+                _expire_chunks(
+                    db, Trial, (Trial.user_id.in_(ids), Trial.active == True, Trial.expires_at <= now),
+                    {"active": False}, self.chunk,
+                    on_chunk=lambda got: self._count("expired_trials", got),
+                )
+        finally:
+            db.close()
+            ENTITLEMENTS.invalidate(*due["user"], *due["trial"])
+        self.stats["fired"] += len(due["user"]) + len(due["trial"])
+
+    def _count(self, stat: str, ids) -> None:
+        self.stats[stat] += len(ids)
+        print(f"[expiry] {stat}: {len(ids)}")
+
+
+EXPIRY = ExpiryTimers()
 
 
 # ---------- JOB 2: Gửi quảng cáo tự động (PTB JobQueue, async) ----------
+def next_promo_due(ps: PromoSetting, now):
+    """Thời điểm gửi kế tiếp của 1 nhóm; None nếu không đủ điều kiện gửi."""
+    if not (ps.is_enabled and ps.content and ps.interval_minutes and ps.interval_minutes >= 10):
+        return None
+    last = to_naive_utc(ps.last_sent_at)
+    return now if last is None else last + timedelta(minutes=ps.interval_minutes)
+
+
+class PromoQueue:
+    """
+    Min-heap (next_send_at, chat_id) cho quảng cáo tự động.
+
+    Nạp lười theo cửa sổ `horizon` qua index promo_settings.next_send_at, nên
+    mỗi tick chỉ chạm tới nhóm thực sự đến hạn. ad_on / ad_off / ad_set /
+    ad_interval gọi `schedule` (chạy trên thread DB → có lock).
+    """
+
+    def __init__(self, horizon: float = PROMO_HORIZON):
+        self.horizon = timedelta(seconds=horizon)
+        self._heap: list = []
+        self._due: dict[int, object] = {}     # chat_id -> next_send_at hiện hành
+        self._lock = threading.Lock()
+        self._loaded_until = None
+        self.stats = {"loads": 0, "loaded": 0, "scheduled": 0, "popped": 0}
+
+    def schedule(self, chat_id: int, due) -> None:
+        due = to_naive_utc(due)
+        with self._lock:
+            self.stats["scheduled"] += 1
+            if due is None or (self._loaded_until is not None and due > self._loaded_until):
+                self._due.pop(chat_id, None)
+                return
+            self._due[chat_id] = due
+            heapq.heappush(self._heap, (due, chat_id))
+
+    def pending(self) -> int:
+        return len(self._due)
+
+    def pop_due(self, now) -> list[int]:
+        """Chat đã đến hạn (sync, có thể query DB → gọi qua run_sync)."""
+        if self._loaded_until is None or now >= self._loaded_until:
+            self._load(now)
+        out = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, chat_id = heapq.heappop(self._heap)
+                if self._due.get(chat_id) == due:
+                    del self._due[chat_id]
+                    out.append(chat_id)
+        self.stats["popped"] += len(out)
+        return out
+
+    def _load(self, now) -> None:
+        until = now + self.horizon
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(PromoSetting.chat_id, PromoSetting.next_send_at)
+                .where(PromoSetting.next_send_at <= until)
+            ).all()
+        finally:
+            db.close()
+        with self._lock:
+            for chat_id, due in rows:
+                due = to_naive_utc(due)
+                self._due[chat_id] = due
+                heapq.heappush(self._heap, (due, chat_id))
+            self._loaded_until = until
+            self.stats["loads"] += 1
+            self.stats["loaded"] += len(rows)
+
+
+PROMOS = PromoQueue()
+
+
+def _load_due_promos(db, chat_ids: list[int], now) -> list[tuple[int, str]]:
+    # kiểm tra lại trên DB: nhóm có thể vừa bị tắt / dời lịch sau khi vào heap
+    rows = db.query(PromoSetting).filter(PromoSetting.chat_id.in_(chat_ids)).all()
+    out = []
+    for ps in rows:
+        due = next_promo_due(ps, now)
+        nsa = to_naive_utc(ps.next_send_at)
+        if due is not None and due <= now and nsa is not None and nsa <= now:
+            out.append((ps.chat_id, ps.content))
+        elif nsa is not None:
+            PROMOS.schedule(ps.chat_id, nsa)
+    return out
+
+
+def _mark_promos_sent(db, chat_ids: list[int], now) -> list:
+    """Ghi last_sent_at / next_send_at cho cả lô trong 1 transaction."""
+    rows = db.query(PromoSetting).filter(PromoSetting.chat_id.in_(chat_ids)).all()
+    for ps in rows:
+        ps.last_sent_at = now
+        ps.next_send_at = next_promo_due(ps, now)
+    db.commit()
+    return [(ps.chat_id, ps.next_send_at) for ps in rows]
+
+
+def _disable_promos(db, chat_ids: list[int]) -> None:
+    """Tắt QC của các nhóm bot không còn gửi được (bị kick, nhóm bị xoá…)."""
+    db.execute(update(PromoSetting).where(PromoSetting.chat_id.in_(chat_ids))
+               .values(is_enabled=False, next_send_at=None),
+               execution_options={"synchronize_session": False})
+    db.commit()
+
+
+def _defer_promos(db, due: dict[int, object]) -> None:
+    """Ghi next_send_at đã lùi của các nhóm gửi lỗi → lần nạp sau / sau restart vẫn giữ."""
+    rows = db.query(PromoSetting).filter(PromoSetting.chat_id.in_(list(due))).all()
+    for ps in rows:
+        ps.next_send_at = due[ps.chat_id]
+    db.commit()
+
+
+def _fail_delay(chat_id: int) -> float:
+    """Lùi theo cấp số nhân cho nhóm gửi lỗi liên tiếp: 60s, 120s, 240s… tối đa PROMO_MAX_BACKOFF."""
+    n = _PROMO_FAILS.get(chat_id, 0) + 1
+    _PROMO_FAILS[chat_id] = n
+    return min(PROMO_MAX_BACKOFF, PROMO_FAIL_BACKOFF * 2 ** min(n - 1, 30))
+
+
+async def _send_promo(bot, chat_id: int, content: str, tick: dict) -> str:
+    """Trả về "sent" | "failed" (thử lại sau) | "gone" (tắt QC của nhóm)."""
+    for attempt in range(PROMO_MAX_RETRIES + 1):
+        await SEND_LIMITER.wait(chat_id)
+        try:
+            await bot.send_message(
+                chat_id,
+                content,
+                parse_mode=ParseMode.HTML,
+                disable_web_page_preview=True,
+            )
+            return "sent"
+        except RetryAfter as e:
+            # 429: chỉ lùi lượt gửi của nhóm này, lần sau chờ lâu hơn
+            delay = retry_after_seconds(e) * (attempt + 1)
+            SEND_LIMITER.backoff(delay, chat_id)
+            tick["retried"] += 1
+        except Forbidden as e:
+            print(f"[promo_tick] tắt QC chat_id={chat_id}: {e}")
+            return "gone"
+        except BadRequest as e:
+            if any(k in str(e).lower() for k in _PROMO_GONE):
+                print(f"[promo_tick] tắt QC chat_id={chat_id}: {e}")
+                return "gone"
+            print(f"[promo_tick] send fail chat_id={chat_id}: {e}")
+            return "failed"
+        except Exception as e:
+            print(f"[promo_tick] send fail chat_id={chat_id}: {e}")
+            return "failed"
+    print(f"[promo_tick] bỏ qua chat_id={chat_id} sau {PROMO_MAX_RETRIES} lần 429")
+    return "failed"
+
+
 async def _promo_tick_job(context):
     """
-    Chạy mỗi 60 giây bởi PTB JobQueue. Gửi QC cho các group đủ điều kiện.
+    Chạy mỗi 60 giây bởi PTB JobQueue. Chỉ gửi QC cho các group đã đến hạn (lấy từ heap),
+    song song tối đa PROMO_CONCURRENCY tin, qua SEND_LIMITER (~30 tin/s, giới hạn từng nhóm).
     """
-    db = SessionLocal()
-    sent = 0
+    now = now_utc()  # naive UTC
+    t0 = time.perf_counter()
+    tick = {"due": 0, "sent": 0, "failed": 0, "retried": 0, "duration": 0.0}
     try:
-        now = now_utc()  # naive UTC
-        items = db.query(PromoSetting).filter(PromoSetting.is_enabled == True).all()
-        for ps in items:
-            # Điều kiện cơ bản
-            if not (ps.content and ps.interval_minutes and ps.interval_minutes >= 10):
-                continue
+        chat_ids = await run_sync(PROMOS.pop_due, now)
+        if not chat_ids:
+            return
+        items = await run_db(_load_due_promos, chat_ids, now)
+        tick["due"] = len(items)
+        sem = asyncio.Semaphore(PROMO_CONCURRENCY)
 
-            last = to_naive_utc(ps.last_sent_at)
-            should_send = (last is None) or ((now - last) >= timedelta(minutes=ps.interval_minutes))
-            if not should_send:
-                continue
+        async def _one(chat_id: int, content: str) -> bool:
+            async with sem:
+                return await _send_promo(context.bot, chat_id, content, tick)
 
-            try:
-                await context.bot.send_message(
-                    ps.chat_id,
-                    ps.content,
-                    parse_mode=ParseMode.HTML,
-                    disable_web_page_preview=True,
-                )
-                ps.last_sent_at = now
-                db.commit()
-                sent += 1
-                print(f"[promo_tick] sent -> chat_id={ps.chat_id}")
-            except Exception as e:
-                # Không dừng các nhóm khác nếu một nhóm lỗi
-                print(f"[promo_tick] send fail chat_id={ps.chat_id}: {e}")
-                db.rollback()
+        results = await asyncio.gather(*(_one(c, txt) for c, txt in items))
+        sent_ids, gone_ids, deferred = [], [], {}
+        for (chat_id, _), res in zip(items, results):
+            if res == "sent":
+                sent_ids.append(chat_id)
+                _PROMO_FAILS.pop(chat_id, None)
+            elif res == "gone":
+                gone_ids.append(chat_id)
+                _PROMO_FAILS.pop(chat_id, None)
+            else:
+                # Không dừng các nhóm khác nếu một nhóm lỗi; thử lại sau, lùi dần
+                deferred[chat_id] = now + timedelta(seconds=_fail_delay(chat_id))
+        if sent_ids:
+            for chat_id, nxt in await run_db(_mark_promos_sent, sent_ids, now):
+                PROMOS.schedule(chat_id, nxt)
+        if deferred:
+            await run_db(_defer_promos, deferred)
+            for chat_id, nxt in deferred.items():
+                PROMOS.schedule(chat_id, nxt)
+        if gone_ids:
+            await run_db(_disable_promos, gone_ids)
+            for chat_id in gone_ids:
+                PROMOS.schedule(chat_id, None)
+            PROMO_STATS["disabled"] += len(gone_ids)
+        tick["sent"] = len(sent_ids)
+        tick["failed"] = len(items) - len(sent_ids)
     except Exception as e:
         print("[promo_tick] error:", e)
     finally:
-        db.close()
-
-    if sent:
-        print(f"[promo_tick] done, sent={sent}")
+        tick["duration"] = time.perf_counter() - t0
+        if tick["due"]:
+            PROMO_STATS["ticks"] += 1
+            PROMO_STATS["sent"] += tick["sent"]
+            PROMO_STATS["failed"] += tick["failed"]
+            PROMO_STATS["last_tick"] = tick
+            print(f"[promo_tick] due={tick['due']} sent={tick['sent']} failed={tick['failed']} "
+                  f"retried={tick['retried']} in {tick['duration']:.2f}s")
 
 
 # ---------- Public API ----------
 def attach_scheduler(app):
     """
     Gắn 2 loại lịch:
-      • APScheduler (thread) cho các tác vụ không cần async: hết hạn PRO/TRIAL mỗi 30 phút
+      • Thread hẹn giờ (ExpiryTimers) cho hết hạn PRO/TRIAL: chạy đúng lúc từng hạn tới
+        (chỉ gắn vào bot_data; thread do start_scheduler bật khi bot thật khởi động)
       • PTB JobQueue (async) cho quảng cáo tự động: check mỗi 60 giây
     """
-    # 1) APScheduler cho hết hạn PRO / TRIAL
-    try:
-        sched = BackgroundScheduler(timezone=utc)
-        sched.add_job(
-            _expire_pro,
-            trigger=IntervalTrigger(minutes=30),
-            id="expire_pro",
-            replace_existing=True,
-        )
-        sched.start()
-        app.bot_data["scheduler"] = sched
-        print("✅ Scheduler: đã bật kiểm tra hạn PRO/TRIAL mỗi 30 phút")
-    except Exception as e:
-        print("❌ Lỗi attach APScheduler:", e)
+    # 1) Hẹn giờ hết hạn PRO / TRIAL
+    app.bot_data["expiry"] = EXPIRY
 
     # 2) PTB JobQueue cho quảng cáo tự động
     try:
@@ -128,3 +521,16 @@ def attach_scheduler(app):
         print("✅ JobQueue: promo_tick mỗi 60 giây")
     except Exception as e:
         print("❌ Lỗi attach JobQueue promo_tick:", e)
+
+
+def start_scheduler(app):
+    """
+    Bật thread hết hạn PRO/TRIAL. Gọi từ post_init của bot thật, không phải
+    từ build_app → pytest / bench dựng Application không chạy _expire_pro
+    trên DATABASE_URL đang đặt.
+    """
+    try:
+        EXPIRY.start()
+        print("✅ Scheduler: hẹn giờ hết hạn PRO/TRIAL theo từng user")
+    except Exception as e:
+        print("❌ Lỗi attach expiry timers:", e)
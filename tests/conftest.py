@@ -0,0 +1,35 @@
+# tests/conftest.py
+"""
+Cấu hình chung cho pytest: DB SQLite tạm cho cả phiên test.
+
+DATABASE_URL phải được đặt trước khi import core.models (engine tạo lúc
+import), và `main` phải được import trước các module core vì main tự nạp
+lại core.models.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_TMP = tempfile.mkdtemp(prefix="hotro-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP, 'test.db')}"
+os.environ.setdefault("OWNER_ID", "0")
+
+import main  # noqa: E402,F401
+import pytest  # noqa: E402
+
+from core.models import init_db  # noqa: E402
+
+init_db()
+
+
+@pytest.fixture
+def db():
+    from core.models import SessionLocal
+    s = SessionLocal()
+    try:
+        yield s
+    finally:
+        s.close()
@@ -0,0 +1,78 @@
+# tests/fakes.py
+"""Bot / Update / Context giả tối thiểu để gọi handler trực tiếp."""
+import asyncio
+import types
+
+
+class FakeBot:
+    """Ghi lại mọi lời gọi Bot API; method nào cũng trả về kết quả hợp lý."""
+
+    def __init__(self, admins=(), permissions=None):
+        self.calls = []
+        self.admins = set(admins)
+        self.permissions = permissions          # quyền mặc định trả về từ get_chat
+        self._mid = 1000
+
+    def called(self, name: str) -> list:
+        return [c for c in self.calls if c[0] == name]
+
+    def __getattr__(self, name):
+        async def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            if name == "get_chat_administrators":
+                return [types.SimpleNamespace(user=types.SimpleNamespace(id=u), status="administrator")
+                        for u in self.admins]
+            if name == "get_chat":
+                return types.SimpleNamespace(id=args[0], permissions=self.permissions)
+            if name == "send_message":
+                self._mid += 1
+                return types.SimpleNamespace(message_id=self._mid)
+            return True
+        return call
+
+
+class FakeJobQueue:
+    def __init__(self):
+        self.jobs = []
+
+    def run_once(self, callback, when, **kwargs):
+        self.jobs.append((callback, when, kwargs))
+
+
+class FakeMessage:
+    def __init__(self, text: str, chat_id: int, user_id: int, message_id: int = 1):
+        self.text, self.caption = text, None
+        self.chat_id, self.message_id = chat_id, message_id
+        self.chat = types.SimpleNamespace(id=chat_id, type="supergroup")
+        self.from_user = types.SimpleNamespace(id=user_id, is_bot=False, first_name="u")
+        self.entities = self.caption_entities = ()
+        self.forward_origin = None
+        self.photo = self.video = self.animation = self.sticker = None
+        self.document = self.voice = self.audio = None
+        self.deleted = False
+
+    async def delete(self):
+        self.deleted = True
+        return True
+
+    def parse_entities(self, types_=None):
+        return {}
+
+    def parse_caption_entities(self, types_=None):
+        return {}
+
+
+def make_update(msg: FakeMessage):
+    return types.SimpleNamespace(
+        effective_message=msg, message=msg,
+        effective_chat=types.SimpleNamespace(id=msg.chat_id, type="supergroup"),
+        effective_user=types.SimpleNamespace(id=msg.from_user.id, first_name="u", language_code="vi"),
+    )
+
+
+def make_context(bot: FakeBot, args=()):
+    jq = FakeJobQueue()
+    app = types.SimpleNamespace(bot=bot, bot_data={}, job_queue=jq,
+                                create_task=lambda coro: asyncio.ensure_future(coro))
+    return types.SimpleNamespace(bot=bot, args=list(args), application=app,
+                                 bot_data=app.bot_data, job_queue=jq)
@@ -0,0 +1,18 @@
+# tests/test_admins.py
+import asyncio
+
+from core.admins import AdminCache
+from fakes import FakeBot
+
+
+def test_cache_hit_keeps_busy_chat_from_eviction():
+    cache, bot = AdminCache(max_chats=2), FakeBot(admins={1})
+
+    async def run():
+        for chat in (-1, -2):
+            await cache.is_admin(bot, chat, 1)
+        await cache.is_admin(bot, -1, 1)        # -1 vừa được dùng → -2 là nhóm cũ nhất
+        await cache.is_admin(bot, -3, 1)
+    asyncio.run(run())
+    assert list(cache._chats) == [-1, -3]
+    assert len(bot.called("get_chat_administrators")) == 3
@@ -0,0 +1,9 @@
+# tests/test_app.py
+import main
+from pro.scheduler import EXPIRY
+
+
+def test_build_app_does_not_start_expiry_thread():
+    app = main.build_app("123:TEST")
+    assert app.bot_data["expiry"] is EXPIRY
+    assert EXPIRY._thread is None               # chỉ post_init của bot thật mới bật
@@ -0,0 +1,69 @@
+# tests/test_captcha.py
+import asyncio
+import types
+from datetime import timedelta
+
+from telegram import ChatPermissions
+
+from core import captcha
+from core.captcha import CaptchaEngine, _Batch
+from core.models import now_utc
+from fakes import FakeBot, make_context
+
+
+def test_heap_skips_superseded_deadlines():
+    eng = CaptchaEngine(timeout=60, window=0)
+    now = now_utc()
+    b1, b2 = _Batch(-1, 1, 2), _Batch(-1, 3, 4)
+    eng._track(-1, 10, now - timedelta(seconds=5), b1)
+    eng._track(-1, 11, now - timedelta(seconds=5), b1)
+    eng._track(-1, 10, now + timedelta(seconds=60), b2)   # vào lại → hạn mới, lô mới
+    assert eng._pop_due(now) == [(-1, 11)]
+    assert b1.left == 1 and b2.left == 1
+    assert eng._pop_due(now + timedelta(seconds=61)) == [(-1, 10)]
+
+
+def _tap(eng, bot, chat_id, uid, data, message=True):
+    answers = []
+
+    async def answer(text=None, **kw):
+        answers.append(text)
+    q = types.SimpleNamespace(
+        data=data, answer=answer,
+        message=types.SimpleNamespace(chat=types.SimpleNamespace(id=chat_id)) if message else None,
+        from_user=types.SimpleNamespace(id=uid, mention_html=lambda: f"u{uid}"),
+    )
+    ctx = make_context(bot)
+    asyncio.run(eng.on_button(types.SimpleNamespace(callback_query=q), ctx))
+    return answers[-1]
+
+
+def _engine_with(chat_id, uid):
+    eng = CaptchaEngine(timeout=60, window=0)
+    eng._loaded = True
+    batch = _Batch(chat_id, 2, 3)
+    eng._track(chat_id, uid, now_utc() + timedelta(seconds=60), batch)
+    return eng
+
+
+def test_wrong_tap_allows_retry_before_kick(monkeypatch):
+    monkeypatch.setattr(captcha, "CAPTCHA_MAX_TRIES", 2)
+    eng, bot = _engine_with(-501, 9), FakeBot()
+    assert "còn 1" in _tap(eng, bot, -501, 9, "cap:4")
+    assert not bot.called("ban_chat_member") and eng.pending() == 1
+    _tap(eng, bot, -501, 9, "cap:4")
+    assert bot.called("ban_chat_member") and eng.pending() == 0
+
+
+def test_pass_restores_chat_default_permissions():
+    defaults = ChatPermissions(can_send_messages=True, can_send_photos=False)
+    eng, bot = _engine_with(-502, 9), FakeBot(permissions=defaults)
+    _tap(eng, bot, -502, 9, "cap:5")
+    (_, args, _), = bot.called("restrict_chat_member")
+    assert args == (-502, 9, defaults)
+
+
+def test_inaccessible_callback_message_is_ignored():
+    eng, bot = _engine_with(-503, 9), FakeBot()
+    assert _tap(eng, bot, -503, 9, "cap:5", message=False)
+    assert eng.pending() == 1 and not bot.calls
@@ -0,0 +1,11 @@
+# tests/test_domains.py
+from core.domains import DomainTrie, to_host
+
+
+def test_domain_trie_allows_subdomains_only():
+    trie = DomainTrie(["example.com", "https://www.t.me/x"])
+    assert trie.allows("example.com") and trie.allows("a.b.example.com")
+    assert not trie.allows("badexample.com") and not trie.allows("com")
+    assert trie.allows("t.me")
+    assert "sub.example.com" not in trie and "example.com" in trie
+    assert to_host("HTTP://WWW.Example.com/path?q=1") == "example.com"
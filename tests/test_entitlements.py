@@ -0,0 +1,34 @@
+# tests/test_entitlements.py
+from datetime import timedelta
+
+from core.models import Trial, now_utc
+from pro.entitlements import ENTITLEMENTS, EntitlementCache
+from pro.scheduler import _expire_pro
+
+
+def test_put_after_invalidate_is_dropped():
+    c = EntitlementCache(clock=lambda: 1000.0)
+    gen = c.generation()
+    c.invalidate(7)                  # quyền đổi trong lúc query đang chạy
+    c.put(7, None, gen)
+    assert c.get(7) is None
+
+
+def test_negative_entry_expires():
+    now = [1000.0]
+    c = EntitlementCache(negative_ttl=60, clock=lambda: now[0])
+    c.put(7, None, c.generation())
+    assert c.get(7) is False
+    now[0] += 61
+    assert c.get(7) is None
+
+
+def test_trial_expiry_invalidates_only_that_user(db):
+    db.add(Trial(user_id=9001, expires_at=now_utc() - timedelta(minutes=1), active=True))
+    db.commit()
+    ENTITLEMENTS.clear()
+    ENTITLEMENTS.put(9001, None, ENTITLEMENTS.generation())
+    ENTITLEMENTS.put(9002, None, ENTITLEMENTS.generation())
+    _expire_pro()
+    assert ENTITLEMENTS.get(9001) is None
+    assert ENTITLEMENTS.get(9002) is False
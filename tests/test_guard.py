@@ -0,0 +1,90 @@
+# tests/test_guard.py
+import asyncio
+
+import main
+from core import raid
+from core.config_repo import set_setting
+from core.models import ViolationLog
+from core.raid import RaidDetector
+from fakes import FakeBot, FakeMessage, make_context, make_update
+
+
+def test_lockdown_starts_on_chat_with_every_toggle_off(db, monkeypatch):
+    chat, uid = -201, 42
+    set_setting(db, chat, antilink=False, antimention=False, antiforward=False,
+                antispam=False, flood_limit=100)
+    detector = RaidDetector()
+    monkeypatch.setattr(raid, "RAID", detector)
+    monkeypatch.setattr(main, "RAID", detector)
+    monkeypatch.setattr(raid, "RAID_NEW_MSGS", 3)
+    detector.on_join(chat, [uid])
+
+    bot = FakeBot()
+    ctx = make_context(bot)
+    msgs = [FakeMessage("hello", chat, uid, i) for i in (1, 2)]
+    msgs.append(FakeMessage("xem https://evil.example/x", chat, uid, 3))   # tin làm nhóm bị khoá
+
+    async def run():
+        for m in msgs:
+            await main.guard(make_update(m), ctx)
+    asyncio.run(run())
+
+    assert detector.locked(chat)
+    assert ctx.job_queue.jobs                   # đã hẹn job báo hết khoá
+    assert msgs[-1].deleted                     # khoá ép antilink → link bị xoá
+    assert not msgs[0].deleted
+
+
+def _spam_run(monkeypatch, chats, uid, admins=()):
+    from core.fingerprint import FingerprintIndex
+    index = FingerprintIndex(min_chats=len(chats))
+    monkeypatch.setattr(main, "SPAMPRINT", index)
+    monkeypatch.setattr(main, "RAID", RaidDetector())
+    text = "Nhận quà miễn phí ngay hôm nay, liên hệ admin để nhận thưởng lớn nhé các bạn ơi"
+    msgs = []
+    bot = FakeBot(admins)
+    ctx = make_context(bot)
+
+    async def run():
+        mid = 1
+        for chat in chats:
+            for _ in range(3):                    # mỗi nhóm 3 tin giống nhau
+                m = FakeMessage(text, chat, uid, mid)
+                mid += 1
+                msgs.append(m)
+                await main.guard(make_update(m), ctx)
+    asyncio.run(run())
+    return msgs
+
+
+def _quiet_chat(db, chat, **fields):
+    set_setting(db, chat, antilink=False, antimention=False, antiforward=False, flood_limit=100, **fields)
+
+
+def test_dupspam_logs_once_per_user_without_warning(db, monkeypatch):
+    chats, uid = (-211, -212), 77
+    for c in chats:
+        _quiet_chat(db, c, dupspam=True)
+    msgs = _spam_run(monkeypatch, chats, uid)
+    assert msgs[3].deleted                                  # tin làm cụm bị đánh dấu
+    main.VIOLATIONS.flush()
+    # nhóm đầu có 3 tin bị xoá nhưng chỉ 1 dòng log cho lượt xoá đó, và không tính cảnh cáo
+    logs = db.query(ViolationLog).filter_by(chat_id=chats[0], user_id=uid, rule="dupspam").count()
+    assert logs == 1
+    assert main.VIOLATIONS.warning_count(chats[0], uid) == 0
+
+
+def test_dupspam_is_opt_in(db, monkeypatch):
+    chats, uid = (-221, -222), 78
+    for c in chats:
+        _quiet_chat(db, c)                                  # antispam mặc định bật, dupspam thì không
+    msgs = _spam_run(monkeypatch, chats, uid)
+    assert not any(m.deleted for m in msgs)
+
+
+def test_dupspam_skips_admins(db, monkeypatch):
+    chats, uid = (-231, -232), 79
+    for c in chats:
+        _quiet_chat(db, c, dupspam=True)
+    msgs = _spam_run(monkeypatch, chats, uid, admins={uid})
+    assert not any(m.deleted for m in msgs)
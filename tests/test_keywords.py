@@ -0,0 +1,23 @@
+# tests/test_keywords.py
+import random
+
+from core.keywords import SMALL_SET, KeywordMatcher
+
+
+def test_automaton_matches_naive_scan():
+    rnd = random.Random(1)
+    words = ["".join(rnd.choice("abcde") for _ in range(rnd.randint(3, 6))) for _ in range(SMALL_SET * 2)]
+    patterns = list(enumerate(words, 1))
+    big = KeywordMatcher(patterns)
+    assert big._goto                                # đủ nhiều từ khoá → dùng automaton
+    for _ in range(200):
+        text = "".join(rnd.choice("abcdexyz ") for _ in range(40))
+        found = big.search(text)
+        naive = {p for _, p in patterns if p in text}
+        assert (found is None) == (not naive)
+        if found:
+            assert found[1] in naive
+
+
+def test_keyword_search_is_case_insensitive():
+    assert KeywordMatcher([(7, "Casino")]).search("CHƠI casino ĐI") == (7, "casino")
@@ -0,0 +1,96 @@
+# tests/test_promos.py
+import asyncio
+import time
+import types
+from datetime import timedelta
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from core.models import PromoSetting, now_utc
+from core.ratelimit import SEND_LIMITER
+from pro import scheduler
+from pro.scheduler import PROMOS, _PROMO_FAILS, _promo_tick_job
+
+
+class _Bot:
+    def __init__(self, errors: dict):
+        self.errors = errors
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kw):
+        err = self.errors.get(chat_id)
+        if err:
+            raise err
+        self.sent.append(chat_id)
+
+
+def _due_promo(db, chat_id):
+    db.add(PromoSetting(chat_id=chat_id, is_enabled=True, content="ad", interval_minutes=60,
+                        next_send_at=now_utc()))
+    db.commit()
+    PROMOS.schedule(chat_id, now_utc())
+
+
+def _make_due(db, chat_id):
+    # giả như đã đến hạn lần nữa
+    db.query(PromoSetting).filter_by(chat_id=chat_id).update({"next_send_at": now_utc()})
+    db.commit()
+    PROMOS.schedule(chat_id, now_utc())
+
+
+def _tick(bot):
+    asyncio.run(_promo_tick_job(types.SimpleNamespace(bot=bot)))
+
+
+def test_forbidden_disables_promo(db):
+    _due_promo(db, -301)
+    _tick(_Bot({-301: Forbidden("bot was kicked from the group chat")}))
+    db.expire_all()
+    ps = db.query(PromoSetting).filter_by(chat_id=-301).one()
+    assert (ps.is_enabled, ps.next_send_at) == (False, None)
+
+
+def test_missing_send_rights_backs_off_instead_of_disabling(db, monkeypatch):
+    monkeypatch.setattr(SEND_LIMITER, "chat_interval", 0.0)
+    _due_promo(db, -305)
+    _tick(_Bot({-305: BadRequest("Not enough rights to send text messages to the chat")}))
+    db.expire_all()
+    ps = db.query(PromoSetting).filter_by(chat_id=-305).one()
+    assert ps.is_enabled and ps.next_send_at > now_utc()
+    assert _PROMO_FAILS[-305] == 1
+
+
+def test_transient_failures_back_off_exponentially(db, monkeypatch):
+    monkeypatch.setattr(SEND_LIMITER, "chat_interval", 0.0)
+    _due_promo(db, -302)
+    bot = _Bot({-302: NetworkError("timeout")})
+    _tick(bot)
+    first = PROMOS._due[-302]
+    _make_due(db, -302)
+    _tick(bot)
+    second = PROMOS._due[-302]
+    assert _PROMO_FAILS[-302] == 2
+    assert (second - now_utc()).total_seconds() > (first - now_utc()).total_seconds() + 30
+    bot.errors.clear()
+    _make_due(db, -302)
+    _tick(bot)
+    assert bot.sent == [-302] and -302 not in _PROMO_FAILS
+
+
+def test_retry_after_only_delays_that_chat(db, monkeypatch):
+    monkeypatch.setattr(scheduler, "PROMO_MAX_RETRIES", 0)
+    _due_promo(db, -303)
+    _tick(_Bot({-303: RetryAfter(120)}))
+    assert SEND_LIMITER._chats[-303] > time.monotonic() + 100
+    assert SEND_LIMITER._tat < time.monotonic() + 10
+
+
+def test_long_backoff_is_persisted_past_the_horizon(db, monkeypatch):
+    monkeypatch.setattr(SEND_LIMITER, "chat_interval", 0.0)
+    _due_promo(db, -304)
+    _PROMO_FAILS[-304] = 8                      # lần lỗi thứ 9 → chờ lâu hơn PROMO_HORIZON
+    _tick(_Bot({-304: NetworkError("timeout")}))
+    db.expire_all()
+    nsa = db.query(PromoSetting).filter_by(chat_id=-304).one().next_send_at
+    assert (nsa - now_utc()).total_seconds() > scheduler.PROMO_HORIZON
+    assert -304 not in PROMOS.pop_due(now_utc() + timedelta(hours=2))
@@ -0,0 +1,22 @@
+# tests/test_ratelimit.py
+from core.ratelimit import SendLimiter
+
+
+def _limiter(now):
+    return SendLimiter(global_rate=10, chat_interval=3, clock=lambda: now[0])
+
+
+def test_global_and_per_chat_spacing():
+    now = [100.0]
+    lim = _limiter(now)
+    assert lim.reserve(1) == 0
+    assert abs(lim.reserve(2) - 0.1) < 1e-9          # giới hạn chung 10 tin/giây
+    assert abs(lim.reserve(1) - 3.0) < 1e-9          # cùng nhóm: cách 3 giây
+
+
+def test_chat_backoff_does_not_delay_other_chats():
+    now = [100.0]
+    lim = _limiter(now)
+    lim.backoff(60, chat_id=1)
+    assert lim.reserve(1) >= 60
+    assert lim.reserve(2) < 1
@@ -0,0 +1,31 @@
+# tests/test_rules.py
+from core import rules
+from core.config_repo import set_setting
+
+
+def test_cached_ruleset_is_reused():
+    rules.clear_rules()
+    assert rules.get_ruleset(-101) is rules.get_ruleset(-101)
+
+
+def test_build_invalidated_midway_is_not_cached(monkeypatch):
+    rules.clear_rules()
+    real_build = rules.build_ruleset
+
+    def build_then_invalidate(db, chat_id):
+        rs = real_build(db, chat_id)
+        rules.invalidate_rules(chat_id)    # admin sửa luật trong lúc đang dựng
+        return rs
+    monkeypatch.setattr(rules, "build_ruleset", build_then_invalidate)
+    rules.get_ruleset(-102)
+    assert rules._cached(-102) is None
+
+
+def test_write_through_updates_cached_snapshot(db):
+    rules.clear_rules()
+    old = rules.get_ruleset(-103)
+    set_setting(db, -103, antilink=False, flood_limit=9)
+    new = rules.get_ruleset(-103)
+    assert new is not old
+    assert (new.antilink, new.flood_limit) == (False, 9)
+    assert old.antilink is True
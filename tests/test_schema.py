@@ -0,0 +1,71 @@
+# tests/test_schema.py
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from core import models
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+import explain_indexes  # noqa: E402
+
+
+@pytest.fixture
+def old_db(tmp_path, monkeypatch):
+    """DB kiểu cũ: blacklists / warnings chưa có unique index và đã có dòng trùng."""
+    eng = create_engine(f"sqlite:///{tmp_path / 'old.db'}", future=True)
+    with eng.begin() as conn:
+        conn.execute(text("CREATE TABLE blacklists (id INTEGER PRIMARY KEY, chat_id BIGINT, "
+                          "user_id BIGINT, created_at DATETIME)"))
+        conn.execute(text("INSERT INTO blacklists (chat_id, user_id) VALUES (1, 2), (1, 2), (1, 3)"))
+        conn.execute(text("CREATE TABLE warnings (id INTEGER PRIMARY KEY, chat_id BIGINT, "
+                          "user_id BIGINT, count INTEGER, last_warned DATETIME)"))
+        conn.execute(text("INSERT INTO warnings (chat_id, user_id, count) VALUES (1, 2, 1), (1, 2, 2), (1, 3, 1)"))
+    monkeypatch.setattr(models, "engine", eng)
+    monkeypatch.setattr(models, "SessionLocal", sessionmaker(bind=eng, expire_on_commit=False))
+    yield eng
+    eng.dispose()
+
+
+def test_upgrade_dedupes_and_runs_once(old_db, capsys):
+    models.init_db()
+    models.init_db()
+    out = capsys.readouterr().out
+    assert out.count(f"schema v{models.SCHEMA_VERSION}") == 1
+    with old_db.connect() as conn:
+        rows = conn.execute(text("SELECT chat_id, user_id FROM blacklists ORDER BY user_id")).all()
+        version = conn.execute(text("SELECT version FROM schema_version")).scalars().all()
+    assert [tuple(r) for r in rows] == [(1, 2), (1, 3)]
+    assert version == [models.SCHEMA_VERSION]
+    names = {i["name"] for i in inspect(old_db).get_indexes("blacklists")}
+    assert "uq_blacklists_chat_user" in names
+    with old_db.connect() as conn:
+        warns = conn.execute(text("SELECT user_id, count FROM warnings ORDER BY user_id")).all()
+    assert [tuple(r) for r in warns] == [(2, 3), (3, 1)]
+    assert "uq_warnings_chat_user" in {i["name"] for i in inspect(old_db).get_indexes("warnings")}
+
+
+def test_failed_upgrade_aborts_startup(old_db, monkeypatch):
+    def _broken(conn):
+        conn.execute(text("DELETE FROM blacklists"))
+        raise ValueError("boom")
+    monkeypatch.setattr(models, "_UPGRADES", [(1, "broken", _broken)])
+    with pytest.raises(RuntimeError):
+        models.init_db()
+    with old_db.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM blacklists")).scalar() == 3   # đã rollback
+    # unique index không được tạo trên bảng chưa gộp dòng trùng
+    assert "uq_blacklists_chat_user" not in {i["name"] for i in inspect(old_db).get_indexes("blacklists")}
+
+
+@pytest.mark.parametrize("name", [c[0] for c in explain_indexes._checks(None)])
+def test_hot_queries_use_indexes(db, name):
+    fn, args = {n: (f, a) for n, f, a in explain_indexes._checks(db)}[name]
+    plans = [(sql, explain_indexes._plan(sql, params))
+             for sql, params in explain_indexes._capture(fn, *args)
+             if sql.lstrip().upper().startswith(("SELECT", "DELETE", "UPDATE"))]
+    assert plans
+    for sql, plan in plans:
+        assert not explain_indexes._problems(sql, plan), plan
@@ -0,0 +1,57 @@
+# tests/test_violations.py
+from core import violations
+from core.models import Warning
+from core.violations import ViolationWriter
+
+
+def test_upsert_accumulates_across_writers(db):
+    a, b = ViolationWriter(), ViolationWriter()
+    assert a.record(-401, 1, "link") == 1
+    assert b.record(-401, 1, "link") == 1      # b chưa thấy phần của a (chưa flush)
+    a.flush()
+    b.flush()
+    row = db.query(Warning).filter_by(chat_id=-401, user_id=1).one()
+    assert row.count == 2
+    assert b.record(-401, 1, "link") == 3      # flush đồng bộ lại cache theo DB
+
+
+def test_failing_flush_drops_batch_after_max_retries(monkeypatch):
+    def boom(db, rows):
+        raise RuntimeError("no unique index")
+    monkeypatch.setattr(violations, "upsert_warnings", boom)
+    monkeypatch.setattr(violations, "VIOLATION_MAX_RETRIES", 3)
+    w = ViolationWriter()
+    w.record(-402, 1, "link")
+    for _ in range(2):
+        assert w.flush() == 0
+        assert w.pending() == 2            # còn trong hàng đợi để thử lại
+    w.flush()
+    assert w.pending() == 0
+    assert w.stats["dropped"] == 2 and w.stats["errors"] == 3
+
+
+def test_requeued_logs_are_capped(monkeypatch):
+    def boom(db, rows):
+        raise RuntimeError("db down")
+    monkeypatch.setattr(violations, "upsert_warnings", boom)
+    monkeypatch.setattr(violations, "VIOLATION_MAX_BUFFER", 10)
+    w = ViolationWriter(max_pending=1000)
+    for i in range(25):
+        w.record(-403, i % 2, "link")
+    w.flush()
+    assert len(w._logs) == 10
+
+
+def test_add_warning_survives_eviction_between_load_and_increment(monkeypatch):
+    w = ViolationWriter()
+    w.add_warning(-403, 1, 2)
+    w.flush()
+    real = w.warning_count
+
+    def racing(chat_id, user_id):
+        n = real(chat_id, user_id)
+        w._counts.pop((chat_id, user_id), None)     # _trim của thread khác chen vào giữa
+        return n
+    monkeypatch.setattr(w, "warning_count", racing)
+    assert w.add_warning(-403, 1) == 3
+    assert w.pending() == 1